@@ -1,33 +1,102 @@
 import os
-import shutil
+import re
+import sys
+import json
 import configparser
-from getpass import getuser
-from mimetypes import guess_type
+import importlib
+from contextlib import nullcontext
+from importlib.util import find_spec
 import argparse
 import logging as log
-import distutils.util as util
-import subprocess
-from urllib import request, parse
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from sys import platform
 
+# The helper modules live next to this file, import them relative when this is used as a package
+# The modules for the folder icons and watching are only imported when they are used, see lazy_import
 try:
-    from bs4 import BeautifulSoup
-    from PIL import Image
-    folder_icons_imports = True
-except ModuleNotFoundError:
-    folder_icons_imports = False
+    from . import dedupe, fileops, icons, journal, layout, locks, matcher, media, metrics, planner, profiles
+    from . import progress, release_parser, scanner, scheduler, show_index, space, verify
+except ImportError:
+    import dedupe
+    import fileops
+    import icons
+    import journal
+    import layout
+    import locks
+    import matcher
+    import media
+    import metrics
+    import planner
+    import profiles
+    import progress
+    import release_parser
+    import scanner
+    import scheduler
+    import show_index
+    import space
+    import verify
+
+# Only check if bs4 and Pillow are there, importing them takes longer than the rest of the script together
+folder_icons_imports = find_spec('bs4') is not None and find_spec('PIL') is not None
 
 CONFIG_NAME = 'SortConfig.ini'
+# Settings that are not given as arguments can be given as environment variables when the config gets created
+ENV_PREFIX = 'NYAASORT_'
+
+# What sort_files did with the files it was given
+# moved holds (src, dst) pairs, skipped the files that are not episodes or not in the anime directory and failed the
+# episodes that could not be moved, shows are the anime that got new episodes
+SortResult = namedtuple('SortResult', ['moved', 'skipped', 'failed', 'shows', 'bytes_moved'])
+
+
+def lazy_import(name):
+    # Imports a helper module the first time it is needed, the same way the imports at the top do
+    if __package__:
+        return importlib.import_module(f'.{name}', __package__)
+    return importlib.import_module(name)
+
+
+def strtobool(value):
+    # distutils is gone since python 3.12, this accepts the same values its strtobool did
+    value = value.lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return True
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return False
+    raise ValueError(f"invalid truth value {value!r}")
+
+
+# The settings that are never asked but can come from the environment when the config gets created
+# The name of the environment variable without the prefix, the attribute it sets and how to read it
+ENVIRONMENT_SETTINGS = (('WORKERS', 'workers', int), ('VERIFY', 'verify_backups', strtobool),
+                        ('MATCH_THRESHOLD', 'match_threshold', float), ('LAYOUT', 'layout', str),
+                        ('IO_SCHEDULER', 'io_scheduler', strtobool), ('BANDWIDTH_LIMIT', 'bandwidth_limit', float),
+                        ('LOW_PRIORITY', 'low_priority', strtobool), ('CATALOG', 'use_catalog', strtobool),
+                        ('LOCKING', 'locking', strtobool), ('SPACE_RESERVE', 'space_reserve', float),
+                        ('BACKUP_STRATEGY', 'backup_strategy', str), ('ICON_BACKEND', 'icon_backend', str))
 
 
 class NyaaSort:
 
-    def __init__(self, dir_path, log_info=None, folder_icons="False", s_dir=None, b_dir=None):
+    def __init__(self, dir_path, log_info=None, folder_icons="False", s_dir=None, b_dir=None, workers=None,
+                 backup_strategy=None, verify_backups=None, icon_backend=None, metrics_json=None,
+                 metrics_prometheus=None, profile=None, interactive=None, sniff_media=None, match_threshold=None,
+                 io_scheduler=None, bandwidth_limit=None, low_priority=None, layout_template=None, use_catalog=None,
+                 locking=None, space_reserve=None, show_progress=None, progress_file=None):
         # Set-up logging
+        # Every sorter shares the same logger, so the handler is only added by the first one. Otherwise a program that
+        # creates a sorter per download would print every line once for every sorter it ever made
         logger = log.getLogger('NyaaSort Logger')
-        ch = log.StreamHandler()
-        formatter = log.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        ch.setFormatter(formatter)
+        ch = next((handler for handler in logger.handlers if getattr(handler, 'nyaasort', False)), None)
+        new_handler = ch is None
+        if new_handler:
+            ch = log.StreamHandler()
+            ch.nyaasort = True
+            formatter = log.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            ch.setFormatter(formatter)
 
         # We check for NoneType since 0 would not trigger otherwise
         if log_info is not None:
@@ -44,16 +113,81 @@ class NyaaSort:
         # Set self.experimental to true if we want to test new features
         self.folder_icons = True if folder_icons == "True" else False
         # Start logging
-        logger.addHandler(ch)
-        logger.debug("Logging started")
+        if new_handler:
+            logger.addHandler(ch)
+            logger.debug("Logging started")
+
+        # Only ask questions when somebody is there to answer them, cron jobs and services have no terminal
+        self.interactive = sys.stdin is not None and sys.stdin.isatty() if interactive is None else interactive
 
         # Set basic values
         self.dir_path = dir_path
         self.sort_dir = s_dir
         self.backup_dir = b_dir
+        # The amount of threads used to copy and move episodes, None means it will be read from the config
+        self.workers = workers
+        # How backups get made, see fileops.BACKUP_STRATEGIES. None means it will be read from the config
+        self.backup_strategy = backup_strategy
+        # Hash backups while they get copied, None means it will be read from the config
+        self.verify_backups = verify_backups
+        # How folder icons get set, see icons.ICON_BACKENDS. None means it will be read from the config
+        self.icon_backend = icon_backend
+        # Timings and counters of the run, written to these files by export_metrics when they are set
+        self.metrics = metrics.Metrics()
+        self.metrics_json = metrics_json
+        self.metrics_prometheus = metrics_prometheus
+        # Read the first bytes of every video to check it really is one, None means it will be read from the config
+        self.sniff_media = sniff_media
+        # Make all backups and then all moves one disk at a time instead of per episode, see scheduler
+        # Together with the bandwidth limit in MB/s and the lower priority this keeps the disks free for playback
+        # None means they will be read from the config
+        self.io_scheduler = io_scheduler
+        self.bandwidth_limit = bandwidth_limit
+        self.low_priority = low_priority
+        # Where the episodes go inside the show folder, see layout. None means it will be read from the config
+        self.layout = layout_template
+        # Keep every sorted episode in the sqlite catalog, see catalog. None means it will be read from the config
+        self.use_catalog = use_catalog
+        self.catalog = None
+        # Lock the library and the shows that are being sorted so runs that overlap do not collide, see locks
+        # None means it will be read from the config
+        self.locking = locking
+        self.library_lock = None
+        # The GB that is kept free on every disk, episodes that do not fit are left for the next run, see space
+        # None means it will be read from the config
+        self.space_reserve = space_reserve
+        # Report the progress of the copies and moves to the console and/or as json lines to this file, see progress
+        self.show_progress = bool(show_progress)
+        self.progress_file = progress_file
+        self.progress = None
+        # How alike a show name has to be to a show in the library, see matcher. None means it is read from the config
+        self.match_threshold = match_threshold
+        # Built from the anime dictionary the first time a name is not in there, see match_show
+        self.show_matcher = None
+        # The [SORT:profile] section the directories are read from, None is the normal [SORT] section
+        self.profile = profile
+        # Profiles that are sorted together share their show indexes, see sort_profiles
+        self.shared_indexes = None
+        self.hash_cache = None
+        self.file_ops = None
+        self.show_index = None
+        self.journal = None
+        # The modification time of the library when the anime dictionary was loaded, see library_changed
+        self.anime_dict_mtime = None
+        # A journal that could not be written anymore, its lock keeps other runs away until this run is done
+        self.dropped_journal = None
+        # The operations that failed during the current sort_files call
+        self.failed_operations = []
+        # Only one sort_files call at a time, a download client might finish multiple torrents at once
+        self.sort_lock = threading.Lock()
         self.anime_dict = {}
         self.config = configparser.ConfigParser()
         logging_level = None
+        extensions = media.DEFAULT_EXTENSIONS
+        # Which copy of an episode --dedupe keeps and where the other copies go, None means they get deleted
+        self.dedupe_keep = ' '.join(dedupe.DEFAULT_KEEP)
+        self.preferred_groups = []
+        self.trash_dir = None
 
         # The self.weak error variable will be used to check if the script found any errors while running
         self.weak_error = False
@@ -65,25 +199,108 @@ class NyaaSort:
             self.config.read(self.return_ini_location())
             exceptions = (configparser.NoOptionError, configparser.NoSectionError,
                           configparser.DuplicateSectionError, ValueError)
+            # A broken profile is a mistake of the user, unlike a broken [SORT] section it should not reset the config
+            section = profiles.section_name(profile)
+            if profile is not None:
+                missing = [key for key in ('DIRECTORY', 'SORTED_DIRECTORY', 'BACKUP_PATH')
+                           if not self.config.has_option(section, key)]
+                if missing:
+                    raise ValueError(f"The profile {profile} in {CONFIG_NAME} is missing {', '.join(missing)}")
             try:
                 # Get config settings
                 # Update the dir path to whatever was in the settings
-                self.dir_path = self.config.get('SORT', 'DIRECTORY')
-                self.sort_dir = self.config.get('SORT', 'SORTED_DIRECTORY')
-                self.backup_dir = self.config.get('SORT', 'BACKUP_PATH')
-                logging_level = bool(util.strtobool(self.config.get('SORT', 'LOGGING')))
-                settings_icons = bool(util.strtobool(self.config.get('SORT', 'ICONS')))
+                self.dir_path = self.config.get(section, 'DIRECTORY')
+                self.sort_dir = self.config.get(section, 'SORTED_DIRECTORY')
+                self.backup_dir = self.config.get(section, 'BACKUP_PATH')
+                logging_level = strtobool(self.config.get('SORT', 'LOGGING'))
+                settings_icons = strtobool(self.config.get('SORT', 'ICONS'))
+                # Older config files do not have this setting yet so fall back to a single worker
+                # Profiles use the settings of the [SORT] section for everything they do not set themselves
+                settings_workers = self.config.getint(section, 'WORKERS',
+                                                      fallback=self.config.getint('SORT', 'WORKERS', fallback=1))
+                settings_strategy = self.config.get(section, 'BACKUP_STRATEGY',
+                                                    fallback=self.config.get('SORT', 'BACKUP_STRATEGY',
+                                                                             fallback='auto'))
+                settings_verify = self.config.getboolean(section, 'VERIFY',
+                                                         fallback=self.config.getboolean('SORT', 'VERIFY',
+                                                                                         fallback=False))
+                settings_icon_backend = self.config.get('SORT', 'ICON_BACKEND', fallback='auto')
+                settings_sniff = self.config.getboolean('SORT', 'SNIFF', fallback=False)
+                settings_extensions = self.config.get('SORT', 'EXTENSIONS',
+                                                      fallback=' '.join(media.DEFAULT_EXTENSIONS))
+                settings_scheduler = self.config.getboolean(section, 'IO_SCHEDULER',
+                                                            fallback=self.config.getboolean('SORT', 'IO_SCHEDULER',
+                                                                                            fallback=False))
+                settings_bandwidth = self.config.getfloat(section, 'BANDWIDTH_LIMIT',
+                                                          fallback=self.config.getfloat('SORT', 'BANDWIDTH_LIMIT',
+                                                                                        fallback=0))
+                settings_low_priority = self.config.getboolean(section, 'LOW_PRIORITY',
+                                                               fallback=self.config.getboolean('SORT', 'LOW_PRIORITY',
+                                                                                               fallback=False))
+                settings_layout = self.config.get(section, 'LAYOUT', raw=True,
+                                                  fallback=self.config.get('SORT', 'LAYOUT', raw=True,
+                                                                           fallback=layout.DEFAULT_LAYOUT))
+                settings_catalog = self.config.getboolean(section, 'CATALOG',
+                                                          fallback=self.config.getboolean('SORT', 'CATALOG',
+                                                                                          fallback=True))
+                settings_locking = self.config.getboolean(section, 'LOCKING',
+                                                          fallback=self.config.getboolean('SORT', 'LOCKING',
+                                                                                          fallback=True))
+                settings_reserve = self.config.getfloat(section, 'SPACE_RESERVE',
+                                                        fallback=self.config.getfloat('SORT', 'SPACE_RESERVE',
+                                                                                      fallback=space.DEFAULT_RESERVE))
+                settings_threshold = self.config.getfloat('SORT', 'MATCH_THRESHOLD',
+                                                          fallback=matcher.DEFAULT_THRESHOLD)
+                self.dedupe_keep = self.config.get('SORT', 'DEDUPE_KEEP', fallback=self.dedupe_keep)
+                self.preferred_groups = [group.strip() for group in
+                                         self.config.get('SORT', 'PREFERRED_GROUPS', fallback='').split(',')
+                                         if group.strip()]
+                self.trash_dir = self.config.get(section, 'TRASH_PATH',
+                                                 fallback=self.config.get('SORT', 'TRASH_PATH', fallback='None'))
 
                 # Since we can only save objects as strings we have to check to see if these strings are not None
                 if self.sort_dir == 'None':
                     self.sort_dir = None
                 if self.backup_dir == 'None':
                     self.backup_dir = None
+                if self.trash_dir == 'None':
+                    self.trash_dir = None
 
                 # Only update the value of experimental features if it has not been assigned yet
                 if not self.folder_icons:
                     self.folder_icons = settings_icons
 
+                # A worker count given as argument always wins from the one in the config
+                if self.workers is None:
+                    self.workers = settings_workers
+                if self.backup_strategy is None:
+                    self.backup_strategy = settings_strategy
+                if self.verify_backups is None:
+                    self.verify_backups = settings_verify
+                if self.icon_backend is None:
+                    self.icon_backend = settings_icon_backend
+                if self.sniff_media is None:
+                    self.sniff_media = settings_sniff
+                if self.match_threshold is None:
+                    self.match_threshold = settings_threshold
+                if self.io_scheduler is None:
+                    self.io_scheduler = settings_scheduler
+                if self.layout is None:
+                    self.layout = settings_layout
+                if self.bandwidth_limit is None:
+                    self.bandwidth_limit = settings_bandwidth
+                if self.low_priority is None:
+                    self.low_priority = settings_low_priority
+                if self.use_catalog is None:
+                    self.use_catalog = settings_catalog
+                if self.locking is None:
+                    self.locking = settings_locking
+                if self.space_reserve is None:
+                    self.space_reserve = settings_reserve
+                # The extensions can be split by spaces or commas and do not need the dot
+                extensions = [extension if extension.startswith('.') else f'.{extension}'
+                              for extension in settings_extensions.replace(',', ' ').split()]
+
             except exceptions as e:
                 logger.error(f"Encountered a {e} while trying to read the config file")
                 logger.warning("Config file was corrupted, creating a new one")
@@ -119,7 +336,85 @@ class NyaaSort:
         if self.backup_dir == 'None':
             self.backup_dir = None
 
+        # Plans and journals only hold absolute paths, a relative -d, -o or -b would mean something else as soon as
+        # the plan is applied or the journal is replayed from another working directory
+        self.dir_path, self.sort_dir, self.backup_dir = (os.path.abspath(path) if path else path
+                                                         for path in (self.dir_path, self.sort_dir, self.backup_dir))
+
+        self.verify_backups = bool(self.verify_backups)
+
+        # Anything below 1 worker makes no sense, so just use the normal one at a time behavior
+        if self.workers is None or self.workers < 1:
+            self.workers = 1
+
+        if self.backup_strategy not in fileops.BACKUP_STRATEGIES:
+            if self.backup_strategy is not None:
+                self.logger.warning(f"Unknown backup strategy {self.backup_strategy}, using auto instead")
+            self.backup_strategy = 'auto'
+
+        self.io_scheduler = bool(self.io_scheduler)
+        self.low_priority = bool(self.low_priority)
+        # No limit, or a limit that makes no sense, means copying as fast as the disks can go
+        if not self.bandwidth_limit or self.bandwidth_limit < 0:
+            self.bandwidth_limit = 0
+        self.throttle = scheduler.Throttle(self.bandwidth_limit * 1024 ** 2) if self.bandwidth_limit else None
+
+        try:
+            layout.validate(self.layout or layout.DEFAULT_LAYOUT)
+        except ValueError as e:
+            self.logger.warning(f"{e}, putting the episodes straight into the show folders instead")
+            self.layout = None
+        self.layout = self.layout or layout.DEFAULT_LAYOUT
+
+        self.use_catalog = self.use_catalog is None or bool(self.use_catalog)
+        self.locking = self.locking is None or bool(self.locking)
+        if self.space_reserve is None or self.space_reserve < 0:
+            if self.space_reserve is not None:
+                self.logger.warning(f"The space reserve can not be negative, keeping {space.DEFAULT_RESERVE} GB free")
+            self.space_reserve = space.DEFAULT_RESERVE
+        self.sniff_media = bool(self.sniff_media)
+        self.media_detector = media.MediaDetector(extensions, self.sniff_media)
+
+        if self.icon_backend not in icons.ICON_BACKENDS:
+            if self.icon_backend is not None:
+                self.logger.warning(f"Unknown icon backend {self.icon_backend}, using auto instead")
+            self.icon_backend = 'auto'
+
+        # Extra release name patterns can be added to the [PARSER] section of the config
+        # They need at least a group and title named group and are tried before the built in ones
+        extra_patterns = []
+        if self.config.has_section('PARSER'):
+            for key, pattern in self.config.items('PARSER', raw=True):
+                try:
+                    release_parser.compile_pattern(pattern)
+                    extra_patterns.append(pattern)
+                except (re.error, ValueError) as e:
+                    self.logger.warning(f"Ignoring the release name pattern {key}: {e}")
+        if extra_patterns:
+            self.release_parser = release_parser.ReleaseParser(extra_patterns)
+        else:
+            self.release_parser = release_parser.DEFAULT_PARSER
+
+        if self.match_threshold is None or not 0 <= self.match_threshold <= 1:
+            if self.match_threshold is not None:
+                self.logger.warning(f"The match threshold has to be between 0 and 1, using "
+                                    f"{matcher.DEFAULT_THRESHOLD} instead")
+            self.match_threshold = matcher.DEFAULT_THRESHOLD
+
+        try:
+            self.dedupe_keep = dedupe.parse_keep(self.dedupe_keep)
+        except ValueError as e:
+            self.logger.warning(f"{e}, keeping {' then '.join(dedupe.DEFAULT_KEEP)} instead")
+            self.dedupe_keep = dedupe.DEFAULT_KEEP
+
+        # Other names of a show can be added to the [ALIASES] section of the config, alias = name of the show
+        self.aliases = dict(self.config.items('ALIASES', raw=True)) if self.config.has_section('ALIASES') else {}
+
     def get_anime_dict(self, folders):
+        with self.metrics.phase('anime_dict'):
+            return self.build_anime_dict(folders)
+
+    def build_anime_dict(self, folders):
         anime_dict = dict()
 
         # So for each folder in the folders provided
@@ -135,84 +430,921 @@ class NyaaSort:
                 if anime in anime_dict:
                     self.logger.warning(f"Found an anime which has 2 folders {anime}")
                     self.weak_error = True
+                    self.metrics.error('duplicate_folder')
                 else:
                     # Add the show to the dictionary with the anime as key
                     anime_dict[anime] = folder
 
         # Update the dictionary
         self.anime_dict = anime_dict
+        self.show_matcher = None
+        return anime_dict
+
+    def load_anime_dict(self, reindex=False, folders=None):
+        # The stored index is only used when the sorted anime have their own directory
+        # Otherwise every new download changes the modification time of the folder and the index would never be valid
+        # Folders can be given when the anime directory was already read, see scan_anime_dir
+        # The time is taken before anything gets read, so a change while reading is seen by library_changed
+        self.anime_dict_mtime = self.library_mtime()
+        if not self.sort_dir:
+            self.show_index = None
+            self.get_anime_dict(folders if folders is not None else self.get_folders_in_dir())
+            return
 
-    def move_anime(self, item, to_folder):
+        if self.shared_indexes is None:
+            self.show_index = show_index.ShowIndex(self.return_index_location(), self.sort_dir)
+        else:
+            # Profiles with the same library use the same index, the second one does not have to read the file again
+            library = os.path.realpath(self.sort_dir)
+            if library not in self.shared_indexes:
+                self.shared_indexes[library] = show_index.ShowIndex(self.return_index_location(), self.sort_dir)
+            self.show_index = self.shared_indexes[library]
+        if not reindex:
+            stored_dict = self.show_index.load()
+            if stored_dict is not None:
+                self.logger.debug(f"Using the stored index of {len(stored_dict)} shows")
+                self.anime_dict = stored_dict
+                self.show_matcher = None
+                return
+
+        # The index was outdated or a rebuild was asked for, walk the whole sorted directory
+        self.get_anime_dict(self.get_folders_in_dir())
+        self.show_index.rebuild(self.anime_dict)
+        self.logger.info(f"Rebuilt the index of {self.sort_dir}")
+
+    def save_show_index(self):
+        if not self.show_index:
+            return
         try:
-            # Create a copy of the anime episode
-            if self.backup_dir:
-                shutil.copy(os.path.join(self.dir_path, item), os.path.join(self.backup_dir, to_folder, item))
-                self.logger.info(f"Created a backup of {item} and copied it to {self.backup_dir}")
-
-            # Move the anime episode to the renamed folder
-            # Check if the directory has to be the same as were the anime is located
-            if self.sort_dir:
-                shutil.move(os.path.join(self.dir_path, item), os.path.join(self.sort_dir, to_folder, item))
-            else:
-                shutil.move(os.path.join(self.dir_path, item), os.path.join(self.dir_path, to_folder, item))
+            self.show_index.save()
+        except OSError as e:
+            # Not being able to save the index only means the next run has to walk the directory again
+            self.logger.warning(f"Could not save the show index: {e}")
+
+    def open_catalog(self):
+        # The catalog is opened once and after that every operation that runs updates it, see update_catalog
+        # Returns None when the catalog is not used or could not be opened
+        if not self.use_catalog or self.catalog is not None:
+            return self.catalog
+        catalog = lazy_import('catalog')
+        try:
+            self.catalog = catalog.Catalog(self.return_catalog_location(), self.release_parser)
+        except catalog.Error as e:
+            self.catalog_failed(e)
+        return self.catalog
+
+    def update_catalog(self, operation):
+        # Workers share the catalog, so hold on to it in case another one has to give up on it
+        catalog = self.catalog
+        if catalog is None:
+            return
+        try:
+            catalog.record(operation, self.library_dir())
+        except (lazy_import('catalog').Error, OSError) as e:
+            self.catalog_failed(e)
+
+    def save_catalog(self):
+        catalog = self.catalog
+        if catalog is None:
+            return
+        try:
+            catalog.save()
+        except lazy_import('catalog').Error as e:
+            self.catalog_failed(e)
+
+    def catalog_failed(self, error):
+        # The catalog can always be rebuilt from the library so it never fails the sort, it is just not used anymore
+        self.logger.warning(f"Could not update the catalog, it can be rebuilt with query --rebuild: {error}")
+        self.metrics.error('catalog')
+        self.use_catalog = False
+        self.catalog = None
+
+    def open_library_lock(self):
+        # Returns the lock of the library, None when locking is off or the library can not hold the lock file
+        if not self.locking or self.library_lock is not None:
+            return self.library_lock
+        mtime_before = self.library_mtime()
+        try:
+            self.library_lock = locks.LibraryLock(self.library_dir())
+        except OSError as e:
+            self.locks_failed(e)
+        # The first run makes the lock file in the library, that does not change any of its folders
+        if mtime_before is not None and mtime_before == self.anime_dict_mtime:
+            self.anime_dict_mtime = self.library_mtime()
+        return self.library_lock
+
+    def locks_failed(self, error):
+        # A read only library or a share without lock support, sorting still works like it did before the locks
+        self.logger.warning(f"Could not lock {self.library_dir()}, sorting without locks: {error}")
+        self.metrics.error('locks')
+        self.locking = False
+        self.library_lock = None
+
+    def lock_everything(self):
+        # For the work that can touch every show of the library, it waits for every other run to finish its shows
+        library_lock = self.open_library_lock()
+        return library_lock.everything() if library_lock else nullcontext()
+
+    def plan_locked(self, items_in_folder):
+        # Plans the items and locks the shows in the plan, other runs can sort other shows in the meantime
+        # Returns the plan together with its ShowLocks, those are None when locking is off
+        library_lock = self.open_library_lock()
+        if library_lock is None:
+            return self.plan_items(items_in_folder), None
+
+        items = list(items_in_folder)
+        # The shows were just loaded by scan_anime_dir or are still warm from the last batch of watch, they are only
+        # loaded again when another run might have made or renamed folders in the meantime
+        reload = self.library_changed()
+        try:
+            while True:
+                with library_lock.library():
+                    # This also throws away the folders a plan that had to wait added to the anime dictionary
+                    if reload:
+                        self.load_anime_dict()
+                    reload = True
+                    plan = self.plan_items(items)
+                    show_locks = library_lock.shows({operation['anime'] for operation in plan.operations
+                                                     if 'anime' in operation}, blocking=False)
+                if not isinstance(show_locks, str):
+                    return plan, show_locks
+
+                # Another run is sorting this show, wait for it to finish and plan again with its folders
+                self.logger.info(f"Waiting for another sort of {show_locks}")
+                self.metrics.count('lock_waits')
+                with self.metrics.phase('lock_wait'):
+                    library_lock.shows([show_locks]).release()
+        except OSError as e:
+            self.locks_failed(e)
+            self.load_anime_dict()
+            return self.plan_items(items), None
+
+    def library_mtime(self):
+        try:
+            return os.stat(self.library_dir()).st_mtime_ns
+        except OSError:
+            return None
+
+    def library_changed(self):
+        # Returns if a folder in the library might have changed since the anime dictionary was loaded
+        mtime = self.library_mtime()
+        return mtime is None or mtime != self.anime_dict_mtime
 
-            self.logger.info(f"Moved {item} to {to_folder}")
+    def library_dir(self):
+        # The directory the show folders are in, if the sort_dir is None that is the anime directory itself
+        return self.sort_dir if self.sort_dir else self.dir_path
 
+    def plan_move_anime(self, plan, item, to_folder, anime_name=None, item_size=None, release=None):
+        src = os.path.join(self.dir_path, item)
+        try:
+            # Get the size now, both the plan and the throughput report need it
+            # A scan of the directory already knows it, so only stat the file when we were not given the size
+            if item_size is None:
+                item_size = os.path.getsize(src)
         except FileNotFoundError:
             self.logger.warning(f"Encountered an error while attempting to move {item}")
             self.logger.warning(f'from {self.dir_path} to {to_folder}')
             self.weak_error = True
+            self.metrics.error('missing_episode')
+            return
+
+        # Where the episode goes inside the show folder, with the default layout that is just its own name
+        if release is None and self.layout != layout.DEFAULT_LAYOUT:
+            release = self.release_parser.parse(item)
+        relative = layout.episode_path(self.layout, item, release)
+        targets = [self.backup_dir, self.library_dir()] if self.backup_dir else [self.library_dir()]
+        if os.path.dirname(relative):
+            for target in targets:
+                plan.add_folder(os.path.join(target, to_folder, os.path.dirname(relative)), anime=anime_name)
+
+        # Create a copy of the anime episode before it gets moved
+        if self.backup_dir:
+            plan.add('copy', os.path.join(self.backup_dir, to_folder, relative), src=src, size=item_size,
+                     anime=anime_name)
+        plan.add('move', os.path.join(self.library_dir(), to_folder, relative), src=src, size=item_size,
+                 anime=anime_name)
+
+    def move_anime(self, item, to_folder):
+        # Backs up and moves a single episode right away
+        # Returns the amount of bytes that got moved so the caller can report the throughput
+        plan = planner.Plan(self.dir_path, self.sort_dir, self.backup_dir)
+        self.plan_move_anime(plan, item, to_folder)
+
+        # Only check the devices once per run, not for every episode
+        if self.file_ops is None:
+            self.file_ops = fileops.FileOps(self.dir_path, self.sort_dir, self.backup_dir,
+                                            self.backup_strategy, self.logger, self.throttle)
+        self.open_catalog()
+        self.open_hash_cache()
+        # The season folders of the layout have to be there first, unless the episode has to wait for space
+        plan = self.admit_plan(plan)
+        for operation in plan.structural():
+            self.apply_operation(operation)
+        moved_bytes = sum(self.run_job(job) for job in plan.transfer_jobs())
+        self.save_catalog()
+        self.save_hash_cache()
+        return moved_bytes
+
+    def open_hash_cache(self):
+        # The hashes are needed when we make new ones, or when the folders of existing ones get renamed
+        if self.hash_cache is None and self.backup_dir:
+            if self.verify_backups or verify.HashCache.exists(self.backup_dir):
+                self.hash_cache = verify.HashCache(self.backup_dir)
+        return self.hash_cache
+
+    def save_hash_cache(self):
+        if not self.hash_cache:
+            return
+        try:
+            self.hash_cache.save()
+        except OSError as e:
+            self.logger.warning(f"Could not save the hashes of the backups: {e}")
+
+    def apply_operation(self, operation):
+        # Runs a single operation of a plan, returns False if it failed
+        # Every kind of operation is timed as its own phase, mkdir and rename are the folder creates and renames
+        run_progress = self.progress
+        start_time = time.perf_counter()
+        with self.metrics.phase(operation['op']):
+            succeeded = self.run_operation(operation)
+        if run_progress and operation['op'] in ('copy', 'move'):
+            run_progress.done(operation, succeeded, time.perf_counter() - start_time)
+        if not succeeded:
+            self.metrics.error(operation['op'])
+            self.failed_operations.append(operation)
+        elif operation['op'] == 'move':
+            self.metrics.count('files_moved')
+            self.metrics.count('bytes_moved', operation.get('size', 0))
+        elif operation['op'] == 'copy':
+            self.metrics.count('backups_made')
+            self.metrics.count('bytes_backed_up', operation.get('size', 0))
+        elif 'folder' in operation:
+            self.metrics.count('folders_created' if operation['op'] == 'mkdir' else 'folders_renamed')
+        return succeeded
+
+    def write_journal(self, record, operation):
+        # A journal that can not be written anymore, a full disk or a NAS that went away, should not stop the sort
+        # The lines that did make it stay on the disk, so the next run still finishes what this one might not
+        run_journal = self.journal
+        if run_journal is None:
+            return
+        try:
+            getattr(run_journal, record)(operation)
+        except (OSError, ValueError) as e:
+            if self.journal is run_journal:
+                self.journal = None
+                self.dropped_journal = run_journal
+                self.logger.warning(f"Could not write the journal anymore, an interrupted run can not be resumed: {e}")
+                self.metrics.error('journal')
+
+    def start_journal(self, plan):
+        # Write down what we are about to do first, so an interrupted run can be finished by the next one
+        run_journal = journal.Journal(journal.run_path(self.journal_location()))
+        try:
+            run_journal.begin(plan)
+        except OSError as e:
+            self.logger.warning(f"Could not write the journal, an interrupted run can not be resumed: {e}")
+            return
+        self.journal = run_journal
+
+    def finish_journal(self):
+        for run_journal in (self.journal, self.dropped_journal):
+            if run_journal is None:
+                continue
+            try:
+                run_journal.finish()
+            except (OSError, ValueError) as e:
+                # Whatever is left of it gets replayed by the next run, which is harmless since everything was run
+                self.logger.warning(f"Could not remove the journal {run_journal.path}: {e}")
+                try:
+                    run_journal.close()
+                except OSError:
+                    pass
+        self.journal = None
+        self.dropped_journal = None
+
+    def run_operation(self, operation):
+        op = operation['op']
+        src = operation.get('src')
+        dst = operation['dst']
+        anime_name = operation.get('anime')
+        # Needed to check if somebody else changed the library while we were not looking
+        mtime_before = self.library_mtime() if 'folder' in operation else None
+
+        self.write_journal('started', operation)
+        try:
+            if op == 'mkdir':
+                # If the folder is already there we can simply use it
+                os.makedirs(dst, exist_ok=True)
+                if 'folder' in operation:
+                    self.logger.info(f"created a new folder for the show: {anime_name}")
+            elif op == 'rename':
+                os.rename(src, dst)
+                # The hashes of the backups in the folder have to move along with it
+                if self.hash_cache and 'folder' not in operation:
+                    self.hash_cache.rename(src, dst)
+                if 'folder' in operation:
+                    self.logger.info(f"Renamed the folder for {anime_name}")
+            elif op == 'copy':
+                if self.verify_backups and self.hash_cache:
+                    self.hash_cache.record(dst, verify.verified_backup(self.file_ops, src, dst))
+                else:
+                    self.file_ops.backup(src, dst)
+                self.logger.info(f"Created a backup of {os.path.basename(src)} and copied it to "
+                                 f"{os.path.dirname(dst)}")
+            elif op == 'move':
+                self.file_ops.move(src, dst)
+                self.media_detector.forget(src)
+                self.logger.info(f"Moved {os.path.basename(src)} to {os.path.basename(os.path.dirname(dst))}")
+
+        except FileNotFoundError:
+            if op in planner.STRUCTURAL_OPERATIONS:
+                self.logger.error(f"Encountered an error while attempting to {op} folder {src or dst}")
+                self.logger.error(f'from {src} to {dst}' if src else f'in {os.path.dirname(dst)}')
+            else:
+                self.logger.warning(f"Encountered an error while attempting to {op} {os.path.basename(src)}")
+                self.logger.warning(f'from {os.path.dirname(src)} to {os.path.dirname(dst)}')
+            self.weak_error = True
+            return False
         except PermissionError:
-            self.logger.warning(f"Could not move {item} permission was denied")
+            self.logger.warning(f"Could not {op} {os.path.basename(src or dst)} permission was denied")
+            self.weak_error = True
+            return False
+        except OSError as e:
+            self.logger.error(f"Encountered {e} while attempting to {op} {src or dst}")
+            self.weak_error = True
+            return False
+
+        self.write_journal('done', operation)
+
+        # Keep the anime dictionary and the stored index up to date with the folders in the library
+        if 'folder' in operation:
+            self.anime_dict[anime_name] = operation['folder']
+            if self.show_matcher is not None:
+                self.show_matcher.add(anime_name)
+            if self.show_index:
+                self.show_index.update(anime_name, operation['folder'], mtime_before)
+            # Our own folders are already in the anime dictionary, see library_changed
+            if mtime_before is not None and mtime_before == self.anime_dict_mtime:
+                self.anime_dict_mtime = self.library_mtime()
+        self.update_catalog(operation)
+        return True
+
+    def run_job(self, job):
+        # Runs the copy and move of a single episode, returns the amount of bytes that got moved
+        for operation in job:
+            if not self.apply_operation(operation):
+                # Never move an episode of which the backup failed
+                return 0
+        return sum(operation.get('size', 0) for operation in job if operation['op'] == 'move')
+
+    def admit_jobs(self, jobs):
+        # Only starts on the episodes that fit on their disks with the reserve still free, instead of finding out
+        # halfway through a batch. The other episodes stay in the anime directory for the next run
+        if not jobs:
+            return jobs
+        with self.metrics.phase('admission'):
+            admitted, rejected = space.admit(jobs, self.file_ops, self.space_reserve * 1024 ** 3)
+        for job in rejected:
+            self.logger.warning(f"Not sorting {os.path.basename(job[0]['src'])} since it does not fit on the disk "
+                                f"with {self.space_reserve} GB kept free")
+        if rejected:
+            self.weak_error = True
+            self.metrics.error('space')
+            self.metrics.count('episodes_deferred', len(rejected))
+        return admitted
+
+    def admit_plan(self, plan):
+        # Returns the plan without the episodes that do not fit, see admit_jobs, and without the folders that only
+        # those episodes needed. A show whose episodes all have to wait keeps its folders as they are, in the library
+        # and in the backups, the next run plans them again
+        jobs = plan.transfer_jobs()
+        admitted = self.admit_jobs(jobs)
+        if len(admitted) == len(jobs):
+            return plan
+
+        def folders_of(some_jobs):
+            # Every folder the episodes end up in and all the folders above them
+            folders = set()
+            for job in some_jobs:
+                for operation in job:
+                    folder = os.path.dirname(operation['dst'])
+                    while folder not in folders and os.path.dirname(folder) != folder:
+                        folders.add(folder)
+                        folder = os.path.dirname(folder)
+            return folders
+
+        admitted_operations = {id(operation) for job in admitted for operation in job}
+        needed = folders_of(admitted)
+        deferred = folders_of(job for job in jobs if id(job[0]) not in admitted_operations)
+        # Last operation first, a folder that gets renamed later on is needed by whoever needs its new name
+        operations = []
+        for operation in reversed(plan.operations):
+            if operation['op'] in planner.STRUCTURAL_OPERATIONS:
+                if operation['dst'] in deferred and operation['dst'] not in needed:
+                    if operation['op'] == 'rename':
+                        deferred.add(operation['src'])
+                    # The anime dictionary already has the folder the plan was going to make, put it back
+                    if 'folder' in operation:
+                        self.forget_folder(operation)
+                    continue
+                if operation['op'] == 'rename':
+                    needed.add(operation['src'])
+            elif id(operation) not in admitted_operations:
+                continue
+            operations.append(operation)
+        return planner.Plan(plan.dir_path, plan.sort_dir, plan.backup_dir, operations[::-1])
+
+    def forget_folder(self, operation):
+        # Undoes what planning a folder did to the anime dictionary, for a folder that is not going to be made
+        if operation['op'] == 'rename':
+            self.anime_dict[operation['anime']] = os.path.basename(operation['src'])
+        else:
+            self.anime_dict.pop(operation['anime'], None)
+        self.show_matcher = None
+
+    def run_transfers(self, jobs):
+        # Jobs is a list of planned copy and move operations, grouped per episode
+        if not jobs:
+            return
+
+        if self.show_progress or self.progress_file:
+            try:
+                self.progress = progress.Progress(jobs, self.progress_file, self.show_progress)
+                # Every piece a copy writes goes through the same callback as the bandwidth limit
+                self.file_ops.throttle = self.progress.callback(self.throttle)
+            except OSError as e:
+                self.logger.warning(f"Could not write the progress to {self.progress_file}: {e}")
+        try:
+            self.transfer(jobs)
+        finally:
+            if self.progress:
+                self.progress.finish()
+                self.progress = None
+                self.file_ops.throttle = self.throttle
+
+    def transfer(self, jobs):
+        start_time = time.perf_counter()
+        if self.io_scheduler:
+            moved_bytes = scheduler.run_jobs(jobs, self.file_ops, self.apply_operation, self.logger,
+                                             self.transfer_thread_started)
+            self.report_transfers(len(jobs), moved_bytes, time.perf_counter() - start_time, 'one per disk')
+            return
+
+        # Do all the work for one device before moving on to the next one, so the disks don't keep switching
+        devices = {}
+
+        def job_device(job):
+            folder = os.path.dirname(job[-1]['dst'])
+            if folder not in devices:
+                try:
+                    devices[folder] = os.stat(folder).st_dev
+                except OSError:
+                    devices[folder] = 0
+            return devices[folder]
+
+        jobs = sorted(jobs, key=job_device)
+
+        if (self.workers > 1 and len(jobs) > 1) or self.low_priority:
+            # Every job goes to a different file so the copies and moves can safely run at the same time
+            # A lower priority only sticks to the thread that asked for it, so then the workers are always used
+            with ThreadPoolExecutor(max_workers=self.workers, initializer=self.transfer_thread_started) as pool:
+                moved_bytes = sum(pool.map(self.run_job, jobs))
+        else:
+            moved_bytes = sum(self.run_job(job) for job in jobs)
+        self.report_transfers(len(jobs), moved_bytes, time.perf_counter() - start_time, f'{self.workers} worker(s)')
+
+    def transfer_thread_started(self):
+        # Runs in every thread that copies or moves episodes
+        if self.low_priority:
+            scheduler.lower_priority(self.logger)
+
+    def report_transfers(self, episodes, moved_bytes, elapsed, using):
+        self.metrics.add_time('transfers', elapsed)
+
+        # Report how fast everything went, max makes sure we never divide by 0 on really fast moves
+        megabytes = moved_bytes / 1024 ** 2
+        self.logger.info(f"Moved {episodes} episodes ({megabytes:.1f} MB) in {elapsed:.2f}s "
+                         f"using {using}, {megabytes / max(elapsed, 1e-6):.1f} MB/s")
+
+    def execute_plan(self, plan):
+        # Creates and renames the folders in the planned order first, after that all episodes get moved
+        # Only the episodes that fit on their disks are sorted, the folders that only the others need are left alone
+        if any(operation['op'] in planner.TRANSFER_OPERATIONS for operation in plan.operations):
+            # Check the devices before the workers start so they all share the same choice
+            self.file_ops = fileops.FileOps(self.dir_path, self.sort_dir, self.backup_dir, self.backup_strategy,
+                                            self.logger, self.throttle)
+            plan = self.admit_plan(plan)
+        # Write down what we are about to do first, so an interrupted run can be finished by the next one
+        self.start_journal(plan)
+
+        # Read the hashes again, another run might have saved some since the last plan
+        self.hash_cache = None
+        self.open_hash_cache()
+        self.open_catalog()
+
+        failed_anime = set()
+        for operation in plan.structural():
+            if operation.get('anime') in failed_anime:
+                # Do not rename the backup folder if the folder in the library could not be renamed
+                continue
+            if not self.apply_operation(operation) and 'anime' in operation:
+                failed_anime.add(operation['anime'])
+
+        jobs = []
+        for job in plan.transfer_jobs():
+            if job[0].get('anime') in failed_anime:
+                # Only move the episode if its folder actually got created or renamed
+                self.logger.warning(f"Skipped {os.path.basename(job[0]['src'])} since its folder could not be made")
+                continue
+            jobs.append(job)
+        self.run_transfers(jobs)
+        self.save_show_index()
+        self.save_catalog()
+        self.save_hash_cache()
+
+        # Only remove the journal once everything was run, if we crash before this the next run will find it
+        self.finish_journal()
+        return jobs
+
+    def verify_backup_dir(self):
+        # Hashes every backup that changed since it was last checked and reports the ones that do not match
+        if not self.backup_dir:
+            self.logger.error("There is no backup directory to verify")
+            self.weak_error = True
+            self.metrics.error('verify')
+            return None
+
+        cache = verify.HashCache(self.backup_dir)
+        # Hashing is mostly waiting on the disk, so use a couple of readers even if the sort uses a single worker
+        result = verify.verify_tree(self.backup_dir, cache, max(self.workers, 4), self.logger)
+        cache.save()
+
+        print(f"Hashed {result.checked} backups ({result.added} new), skipped {result.skipped} unchanged ones, "
+              f"{len(result.mismatched)} do not match and {len(result.missing)} are missing")
+        self.metrics.count('backups_checked', result.checked)
+        if result.mismatched or result.missing:
             self.weak_error = True
+            self.metrics.error('verify')
+        return result
+
+    def relayout(self, dry_run=False, plan_out=None):
+        # Moves every episode that is already in the library, and its backup, to where the layout wants it
+        # Everything stays inside its show folder so these are all renames, no episode gets copied
+        with self.metrics.phase('relayout_plan'):
+            plan = self.plan_relayout()
+        if dry_run:
+            if plan_out:
+                plan.save(plan_out)
+                print(f"Saved the plan to {plan_out}")
+            else:
+                print(json.dumps(plan.to_dict(), indent=2))
+            print(plan.summary())
+            return plan
+
+        self.recover_journal()
+        with self.metrics.phase('relayout'), self.lock_everything():
+            self.run_relayout(plan)
+        return plan
+
+    def plan_relayout(self):
+        plan = planner.Plan(self.dir_path, self.sort_dir, self.backup_dir)
+        planned = set()
+        for target in [self.library_dir(), self.backup_dir] if self.backup_dir else [self.library_dir()]:
+            for folder in scanner.list_folders(target):
+                if '] ' not in folder:
+                    continue
+                anime_name = folder.split('] ', 1)[1]
+                show_folder = os.path.join(target, folder)
+                for relative in layout.iter_episodes(show_folder):
+                    name = os.path.basename(relative)
+                    if not self.media_detector.has_video_extension(name):
+                        continue
+                    new_relative = layout.episode_path(self.layout, name, self.release_parser.parse(name))
+                    if new_relative == relative:
+                        continue
+                    dst = os.path.join(show_folder, new_relative)
+                    if dst in planned or os.path.exists(dst):
+                        # A rename would throw away the other episode, leave both where they are
+                        self.logger.warning(f"Not moving {relative} in {folder}, {new_relative} is already taken")
+                        self.weak_error = True
+                        self.metrics.error('relayout')
+                        continue
+                    planned.add(dst)
+                    if os.path.dirname(new_relative):
+                        plan.add_folder(os.path.join(show_folder, os.path.dirname(new_relative)), anime=anime_name)
+                    plan.add('rename', dst, src=os.path.join(show_folder, relative), anime=anime_name)
+        return plan
+
+    def run_relayout(self, plan):
+        # Every show is done by its own worker, the renames of a show run in order since its folders come first
+        self.start_journal(plan)
+        if self.backup_dir and verify.HashCache.exists(self.backup_dir):
+            self.hash_cache = verify.HashCache(self.backup_dir)
+        self.open_catalog()
+
+        shows = {}
+        for operation in plan.operations:
+            shows.setdefault(operation.get('anime'), []).append(operation)
+
+        def relayout_show(operations):
+            moved = [operation for operation in operations
+                     if self.apply_operation(operation) and operation['op'] == 'rename']
+            # Folders an older layout made are removed once they are empty
+            library_dirs = [self.library_dir(), self.backup_dir] if self.backup_dir else [self.library_dir()]
+            return len(moved), layout.remove_empty_folders({os.path.dirname(operation['src']) for operation in moved},
+                                                           library_dirs)
+
+        # Renames barely touch the disk, on a network share most of the time is spent waiting on the other side
+        with ThreadPoolExecutor(max_workers=max(self.workers, 4)) as pool:
+            results = list(pool.map(relayout_show, shows.values()))
+        moved = sum(result[0] for result in results)
+        removed = sum(result[1] for result in results)
+        self.save_catalog()
+
+        self.save_hash_cache()
+        self.finish_journal()
+
+        renames = sum(1 for operation in plan.operations if operation['op'] == 'rename')
+        self.metrics.count('layout_renames', moved)
+        print(f"Moved {moved} of {renames} episodes to the new layout of {len(shows)} shows and removed "
+              f"{removed} empty folders")
+        if moved < renames:
+            self.weak_error = True
+
+    def dedupe_library(self, trash_dir=None, delete=False, identical=False, dry_run=False):
+        # Finds every episode that is in the library more than once and keeps the best copy according to DEDUPE_KEEP
+        # The other copies go to the trash dir, or get deleted when there is none and delete is set
+        # Without either of them, or as a dry run, the duplicates are only reported
+        trash_dir = trash_dir or self.trash_dir
+        library = self.library_dir()
+        with self.metrics.phase('dedupe'):
+            episodes = dedupe.index_library(library, self.release_parser, self.media_detector)
+            duplicates = dedupe.find_duplicates(episodes, self.dedupe_keep, self.preferred_groups, identical,
+                                                self.logger)
+
+        wasted = sum(episode.size for group in duplicates for episode in group.remove)
+        for group in duplicates:
+            print(f"Keeping {os.path.relpath(group.keep.path, library)}, "
+                  f"{'same file as' if group.kind == 'identical' else 'duplicates'}: "
+                  f"{', '.join(os.path.relpath(episode.path, library) for episode in group.remove)}")
+
+        if dry_run or not (trash_dir or delete):
+            print(f"Found {len(duplicates)} duplicated episodes in {len(episodes)} episodes, removing them would "
+                  f"reclaim {wasted / 1024 ** 3:.2f} GiB")
+            return dedupe.DedupeResult(len(episodes), duplicates, 0, 0, [])
+
+        with self.metrics.phase('dedupe_remove'), self.lock_everything():
+            removed, bytes_reclaimed, failed = dedupe.remove_duplicates(duplicates, library, trash_dir, self.logger)
+        # The copies that are gone are not part of the library anymore
+        if self.open_catalog():
+            failed_paths = set(failed)
+            try:
+                self.catalog.remove([episode.path for group in duplicates for episode in group.remove
+                                     if episode.path not in failed_paths])
+            except lazy_import('catalog').Error as e:
+                self.catalog_failed(e)
+            self.save_catalog()
+        print(f"{'Moved' if trash_dir else 'Deleted'} {removed} duplicates{f' to {trash_dir}' if trash_dir else ''}, "
+              f"reclaiming {bytes_reclaimed / 1024 ** 3:.2f} GiB")
+        self.metrics.count('duplicates_removed', removed)
+        self.metrics.count('bytes_reclaimed', bytes_reclaimed)
+        if failed:
+            self.weak_error = True
+            self.metrics.error('dedupe')
+        return dedupe.DedupeResult(len(episodes), duplicates, removed, bytes_reclaimed, failed)
+
+    def query_catalog(self, show=None, group=None, missing=False, as_json=False, rebuild=False, all_libraries=False):
+        # Answers questions about the library from the catalog instead of walking it
+        # Without a show every show is listed, with a show its episodes, missing lists the gaps between the episodes
+        # Rebuild first replaces what the catalog knows about the library with what is on disk right now
+        self.use_catalog = True
+        if self.open_catalog() is None:
+            self.weak_error = True
+            return None
+        library = self.library_dir()
+        if rebuild:
+            try:
+                with self.metrics.phase('catalog_rebuild'):
+                    found = self.catalog.rebuild(library, self.backup_dir, self.media_detector)
+            except lazy_import('catalog').Error as e:
+                self.catalog_failed(e)
+                self.weak_error = True
+                return None
+            self.logger.info(f"Added {found} episodes of {library} to the catalog")
+        if all_libraries:
+            library = None
+
+        with self.metrics.phase('catalog_query'):
+            if missing:
+                result = [{'library': show_library, 'show': name,
+                           'missing': [{'season': season, 'episode': episode} for season, episode in gaps]}
+                          for (show_library, name), gaps in self.catalog.missing(library, show).items()]
+            elif show is not None:
+                result = [episode._asdict() for episode in self.catalog.episodes(library, show, group)]
+            else:
+                result = [summary._asdict() for summary in self.catalog.shows(library, group=group)]
+
+        if as_json:
+            print(json.dumps(result, indent=2))
+        elif missing:
+            for entry in result:
+                print(f"{entry['show']}: " + ', '.join(f"S{gap['season']:02d}E{gap['episode']:02d}"
+                                                       for gap in entry['missing']))
+        elif show is not None:
+            for episode in result:
+                print(f"{os.path.relpath(episode['path'], episode['library'])}  {episode['group']}  "
+                      f"{episode['size'] / 1024 ** 2:.1f} MB  "
+                      f"{'backed up' if episode['backup_path'] else 'no backup'}")
+        else:
+            for summary in result:
+                print(f"{summary['folder']}  {summary['episodes']} episodes  {summary['size'] / 1024 ** 3:.2f} GiB")
+        self.metrics.count('catalog_results', len(result))
+        return result
+
+    def recover_journal(self):
+        # Finishes whatever earlier runs that got interrupted were doing
+        # Every run has a journal of its own, the ones of runs that are still going hold a lock and are left alone
+        for journal_path in journal.find_journals(self.journal_location()):
+            fd = journal.claim(journal_path)
+            if fd is None:
+                continue
+            try:
+                pending = journal.read_journal(journal_path, fd)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Could not read the journal of an earlier run: {e}")
+                self.weak_error = True
+                self.metrics.error('journal')
+                journal.release(journal_path, fd, False)
+                # Move it out of the way, otherwise every run after this one would trip over it as well
+                try:
+                    os.replace(journal_path, f'{journal_path}.broken')
+                except FileNotFoundError:
+                    pass
+                continue
+
+            try:
+                if pending is not None:
+                    self.recover_run(*pending)
+            finally:
+                journal.release(journal_path, fd, pending is not None or journal.is_abandoned(fd))
+
+    def recover_run(self, plan, done):
+        # Replays the plan of a single run that died
+        self.logger.warning(f"An earlier sort got interrupted, finishing the last "
+                            f"{len(plan.operations) - len(done)} operations")
+        file_ops = fileops.FileOps(plan.dir_path or self.dir_path, plan.sort_dir, plan.backup_dir,
+                                   self.backup_strategy, self.logger, self.throttle)
+        # The plan can be about any show, so nobody else gets to sort while it is finished
+        with self.lock_everything():
+            replayed, rolled_back, abandoned = journal.replay(plan, done, file_ops, self.logger)
+        self.logger.warning(f"Replayed {replayed}, rolled back {rolled_back} and abandoned {abandoned} operations of "
+                            f"the earlier sort")
+        if rolled_back or abandoned:
+            self.weak_error = True
+            self.metrics.error('journal')
 
     def get_folders_in_dir(self):
         # Make a list of all the folders in the sorted anime dir
         # Note this only takes the top level folders into consideration we are not interested in sub-folders
-        if self.sort_dir:
-            full_folders_dir = next(os.walk(self.sort_dir))[1]
-        else:
-            # if the sort_dir is equal to None the sorted directory is the same as the anime directory
-            full_folders_dir = next(os.walk(self.dir_path))[1]
+        # if the sort_dir is equal to None the sorted directory is the same as the anime directory
+        with self.metrics.phase('folder_walk'):
+            full_folders_dir = scanner.list_folders(self.library_dir())
         return full_folders_dir
 
-    def sort(self):
+    def scan_anime_dir(self, reindex=False):
+        # Loads the anime dictionary and returns the files in the anime directory, reading every directory once
+        # When the sorted anime have their own directory the files are streamed while they are being sorted
+        if self.sort_dir:
+            self.load_anime_dict(reindex)
+            return scanner.iter_files(self.dir_path)
+
+        # The show folders are in the anime directory itself, a single pass gives both the episodes and the folders
+        with self.metrics.phase('folder_walk'):
+            files, folders = scanner.split(self.dir_path)
+        self.load_anime_dict(reindex, folders)
+        return files
+
+    def sort(self, reindex=False, interactive=True):
+        # Finish an earlier run that got interrupted before starting a new one
+        self.recover_journal()
+
         # Get all anime that needs to be sorted in the unsorted anime dir
-        items_in_folder = os.listdir(self.dir_path)
+        # and update the dictionary of all anime we have existing folders for
+        # This uses the stored index unless it is outdated or reindex is set
+        items_in_folder = self.scan_anime_dir(reindex)
 
-        # Make a list of all the folders in the sorted anime dir
-        full_folders_dir = self.get_folders_in_dir()
-
-        # Update the dictionary of all anime we have existing folders for
-        self.get_anime_dict(full_folders_dir)
-
-        for item in items_in_folder:
-            # All the anime I download off Nyaa are MKV files
-            # TODO add support for mp4 files
-            # The mimetypes tries to guess what kind of file it is, this is to prevent other stuff with the
-            # .mkv extension getting into my folders
-            if item.endswith(".mkv") and 'video' in guess_type(item, strict=True)[0]:
-                # Fetch the group which did the group, done by finding the first ] in the string
-                nya_format = [']', '[', ' -', '] ']
-                # Check if the file has all characters needed to be a matching of the nyaa format
-                if all(x in item for x in nya_format):
-                    try:
-                        # Get the group by getting everything between the first [ and ]
-                        subtitle_group = str(item.split(']', 1)[0]).replace('[', '', 1)
-                        # fetch the name of the anime by taking everything after the first ] and before the last -
-                        anime_name = str(item.split('] ', 1)[1]).rsplit(" -", 1)[0]
-                    except IndexError:
-                        # This will trigger if you create a file name containing all nya_format characters
-                        # But it is not the correct format after all
-                        self.logger.warning(f"Encountered an error while string slicing {item}")
-                        self.weak_error = True
-                        continue
-                else:
+        self.sort_items(items_in_folder)
+
+        # Check if the user wanted folder icons
+        if self.folder_icons:
+            self.make_icons()
+
+        # if any weak errors were encountered make sure the popup window from python does not disappear
+        if interactive and self.interactive and self.weak_error and self.logger.getEffectiveLevel() < 30:
+            input("Press any key to exit \n")
+
+    def sort_files(self, paths, reindex=False):
+        # Sorts only the given files, like the ones a download client just finished, without asking anything
+        # Paths can be full paths or names of files in the anime directory, anything else ends up in skipped
+        with self.sort_lock:
+            self.recover_journal()
+            anime_dir = os.path.realpath(self.dir_path)
+            items = {}
+            skipped = []
+            for path in paths:
+                full_path = os.path.join(self.dir_path, path)
+                # Episodes are only sorted from the anime directory itself, not from the folders in it
+                if os.path.dirname(os.path.realpath(full_path)) != anime_dir or not os.path.isfile(full_path):
+                    skipped.append(path)
+                    continue
+                items[os.path.join(self.dir_path, os.path.basename(full_path))] = path
+
+            # With a sorted directory this is only a stat as long as nobody else changed the library
+            self.load_anime_dict(reindex)
+            plan, show_locks = self.plan_locked([os.path.basename(src) for src in items])
+            self.failed_operations = []
+            try:
+                jobs = self.execute_plan(plan)
+            finally:
+                if show_locks:
+                    show_locks.release()
+
+            failed_sources = {operation.get('src') for operation in self.failed_operations}
+            moved = [(operation['src'], operation['dst']) for job in jobs for operation in job
+                     if operation['op'] == 'move' and operation['src'] not in failed_sources]
+            moved_sources = {src for src, _ in moved}
+            planned = {operation['src'] for operation in plan.operations if operation['op'] == 'move'}
+            shows = sorted({job[0]['anime'] for job in jobs if 'anime' in job[0] and job[0]['src'] in moved_sources})
+
+            if self.folder_icons and shows:
+                self.make_icons(shows)
+
+            # Files that were not planned are not episodes, planned ones that did not get moved failed somewhere
+            skipped += [path for src, path in items.items() if src not in planned]
+            failed = [path for src, path in items.items() if src in planned and src not in moved_sources]
+            moved_bytes = sum(operation.get('size', 0) for job in jobs for operation in job
+                              if operation['op'] == 'move' and operation['src'] in moved_sources)
+            return SortResult(moved, skipped, failed, shows, moved_bytes)
+
+    async def sort_files_async(self, paths, reindex=False, executor=None):
+        # The same as sort_files for programs that run an event loop, the disk work runs in the executor
+        # None is the default executor of the loop
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(executor, self.sort_files, paths, reindex)
+
+    def sort_items(self, items_in_folder):
+        # Sorts the given items from the anime dir using the anime dictionary that is already loaded
+        # Returns the names of the anime that episodes were sorted for
+        plan, show_locks = self.plan_locked(items_in_folder)
+        try:
+            jobs = self.execute_plan(plan)
+        finally:
+            if show_locks:
+                show_locks.release()
+        return {job[0]['anime'] for job in jobs if 'anime' in job[0]}
+
+    def plan_items(self, items_in_folder):
+        with self.metrics.phase('plan'):
+            return self.build_plan(items_in_folder)
+
+    def build_plan(self, items_in_folder):
+        # Decides what has to happen to every item without touching the disk, the anime dictionary gets updated
+        # with the planned folders so later episodes of the same show end up in the right place
+        # All folders get created and renamed in order first, the episodes are moved after that
+        # This way the copies and moves can be done by multiple workers at the same time
+        plan = planner.Plan(self.dir_path, self.sort_dir, self.backup_dir)
+        transfers = []
+
+        for entry in items_in_folder:
+            # The items are names or the DirEntry objects of a scan, which already know their size
+            # Only the files with a video extension get a stat, everything else is skipped without a system call
+            if isinstance(entry, str):
+                item, path, stat = entry, os.path.join(self.dir_path, entry), None
+            else:
+                item, path = entry.name, entry.path
+                stat = scanner.entry_stat(entry) if self.media_detector.has_video_extension(item) else None
+
+            # Only videos with one of the EXTENSIONS from the config get sorted, when SNIFF is on the first bytes
+            # of the file also have to be a video container, this keeps other stuff with a video extension out of
+            # the folders
+            if self.media_detector.is_video(path, stat):
+                # The parser knows the nyaa format, S01E02, batches, version tags and anything from the config
+                # Results are cached by file name so seeing the same file again costs nothing
+                parse_start = time.perf_counter()
+                release = self.release_parser.parse(item)
+                self.metrics.add_time('parse', time.perf_counter() - parse_start)
+                if release is None:
                     # Executes if there is a MKV file in the directory but its not formatted in the correct way
                     self.logger.warning(f"Skipped {item} for not having the correct string format")
                     self.weak_error = True
+                    self.metrics.error('parse')
                     continue
 
+                subtitle_group = release.group
+                # Put the episode in the folder of the show even when the group wrote the name a bit differently
+                anime_name = self.match_show(release.title)
+
                 # If the anime this episode belongs to already has a folder made we only have to move it in there
                 if anime_name in self.anime_dict:
                     # Get the folder name associated with that anime
@@ -224,114 +1356,210 @@ class NyaaSort:
                         # This code should not trigger since it accounts for this error on dictionary creation
                         # Getting here means something went horribly wrong
                         self.logger.critical(f'Critical folder naming error for {anime_path}, anime: {anime_name}')
-                        input('Please fix the error and then reboot the script')
+                        self.logger.critical('Please fix the error and then reboot the script')
+                        self.weak_error = True
+                        self.metrics.error('folder_name')
                         break
 
                     # This check is done to see if the folder group matches the group that did the anime
-                    if folder_subtitle_group == 'Multiple groups' or folder_subtitle_group == subtitle_group:
-
-                        self.move_anime(item, anime_path)
-
-                    else:
+                    if folder_subtitle_group != 'Multiple groups' and folder_subtitle_group != subtitle_group:
                         # Rename the folder so you know you have episodes done by different groups
-
-                        self.rename_folder(item, anime_name, anime_path)
+                        self.plan_rename_folder(plan, anime_name, anime_path)
                 else:
                     # If we have not have a folder for the anime we will have to make a new one
-                    dirty_folder_name = f'[{subtitle_group}] {anime_name}'
-
-                    new_folder = self.create_folder(dirty_folder_name)
-
-                    self.logger.info(f"created a new folder for the show: {anime_name}")
-
-                    # Append the anime to our anime list
-                    try:
-                        self.anime_dict[anime_name] = dirty_folder_name
-
-                    except ValueError:
-                        # A valueError should only occur if the anime in question already has an entry
-                        # This should not be possible but if it happens
-                        # Updating the lists will hopefully resolve this error
-                        self.logger.error("Encountered an ValueError while attempting to update the dict")
-                        self.weak_error = True
-                        full_folders_dir = self.get_folders_in_dir()
-                        self.get_anime_dict(full_folders_dir)
-                        self.logger.info("Updated the lists to hopefully resolve the ValueError")
-
-                    # Move the anime in the new folder
-                    self.move_anime(item, new_folder)
+                    self.plan_create_folder(plan, anime_name, f'[{subtitle_group}] {anime_name}')
+
+                transfers.append((item, anime_name, stat.st_size if stat else None, release))
+
+        # The folder is only looked up now since it might have been renamed to [Multiple groups] after the
+        # episode was planned
+        for item, anime_name, item_size, release in transfers:
+            self.plan_move_anime(plan, item, self.anime_dict[anime_name], anime_name, item_size, release)
+
+        return plan
+
+    def match_show(self, anime_name):
+        # Returns the name the show has in the anime dictionary, or the name a new folder should get
+        # Names that are already in there are by far the most common, those never reach the matcher
+        if anime_name in self.anime_dict:
+            return anime_name
+
+        match_start = time.perf_counter()
+        if self.show_matcher is None:
+            self.show_matcher = matcher.ShowMatcher(self.anime_dict, self.match_threshold, self.aliases)
+        found = self.show_matcher.match(anime_name)
+        self.metrics.add_time('match', time.perf_counter() - match_start)
+
+        if found is None:
+            # A new show, if the name is an alias the folder gets the name it stands for
+            return self.show_matcher.canonical(anime_name)
+        self.logger.info(f"Sorting {anime_name} as {found}")
+        self.metrics.count('shows_matched')
+        return found
+
+    def dry_run(self, plan_out=None, reindex=False):
+        # Plans the sort without touching the disk and saves the plan so it can be checked or applied later
+        plan = self.plan_items(self.scan_anime_dir(reindex))
+
+        if plan_out:
+            plan.save(plan_out)
+            print(f"Saved the plan to {plan_out}")
+        else:
+            print(json.dumps(plan.to_dict(), indent=2))
+        print(plan.summary())
+        return plan
 
-        # Check if the user wanted folder icons
+    def apply_plan(self, plan_path):
+        # Runs a plan that was saved by dry_run
+        try:
+            plan = planner.Plan.load(plan_path)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Could not load the plan {plan_path}: {e}")
+            self.weak_error = True
+            self.metrics.error('plan')
+            return None
+
+        if plan.sort_dir != self.sort_dir or plan.backup_dir != self.backup_dir:
+            self.logger.warning(f"{plan_path} was made for different directories than the ones in {CONFIG_NAME}")
+
+        # Load the shows so the stored index gets updated with the folders the plan creates
+        self.recover_journal()
+        library_lock = self.open_library_lock()
+        show_locks = None
+        if library_lock:
+            # The plan is already made, so all there is left to do is waiting for other runs that sort its shows
+            try:
+                show_locks = library_lock.shows({operation['anime'] for operation in plan.operations
+                                                 if 'anime' in operation})
+            except OSError as e:
+                self.locks_failed(e)
+        self.load_anime_dict()
+        self.logger.info(plan.summary())
+        try:
+            self.execute_plan(plan)
+        finally:
+            if show_locks:
+                show_locks.release()
+        return plan
+
+    def watch(self, reindex=False, poll_interval=5, settle_time=2):
+        # Keeps running and sorts new episodes as soon as they are done downloading
+        # First sort whatever is already there, this also loads the anime dictionary which is kept warm from now on
+        watcher_module = lazy_import('watcher')
+        watcher = watcher_module.create_watcher(self.dir_path, poll_interval, self.logger)
+        self.recover_journal()
+        self.sort_items(self.scan_anime_dir(reindex))
         if self.folder_icons:
             self.make_icons()
 
-        # if any weak errors were encountered make sure the popup window from python does not disappear
-        if self.weak_error and self.logger.getEffectiveLevel() < 30:
-            input("Press any key to exit \n")
-
-    def rename_folder(self, item, anime_name, anime_path):
-        # Check if the directory of the anime file is the same as the sorting directory
-        if self.sort_dir:
-            # Set the path + wanted name of the anime
-            rename = os.path.join(self.sort_dir, f'[Multiple groups] {anime_name}')
-        else:
-            rename = os.path.join(self.dir_path, f'[Multiple groups] {anime_name}')
-
+        self.logger.info(f"Watching {self.dir_path} for new episodes using {type(watcher).__name__}")
         try:
-            # Rename the folder
-            if self.sort_dir:
-                os.rename(os.path.join(self.sort_dir, anime_path), rename)
-            else:
-                os.rename(os.path.join(self.dir_path, anime_path), rename)
-
-            # Change the name of the folder in the backup location
-            if self.backup_dir:
-                os.rename(os.path.join(self.backup_dir, anime_path),
-                          os.path.join(self.backup_dir, f'[Multiple groups] {anime_name}'))
-
-            self.logger.info(f"Renamed the folder for {anime_name}")
+            while True:
+                batch = watcher.next_batch(settle_time)
+                # Files which are already gone got sorted in an earlier batch or were removed by somebody else
+                batch = [item for item in batch if os.path.isfile(os.path.join(self.dir_path, item))]
+                if not batch:
+                    continue
 
-            try:
-                # Change our dict so it contains the new name of the folder
-                self.anime_dict.update({f'{anime_name}': f'[Multiple groups] {anime_name}'})
+                # Only walk the library again if somebody else changed it, checking that costs a single stat
+                if self.show_index and self.show_index.mtime_ns != self.show_index.library_mtime():
+                    self.logger.info("The sorted directory was changed by somebody else, reloading the shows")
+                    self.load_anime_dict()
 
-            except ValueError:
-                # Updating the lists will hopefully resolve this error
-                self.logger.error("Encountered an ValueError while attempting to update the dict")
-                self.weak_error = True
-                full_folders_dir = self.get_folders_in_dir()
-                self.get_anime_dict(full_folders_dir)
-                self.logger.info("Updated the lists to hopefully resolve the ValueError")
+                try:
+                    sorted_shows = self.sort_items(batch)
+                except OSError as e:
+                    # Do not let one broken batch stop the watcher, just start over with a fresh view of the library
+                    self.logger.error(f"Encountered {e} while sorting {batch}")
+                    self.weak_error = True
+                    self.metrics.error('watch')
+                    self.load_anime_dict(reindex=True)
+                    continue
 
-            # Move the anime to the new folder
-            self.move_anime(item, rename)
+                # Only look for icons of the shows that just got new episodes
+                if self.folder_icons and sorted_shows:
+                    self.make_icons(sorted_shows)
+                # A watcher never exits, so the metrics get written after every batch
+                self.export_metrics()
+        except KeyboardInterrupt:
+            self.logger.info("Stopped watching")
+        finally:
+            watcher.close()
+
+    def plan_rename_folder(self, plan, anime_name, anime_path):
+        # Rename the folder so you know you have episodes done by different groups
+        new_folder = f'[Multiple groups] {anime_name}'
+        library = self.library_dir()
+        plan.add('rename', os.path.join(library, new_folder), src=os.path.join(library, anime_path),
+                 anime=anime_name, folder=new_folder)
+
+        # Change the name of the folder in the backup location
+        if self.backup_dir:
+            plan.add('rename', os.path.join(self.backup_dir, new_folder), src=os.path.join(self.backup_dir, anime_path),
+                     anime=anime_name)
 
-        except FileNotFoundError:
-            self.logger.error(f"Encountered an error while attempting to rename folder {anime_path}")
-            self.logger.error(f'from {anime_path} to {rename}')
-            self.weak_error = True
+        # Change our dict so it contains the new name of the folder
+        self.anime_dict[anime_name] = new_folder
 
-    def create_folder(self, folder_name):
-        if self.sort_dir:
-            new_folder_path = os.path.join(self.sort_dir, folder_name)
-        else:
-            new_folder_path = os.path.join(self.dir_path, folder_name)
-        # I could not find a way to break os.makedir so no try except block here
-        os.makedirs(new_folder_path)
+    def rename_folder(self, item, anime_name, anime_path):
+        # Renames the folder right away and moves the episode of the other group into it
+        # Returns if the folder got renamed, when it did not the episode stays in the anime directory
+        plan = planner.Plan(self.dir_path, self.sort_dir, self.backup_dir)
+        self.plan_rename_folder(plan, anime_name, anime_path)
+        self.open_catalog()
+        for operation in plan.operations:
+            if not self.apply_operation(operation):
+                # Put the old name back since the folder was not renamed
+                self.anime_dict[anime_name] = anime_path
+                return False
+        self.save_catalog()
+        self.move_anime(item, self.anime_dict[anime_name])
+        return True
+
+    def plan_create_folder(self, plan, anime_name, folder_name):
+        plan.add('mkdir', os.path.join(self.library_dir(), folder_name), anime=anime_name, folder=folder_name)
 
         # Also create a folder in the backup location
         if self.backup_dir:
-            backup_folder_path = os.path.join(self.backup_dir, folder_name)
-            # I could not find a way to break os.makedir so no try except block here
-            os.makedirs(backup_folder_path)
+            plan.add('mkdir', os.path.join(self.backup_dir, folder_name), anime=anime_name)
+
+        # Append the anime to our anime list
+        self.anime_dict[anime_name] = folder_name
+        if self.show_matcher is not None:
+            self.show_matcher.add(anime_name)
 
-        return new_folder_path
+    def create_folder(self, folder_name):
+        # Creates the folder right away, every folder we create is named [group] anime
+        plan = planner.Plan(self.dir_path, self.sort_dir, self.backup_dir)
+        self.plan_create_folder(plan, folder_name.split('] ', 1)[-1], folder_name)
+        self.open_catalog()
+        for operation in plan.operations:
+            self.apply_operation(operation)
+        self.save_catalog()
+        return os.path.join(self.library_dir(), folder_name)
+
+    def ask(self, key, question=None):
+        # Settings that were not given as argument come from the NYAASORT_ environment variables first
+        # Only if those are not there either the user gets asked, None means there is no answer
+        value = os.environ.get(f'{ENV_PREFIX}{key}')
+        if value is not None:
+            return value
+        if self.interactive and question:
+            return input(question)
+        return None
+
+    def pause(self, message):
+        # Keeps the window open so the user can read what went wrong, without a terminal we just print it
+        if self.interactive:
+            input(message)
+        else:
+            print(message)
 
     def create_script(self, log_info, folder_icons):
         # Technically if log_info: would also work
         if log_info is None:
-            log_input = input("Do you want to enable logging?(Y/N)\n")
-            logging = 'True' if log_input.upper() == 'Y' or log_input.upper() == 'YES' else 'False'
+            log_input = self.ask('LOGGING', "Do you want to enable logging?(Y/N)\n") or ''
+            logging = 'True' if log_input.upper() in ('Y', 'YES', 'TRUE', '1') else 'False'
         else:
             if log_info in ["True", "False"]:
                 logging = log_info
@@ -339,32 +1567,53 @@ class NyaaSort:
                 logging = "True"
 
         if self.dir_path is None:
-            sort_place = input("In which directory is the anime you want to sort located?\n")
-            if os.path.exists(sort_place):
+            sort_place = self.ask('DIRECTORY', "In which directory is the anime you want to sort located?\n")
+            if sort_place and os.path.exists(sort_place):
                 self.dir_path = sort_place
             else:
                 print("Unrecognised folder, using base folder of the script")
                 self.dir_path = os.path.dirname(os.path.realpath(__file__))
 
         if self.sort_dir is None:
-            sort_place = input("In which directory should the sorted anime go?\n"
-                               "Keep this empty if you want the same directory as the place the anime is located\n")
-            if os.path.exists(sort_place):
+            sort_place = self.ask('SORTED_DIRECTORY', "In which directory should the sorted anime go?\n"
+                                                      "Keep this empty if you want the same directory as the place "
+                                                      "the anime is located\n")
+            if sort_place and os.path.exists(sort_place):
                 self.sort_dir = sort_place
             else:
                 print("Using same folder as -d")
                 self.sort_dir = None
 
         if self.backup_dir is None:
-            sort_place = input("In which directory should I backup the sorted anime?\n"
-                               "Keep this empty for no backups\n")
-            if os.path.exists(sort_place):
+            sort_place = self.ask('BACKUP_PATH', "In which directory should I backup the sorted anime?\n"
+                                                 "Keep this empty for no backups\n")
+            if sort_place and os.path.exists(sort_place):
                 self.backup_dir = sort_place
             else:
                 print("Creating no backups")
                 self.backup_dir = None
 
+        # The other settings are never asked, but they can come from the environment as well
+        icons_value = self.ask('ICONS') if folder_icons != "True" else None
+        if icons_value is not None:
+            try:
+                folder_icons = "True" if strtobool(icons_value) else "False"
+                self.folder_icons = folder_icons == "True"
+            except ValueError as e:
+                print(f"Ignoring an environment variable: {e}")
+        for key, attribute, convert in ENVIRONMENT_SETTINGS:
+            if getattr(self, attribute) is not None:
+                continue
+            value = self.ask(key)
+            if value is None:
+                continue
+            try:
+                setattr(self, attribute, convert(value))
+            except ValueError as e:
+                print(f"Ignoring an environment variable: {e}")
+
         # Get The user of this pc and the name of this file
+        from getpass import getuser
         user_name = getuser()
         file_name = os.path.basename(__file__)
 
@@ -382,13 +1631,14 @@ class NyaaSort:
                     bat_file.write(f'python {py_dir}\\{file_name}')
             except FileNotFoundError:
                 print("Try checking your pc username") if bool(logging) else 0
-                input("File directory for storing .bat file was not found")
+                self.pause("File directory for storing .bat file was not found")
             except Exception as e:
-                input(f'While opening the bat file {e} went wrong')
+                self.pause(f'While opening the bat file {e} went wrong')
         elif platform == "linux" or platform == "linux2":
             # linux
             print("The script can not automatically add itself to the boot-up process")
             print("Please copy this script to your /bin manually and add another corn job")
+            print("Or keep it running with --watch so new episodes get sorted as soon as they are downloaded")
         elif platform == "darwin":
             # OS X
             print("The script can not automatically add itself to the boot-up process")
@@ -410,6 +1660,25 @@ class NyaaSort:
             self.config['SORT']['DIRECTORY'] = self.dir_path
             self.config['SORT']['SORTED_DIRECTORY'] = str(self.sort_dir)
             self.config['SORT']['BACKUP_PATH'] = str(self.backup_dir)
+            self.config['SORT']['WORKERS'] = str(self.workers or 1)
+            self.config['SORT']['BACKUP_STRATEGY'] = self.backup_strategy or 'auto'
+            self.config['SORT']['VERIFY'] = str(bool(self.verify_backups))
+            self.config['SORT']['ICON_BACKEND'] = self.icon_backend or 'auto'
+            self.config['SORT']['SNIFF'] = str(bool(self.sniff_media))
+            self.config['SORT']['EXTENSIONS'] = ' '.join(media.DEFAULT_EXTENSIONS)
+            self.config['SORT']['MATCH_THRESHOLD'] = str(self.match_threshold if self.match_threshold is not None
+                                                         else matcher.DEFAULT_THRESHOLD)
+            self.config['SORT']['IO_SCHEDULER'] = str(bool(self.io_scheduler))
+            self.config['SORT']['BANDWIDTH_LIMIT'] = str(self.bandwidth_limit or 0)
+            self.config['SORT']['LOW_PRIORITY'] = str(bool(self.low_priority))
+            self.config['SORT']['LAYOUT'] = self.layout or layout.DEFAULT_LAYOUT
+            self.config['SORT']['DEDUPE_KEEP'] = ', '.join(dedupe.DEFAULT_KEEP)
+            self.config['SORT']['PREFERRED_GROUPS'] = ''
+            self.config['SORT']['TRASH_PATH'] = str(self.trash_dir)
+            self.config['SORT']['CATALOG'] = str(self.use_catalog is None or bool(self.use_catalog))
+            self.config['SORT']['LOCKING'] = str(self.locking is None or bool(self.locking))
+            self.config['SORT']['SPACE_RESERVE'] = str(self.space_reserve if self.space_reserve is not None
+                                                       else space.DEFAULT_RESERVE)
         except TypeError:
             print("Critical Type error while creating config, Trying to continue")
             self.config['SORT']['LOGGING'] = str(logging)
@@ -417,6 +1686,25 @@ class NyaaSort:
             self.config['SORT']['DIRECTORY'] = str(self.dir_path)
             self.config['SORT']['SORTED_DIRECTORY'] = str(self.sort_dir)
             self.config['SORT']['BACKUP_PATH'] = str(self.backup_dir)
+            self.config['SORT']['WORKERS'] = str(self.workers or 1)
+            self.config['SORT']['BACKUP_STRATEGY'] = str(self.backup_strategy or 'auto')
+            self.config['SORT']['VERIFY'] = str(bool(self.verify_backups))
+            self.config['SORT']['ICON_BACKEND'] = str(self.icon_backend or 'auto')
+            self.config['SORT']['SNIFF'] = str(bool(self.sniff_media))
+            self.config['SORT']['EXTENSIONS'] = ' '.join(media.DEFAULT_EXTENSIONS)
+            self.config['SORT']['MATCH_THRESHOLD'] = str(self.match_threshold if self.match_threshold is not None
+                                                         else matcher.DEFAULT_THRESHOLD)
+            self.config['SORT']['IO_SCHEDULER'] = str(bool(self.io_scheduler))
+            self.config['SORT']['BANDWIDTH_LIMIT'] = str(self.bandwidth_limit or 0)
+            self.config['SORT']['LOW_PRIORITY'] = str(bool(self.low_priority))
+            self.config['SORT']['LAYOUT'] = self.layout or layout.DEFAULT_LAYOUT
+            self.config['SORT']['DEDUPE_KEEP'] = ', '.join(dedupe.DEFAULT_KEEP)
+            self.config['SORT']['PREFERRED_GROUPS'] = ''
+            self.config['SORT']['TRASH_PATH'] = str(self.trash_dir)
+            self.config['SORT']['CATALOG'] = str(self.use_catalog is None or bool(self.use_catalog))
+            self.config['SORT']['LOCKING'] = str(self.locking is None or bool(self.locking))
+            self.config['SORT']['SPACE_RESERVE'] = str(self.space_reserve if self.space_reserve is not None
+                                                       else space.DEFAULT_RESERVE)
             print("Retry successful")
 
         try:
@@ -424,25 +1712,19 @@ class NyaaSort:
                 self.config.write(configfile)
         except FileNotFoundError:
             print("Try checking if your directory matches the file storage location") if logging else 0
-            input("Could not find file directory for storing the config file")
+            self.pause("Could not find file directory for storing the config file")
         except Exception as e:
-            input(f'While creating the bat file {e} went wrong')
+            self.pause(f'While creating the bat file {e} went wrong')
 
         # I have to use in a print since self.logger does not get defined until later in the setup
         print("Created new config")
 
-    def connect_to(self, url):
-        try:
-            return request.urlopen(url)
-        except ConnectionError:
-            self.logger.error(f"Failed to connect to {url}")
-        except TimeoutError:
-            self.logger.error(f"{url} took to long to respond")
-        except Exception as e:
-            self.logger.error(f"{e} went wrong while trying to connect to {url}")
-        return False
+    def make_icons(self, shows=None):
+        with self.metrics.phase('icons'):
+            return self.set_icons(shows)
 
-    def make_icons(self):
+    def set_icons(self, shows=None):
+        # Shows can be used to only look at a couple of anime instead of everything in the anime dictionary
         if not folder_icons_imports:
             self.logger.warning("Not all modules needed are imported, aborting")
             return
@@ -451,70 +1733,137 @@ class NyaaSort:
         self.logger.warning("Folder icon changes will not be displayed unless you refresh folder view")
         # TODO make it not so sensitive to edge cases, error testing
 
-        if not os.name == 'nt':
+        # The none backend does not touch the folders, so it is the only one that works outside of windows
+        backend_name = icons.resolve_backend(self.icon_backend)
+        if not os.name == 'nt' and backend_name != 'none':
             self.logger.error("This function will only work on windows")
             self.weak_error = True
+            self.metrics.error('icons')
             return
 
-        for anime in self.anime_dict:
-            if self.sort_dir:
-                full_image_path = os.path.join(self.sort_dir, self.anime_dict[anime], f"{anime}.ico")
-            else:
-                full_image_path = os.path.join(self.dir_path, self.anime_dict[anime], f"{anime}.ico")
-
-            if not os.path.exists(full_image_path):
-                # Transfer the anime name to html speak
-                url_name = parse.quote(anime)
-                url = f"https://myanimelist.net/search/all?q={url_name}&cat=all"
-                search_page = self.connect_to(url)
-                if not search_page:
-                    # If something went wrong while trying to connect just ignore this anime
-                    continue
+        # Only the anime which do not have an icon yet have to be looked up
+        missing_icons = []
+        for anime in self.anime_dict if shows is None else shows:
+            if not os.path.exists(os.path.join(self.library_dir(), self.anime_dict[anime], f"{anime}.ico")):
+                missing_icons.append(anime)
+        if not missing_icons:
+            return
 
-                soup = BeautifulSoup(search_page, 'html.parser')
-                # We are actually looking for the first item that will pop out when you hover you mouse over it
-                all_anime = soup.findAll("a", {"class": "hoverinfo_trigger"})
-                mal_anime = all_anime[0]['href']
+        # The fetcher looks up multiple anime at the same time, but never hits the site more than once a second
+        # Earlier lookups, including the ones that found nothing, are cached on disk
+        artwork = lazy_import('artwork')
+        imaging = lazy_import('imaging')
+        fetcher = artwork.ArtworkFetcher(self.return_artwork_cache_location(), self.logger)
+        with self.metrics.phase('artwork'):
+            images = fetcher.fetch_all(missing_icons)
+        self.metrics.count('artwork_missing', sum(1 for image in images.values() if image is None))
 
-                mal_anime_page = self.connect_to(mal_anime)
-                if not mal_anime_page:
-                    # If something went wrong while trying to connect just ignore this anime
-                    continue
+        # All the folders get collected and their icons are set in one go at the end
+        py_dir = os.path.dirname(os.path.realpath(__file__))
+        backend = icons.create_backend(backend_name, self.logger, os.path.join(py_dir, 'set_folder_ico.ps1'))
 
-                anime_soup = BeautifulSoup(mal_anime_page, 'html.parser')
-                # No clue why the image class is ac but its the one we need
-                anime_image_dirty = anime_soup.findAll("img", {"class": "ac"})
-                anime_image = anime_image_dirty[0]['data-src']
-                self.logger.info(f"{anime_image} was found for {anime}")
+        # Converting the images is pure cpu work, so that gets spread over all cores
+        with self.metrics.phase('images'):
+            icos = imaging.make_icos(images, self.logger)
 
-                # Save the image
-                try:
-                    request.urlretrieve(anime_image, full_image_path)
-                except Exception as e:
-                    self.logger.error(f"{e} went wrong while trying to save image {anime_image}")
-                    continue
+        for anime, ico in icos.items():
+            folder = os.path.join(self.library_dir(), self.anime_dict[anime])
+            full_image_path = os.path.join(folder, f"{anime}.ico")
 
-                # Reformat the image as .ico
-                img = Image.open(full_image_path)
-                img.resize((256, 256), Image.ANTIALIAS)
-                if self.sort_dir:
-                    ico_dir = os.path.join(self.sort_dir, self.anime_dict[anime], f"{anime}.ico")
-                else:
-                    ico_dir = os.path.join(self.dir_path, self.anime_dict[anime], f"{anime}.ico")
-                try:
-                    img.save(ico_dir, format='ICO')
-                except FileNotFoundError:
-                    self.logger.error(f"No directory {ico_dir}")
+            # Save the icon
+            try:
+                with open(full_image_path, 'wb') as image_file:
+                    image_file.write(ico)
+            except OSError as e:
+                self.logger.error(f"{e} went wrong while trying to save the icon of {anime}")
+                self.metrics.error('icons')
+                continue
+
+            backend.add(folder, anime)
+
+        applied = backend.apply()
+        self.metrics.count('icons_applied', applied)
+        self.logger.info(f"Set the folder icon of {applied} shows")
+        return backend
+
+    def devices(self):
+        # The devices this sorter reads from and writes to
+        return profiles.devices([self.dir_path, self.library_dir(), self.backup_dir])
+
+    @classmethod
+    def from_config(cls, profile=None, log_info=None, **kwargs):
+        # Creates a sorter from the existing config that never asks anything or waits for a key press
+        # This is how other programs should use NyaaSort, the arguments are the same as the ones of the constructor
+        # The config has to exist already. Creating it also adds the script to the boot-up, which a program that
+        # only embeds the sorter should not do behind the back of the user
+        if not os.path.exists(cls.return_ini_location()):
+            raise FileNotFoundError(f"There is no {CONFIG_NAME} yet, run NyaaSort.py once to create it, or run "
+                                    f"NyaaSort.py --non-interactive with the {ENV_PREFIX} environment variables")
+        kwargs['interactive'] = False
+        return cls(None, log_info, profile=profile, **kwargs)
+
+    @classmethod
+    def sort_profiles(cls, names=None, log_info=None, folder_icons="False", reindex=False, **kwargs):
+        # Sorts multiple [SORT:name] profiles in one go, all of them when no names are given
+        # Profiles on different disks run at the same time, the ones that share a disk run one after another
+        config = configparser.ConfigParser()
+        config.read(cls.return_ini_location())
+        available = profiles.profile_names(config)
+        if names is None:
+            names = available
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValueError(f"Unknown profiles {', '.join(unknown)}, {CONFIG_NAME} has {', '.join(available)}")
+
+        sorters = {}
+        for name in names:
+            try:
+                sorters[name] = cls(None, log_info, folder_icons, profile=name, **kwargs)
+            except ValueError as e:
+                # A profile that is set up wrong should not keep the others from being sorted
+                log.getLogger('NyaaSort Logger').error(f"Skipping the profile {name}: {e}")
+        shared_indexes = {}
+        for sorter in sorters.values():
+            sorter.shared_indexes = shared_indexes
+
+        groups = profiles.group_by_device([(name, sorter.devices()) for name, sorter in sorters.items()])
+        logger = next(iter(sorters.values())).logger if sorters else log.getLogger('NyaaSort Logger')
+        logger.info(f"Sorting {len(sorters)} profiles in {len(groups)} groups: {groups}")
+        profiles.run_groups(groups, lambda name: sorters[name].sort(reindex, interactive=False), logger)
+
+        # Only ask once for all profiles together
+        interactive = any(sorter.interactive for sorter in sorters.values())
+        if interactive and any(sorter.weak_error for sorter in sorters.values()) and logger.getEffectiveLevel() < 30:
+            input("Press any key to exit \n")
+        return sorters
 
-                # Here we call the powershell script to set the folder icon
-                if self.sort_dir:
-                    folder = os.path.join(self.sort_dir, self.anime_dict[anime])
-                else:
-                    folder = os.path.join(self.dir_path, self.anime_dict[anime])
-                ec = subprocess.call(
-                    ['powershell', "-ExecutionPolicy", "Unrestricted", "-File", './set_folder_ico.ps1', f'{folder}',
-                     f'{anime}'])
-                self.logger.info("Powershell returned: {0:d}".format(ec))
+    @staticmethod
+    def export_profile_metrics(sorters, json_path=None, prometheus_path=None):
+        # Every profile gets its own entry in the json and its own profile label in prometheus
+        metrics_by_profile = {name: sorter.metrics for name, sorter in sorters.items()}
+        if json_path:
+            metrics.save_profiles_json(json_path, metrics_by_profile)
+        if prometheus_path:
+            metrics.save_profiles_prometheus(prometheus_path, metrics_by_profile)
+
+    def journal_location(self):
+        # Profiles can run at the same time, so each of them gets its own journals, see journal.run_path
+        if self.profile is None:
+            return self.return_journal_location()
+        name = re.sub(r'[^\w.-]', '_', self.profile)
+        base, extension = os.path.splitext(self.return_journal_location())
+        return f'{base}-{name}{extension}'
+
+    def export_metrics(self):
+        # Writes the metrics of the run to the files that were asked for, a failure here never fails the sort
+        for path, save in ((self.metrics_json, self.metrics.save_json),
+                           (self.metrics_prometheus, self.metrics.save_prometheus)):
+            if not path:
+                continue
+            try:
+                save(path)
+            except OSError as e:
+                self.logger.warning(f"Could not write the metrics to {path}: {e}")
 
     @staticmethod
     def return_ini_location():
@@ -522,6 +1871,30 @@ class NyaaSort:
         py_dir = os.path.dirname(os.path.realpath(__file__))
         return os.path.join(py_dir, CONFIG_NAME)
 
+    @staticmethod
+    def return_journal_location():
+        # The journal of the running sort is stored right next to the ini file as well
+        py_dir = os.path.dirname(os.path.realpath(__file__))
+        return os.path.join(py_dir, journal.JOURNAL_NAME)
+
+    @staticmethod
+    def return_artwork_cache_location():
+        # The artwork lookups are cached next to the ini file
+        py_dir = os.path.dirname(os.path.realpath(__file__))
+        return os.path.join(py_dir, lazy_import('artwork').ARTWORK_CACHE_NAME)
+
+    @staticmethod
+    def return_catalog_location():
+        # The catalog of every library is stored right next to the ini file as well
+        py_dir = os.path.dirname(os.path.realpath(__file__))
+        return os.path.join(py_dir, lazy_import('catalog').CATALOG_NAME)
+
+    @staticmethod
+    def return_index_location():
+        # The show index is stored right next to the ini file
+        py_dir = os.path.dirname(os.path.realpath(__file__))
+        return os.path.join(py_dir, show_index.INDEX_NAME)
+
 
 if __name__ == '__main__':
     # Get arguments provided
@@ -532,6 +1905,83 @@ if __name__ == '__main__':
                                                                          "leave this blank for the same folder as -d ")
     parser.add_argument("-b", "--backup", required=False, help="If the script should store a backup of the anime "
                                                                "somewhere else")
+    parser.add_argument("-w", "--workers", required=False, type=int, help="How many episodes to copy and move at "
+                                                                          "the same time, 1 moves them one by one")
+    parser.add_argument("-s", "--backup_strategy", required=False, choices=fileops.BACKUP_STRATEGIES,
+                        help="How backups are made, auto picks the cheapest safe method for your disks")
+    parser.add_argument("--verify", action="store_true", default=None,
+                        help="Hash backups while they are being copied so they can be verified later")
+    parser.add_argument("--verify-backups", action="store_true", help="Check every backup that changed since it "
+                                                                      "was last hashed and report broken ones")
+    parser.add_argument("--watch", action="store_true", help="Keep running and sort new episodes as soon as they "
+                                                             "are done downloading")
+    parser.add_argument("--dry-run", action="store_true", help="Only plan the sort and print or save the plan, "
+                                                               "nothing on disk gets changed")
+    parser.add_argument("--plan-out", required=False, help="Where --dry-run should save the plan as json")
+    parser.add_argument("--apply", required=False, help="Run a plan that was saved with --dry-run --plan-out")
+    parser.add_argument("--icon_backend", required=False, choices=icons.ICON_BACKENDS,
+                        help="How folder icons get set, none only downloads the artwork")
+    parser.add_argument("--metrics-json", required=False, help="Write the timings and counters of the run to this "
+                                                                 "json file when it is done")
+    parser.add_argument("--metrics-prom", required=False, help="Write the metrics as a prometheus textfile, for the "
+                                                                 "textfile collector of the node exporter")
+    parser.add_argument("-p", "--profile", action="append", required=False,
+                        help="Sort the [SORT:name] profile of the config, can be given more than once")
+    parser.add_argument("--all-profiles", action="store_true", help="Sort every [SORT:name] profile of the config, "
+                                                                    "profiles on different disks run at the same time")
+    parser.add_argument("--non-interactive", action="store_true",
+                        help="Never ask anything, settings missing from the arguments are read from the NYAASORT_ "
+                             "environment variables")
+    parser.add_argument("--sniff", action="store_true", default=None,
+                        help="Read the first bytes of every video to make sure it really is a video container")
+    parser.add_argument("--reindex", action="store_true", help="Ignore the stored show index and walk the "
+                                                               "sorted directory again")
+    parser.add_argument("--layout", required=False,
+                        help="Where episodes go inside their show folder, like 'Season {season:02d}/{name}'")
+    parser.add_argument("--relayout", action="store_true",
+                        help="Move every episode already in the library to the layout, together with --dry-run "
+                             "it is only planned")
+    parser.add_argument("--io-scheduler", action="store_true", default=None,
+                        help="Make all backups first and then move all episodes, one disk at a time")
+    parser.add_argument("--bandwidth-limit", required=False, type=float,
+                        help="How many MB/s the copies may use together, 0 for no limit")
+    parser.add_argument("--low-priority", action="store_true", default=None,
+                        help="Copy with the lowest disk and cpu priority so playback does not stutter")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Find episodes that are in the sorted directory more than once, together with "
+                             "--dry-run they are only reported")
+    parser.add_argument("--trash", required=False, help="Where --dedupe moves the copies it does not keep, "
+                                                        "TRASH_PATH in the config by default")
+    parser.add_argument("--delete", action="store_true", help="Let --dedupe delete the copies when there is no "
+                                                              "trash directory")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="Let --dedupe also look for the same file under a different name")
+    parser.add_argument("--match-threshold", required=False, type=float,
+                        help="How alike the name of a show has to be to a show in the library to be sorted into it, "
+                             "1 only ignores case, punctuation and how the season is written")
+    parser.add_argument("--no-catalog", dest="use_catalog", action="store_false", default=None,
+                        help="Do not keep the sorted episodes in the catalog that query reads")
+    parser.add_argument("--no-locking", dest="locking", action="store_false", default=None,
+                        help="Do not lock the library and its shows, only when nothing else ever sorts into it")
+    parser.add_argument("--space-reserve", required=False, type=float,
+                        help="How many GB to keep free on every disk, episodes that do not fit wait for the next run")
+    parser.add_argument("--progress", action="store_true", help="Show the bytes per second, the time left and every "
+                                                                "episode that is done while sorting")
+    parser.add_argument("--progress-file", required=False,
+                        help="Append the progress as json lines to this file, for monitoring to tail")
+
+    # Everything above sorts, the subcommands only look at what was sorted
+    subparsers = parser.add_subparsers(dest="command")
+    query_parser = subparsers.add_parser("query", help="Look up the shows and episodes of the library in the catalog "
+                                                       "instead of walking the directories")
+    query_parser.add_argument("show", nargs="?", help="List the episodes of this show instead of all shows")
+    query_parser.add_argument("--group", required=False, help="Only the episodes released by this group")
+    query_parser.add_argument("--missing", action="store_true", help="List the episodes that are missing between the "
+                                                                     "ones the library has")
+    query_parser.add_argument("--json", action="store_true", help="Print the result as json, for scripts and "
+                                                                  "dashboards")
+    query_parser.add_argument("--rebuild", action="store_true", help="Walk the library once and replace the catalog "
+                                                                     "of it with what is on disk")
 
     if folder_icons_imports:
         parser.add_argument("-i", "--icons", required=False, help="create matching folder icons?: True/False")
@@ -546,12 +1996,12 @@ if __name__ == '__main__':
 
     if folder_icons_imports:
         if args.icons in ["True", "False"]:
-            icons = args.icons
+            icons_flag = args.icons
         else:
             # Folder icons is optional so we could just create a class without it. But let's not do that
-            icons = "False"
+            icons_flag = "False"
     else:
-        icons = "False"
+        icons_flag = "False"
 
     if args.directory:
         if os.path.exists(args.directory):
@@ -577,4 +2027,44 @@ if __name__ == '__main__':
     else:
         backup_dir = None
 
-    NyaaSort(dir_path=anime_dir, log_info=LOG_INFO, folder_icons=icons, s_dir=sort_dir, b_dir=backup_dir).sort()
+    settings = dict(workers=args.workers, backup_strategy=args.backup_strategy, verify_backups=args.verify,
+                    icon_backend=args.icon_backend, interactive=False if args.non_interactive else None,
+                    sniff_media=args.sniff, match_threshold=args.match_threshold, io_scheduler=args.io_scheduler,
+                    bandwidth_limit=args.bandwidth_limit, low_priority=args.low_priority, layout_template=args.layout,
+                    use_catalog=args.use_catalog, locking=args.locking, space_reserve=args.space_reserve,
+                    show_progress=args.progress, progress_file=args.progress_file)
+
+    if args.command == 'query':
+        # A profile only decides which library to look at, --all-profiles looks at every library in the catalog
+        nyaa_sort = NyaaSort(dir_path=anime_dir, log_info=LOG_INFO, folder_icons=icons_flag, s_dir=sort_dir,
+                             b_dir=backup_dir, profile=args.profile[0] if args.profile else None, **settings)
+        nyaa_sort.query_catalog(show=args.show, group=args.group, missing=args.missing, as_json=args.json,
+                                rebuild=args.rebuild, all_libraries=args.all_profiles)
+    elif args.profile or args.all_profiles:
+        # The directories come from the profiles, so -d, -o and -b are not used here
+        sorters = NyaaSort.sort_profiles(names=None if args.all_profiles else args.profile, log_info=LOG_INFO,
+                                         folder_icons=icons_flag, reindex=args.reindex, **settings)
+        NyaaSort.export_profile_metrics(sorters, args.metrics_json, args.metrics_prom)
+    else:
+        nyaa_sort = NyaaSort(dir_path=anime_dir, log_info=LOG_INFO, folder_icons=icons_flag, s_dir=sort_dir,
+                             b_dir=backup_dir, metrics_json=args.metrics_json, metrics_prometheus=args.metrics_prom,
+                             **settings)
+
+        try:
+            if args.verify_backups:
+                nyaa_sort.verify_backup_dir()
+            elif args.relayout:
+                nyaa_sort.relayout(dry_run=args.dry_run, plan_out=args.plan_out)
+            elif args.dedupe:
+                nyaa_sort.dedupe_library(trash_dir=args.trash, delete=args.delete, identical=args.near_duplicates,
+                                         dry_run=args.dry_run)
+            elif args.dry_run:
+                nyaa_sort.dry_run(plan_out=args.plan_out, reindex=args.reindex)
+            elif args.apply:
+                nyaa_sort.apply_plan(args.apply)
+            elif args.watch:
+                nyaa_sort.watch(reindex=args.reindex)
+            else:
+                nyaa_sort.sort(reindex=args.reindex)
+        finally:
+            nyaa_sort.export_metrics()
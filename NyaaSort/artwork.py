@@ -0,0 +1,213 @@
+import http.client
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import parse
+
+try:
+    from bs4 import BeautifulSoup
+except ModuleNotFoundError:
+    BeautifulSoup = None
+
+ARTWORK_CACHE_NAME = 'ArtworkCache.json'
+BASE_URL = 'https://myanimelist.net'
+
+# How long lookups are trusted, failed lookups are tried again a lot sooner since the show might just be new
+CACHE_TTL = 30 * 24 * 60 * 60
+NEGATIVE_TTL = 24 * 60 * 60
+
+# Errors worth trying again, everything else will not get better by waiting
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def find_anime_page(html):
+    # We are actually looking for the first item that will pop out when you hover you mouse over it
+    soup = BeautifulSoup(html, 'html.parser')
+    all_anime = soup.find_all("a", {"class": "hoverinfo_trigger"})
+    return all_anime[0]['href'] if all_anime else None
+
+
+def find_anime_image(html):
+    # No clue why the image class is ac but its the one we need
+    anime_soup = BeautifulSoup(html, 'html.parser')
+    anime_image_dirty = anime_soup.find_all("img", {"class": "ac"})
+    return anime_image_dirty[0].get('data-src') if anime_image_dirty else None
+
+
+class RateLimiter:
+    # Makes sure we never send more than a couple of requests per second to the same site
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ArtworkCache:
+    # Remembers which page and image belong to an anime, including the anime that could not be found
+
+    def __init__(self, path, ttl=CACHE_TTL, negative_ttl=NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.entries = {'search': {}, 'images': {}}
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                data = json.load(cache_file)
+            for section in self.entries:
+                if isinstance(data.get(section), dict):
+                    self.entries[section] = data[section]
+        except (OSError, ValueError, AttributeError):
+            pass
+        self.evict()
+
+    def expired(self, entry, now):
+        ttl = self.ttl if entry.get('url') else self.negative_ttl
+        return now - entry.get('time', 0) > ttl
+
+    def evict(self):
+        now = time.time()
+        with self.lock:
+            for section in self.entries.values():
+                for key in [key for key, entry in section.items() if self.expired(entry, now)]:
+                    del section[key]
+
+    def get(self, section, key):
+        # Returns (True, url) when we looked it up before, url being None for failed lookups, (False, None) otherwise
+        with self.lock:
+            entry = self.entries[section].get(key)
+        if entry is None or self.expired(entry, time.time()):
+            return False, None
+        return True, entry.get('url')
+
+    def set(self, section, key, url):
+        with self.lock:
+            self.entries[section][key] = {'url': url, 'time': time.time()}
+
+    def save(self):
+        # Every save gets its own temporary file, profiles that run at the same time all save the same cache
+        fd, temp_path = tempfile.mkstemp(prefix=f'{os.path.basename(self.path)}.', suffix='.tmp',
+                                         dir=os.path.dirname(self.path) or '.')
+        try:
+            with self.lock:
+                with open(fd, 'w', encoding='utf-8') as cache_file:
+                    json.dump(self.entries, cache_file)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+
+class ArtworkFetcher:
+
+    def __init__(self, cache_path, logger, base_url=BASE_URL, workers=4, requests_per_second=1.0, retries=3,
+                 backoff=1.0, timeout=15):
+        self.logger = logger
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = ArtworkCache(cache_path)
+        self.rate_limiter = RateLimiter(requests_per_second)
+        # Every worker keeps its own connections open, so we only pay for the tls handshake once per site
+        self.local = threading.local()
+
+    def connection(self, scheme, netloc):
+        connections = self.local.__dict__.setdefault('connections', {})
+        if (scheme, netloc) not in connections:
+            connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            connections[(scheme, netloc)] = connection_class(netloc, timeout=self.timeout)
+        return connections[(scheme, netloc)]
+
+    def drop_connection(self, scheme, netloc):
+        connection = self.local.__dict__.get('connections', {}).pop((scheme, netloc), None)
+        if connection:
+            connection.close()
+
+    def get(self, url, redirects=3):
+        # Returns the body of the url or None if it could not be fetched
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # Wait a bit longer after every failed attempt
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            parts = parse.urlsplit(url)
+            path = parts.path or '/'
+            if parts.query:
+                path += f'?{parts.query}'
+            self.rate_limiter.wait(parts.netloc)
+            try:
+                connection = self.connection(parts.scheme, parts.netloc)
+                connection.request('GET', path, headers={'User-Agent': 'NyaaSort'})
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self.logger.warning(f"{e} went wrong while trying to connect to {url}")
+                self.drop_connection(parts.scheme, parts.netloc)
+                continue
+
+            if response.status in (301, 302, 303, 307, 308) and redirects:
+                return self.get(parse.urljoin(url, response.getheader('Location', '')), redirects - 1)
+            if response.status == 200:
+                return body
+            if response.status not in RETRY_STATUSES:
+                self.logger.error(f"{url} returned {response.status}")
+                return None
+            self.logger.warning(f"{url} returned {response.status}, trying again")
+
+        self.logger.error(f"Failed to connect to {url}")
+        return None
+
+    def lookup(self, section, key, url, extract):
+        # Fetches the url and extracts a link from it, unless the answer is already in the cache
+        found, cached_url = self.cache.get(section, key)
+        if found:
+            return cached_url
+
+        page = self.get(url)
+        if page is None:
+            # A connection problem is not the same as the anime not existing, so do not remember it
+            return None
+        result = extract(page)
+        self.cache.set(section, key, result)
+        return result
+
+    def fetch(self, anime):
+        # Returns the image of the anime as bytes or None if it could not be found
+        search_url = f"{self.base_url}/search/all?q={parse.quote(anime)}&cat=all"
+        anime_page = self.lookup('search', anime, search_url, find_anime_page)
+        if not anime_page:
+            return None
+
+        anime_image = self.lookup('images', anime_page, anime_page, find_anime_image)
+        if not anime_image:
+            return None
+        self.logger.info(f"{anime_image} was found for {anime}")
+        return self.get(anime_image)
+
+    def fetch_all(self, animes):
+        # Looks up the images of all anime at the same time, the rate limit keeps us friendly to the site
+        animes = list(animes)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            images = dict(zip(animes, pool.map(self.fetch, animes)))
+        try:
+            self.cache.save()
+        except OSError as e:
+            self.logger.warning(f"Could not save the artwork cache: {e}")
+        return images
@@ -0,0 +1,242 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+try:
+    from . import layout, scanner, show_index
+except ImportError:
+    import layout
+    import scanner
+    import show_index
+
+CATALOG_NAME = 'Catalog.sqlite3'
+
+# Everything that can go wrong with the database itself, the caller does not have to import sqlite3 for this
+Error = sqlite3.Error
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shows (
+    id INTEGER PRIMARY KEY,
+    library TEXT NOT NULL,
+    name TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    group_name TEXT,
+    UNIQUE (library, name)
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    path TEXT PRIMARY KEY,
+    show_id INTEGER NOT NULL REFERENCES shows (id) ON DELETE CASCADE,
+    group_name TEXT,
+    season INTEGER,
+    episode REAL,
+    version INTEGER,
+    resolution TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    backup_path TEXT,
+    sorted_at REAL
+);
+CREATE INDEX IF NOT EXISTS shows_name ON shows (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS episodes_show ON episodes (show_id, season, episode);
+CREATE INDEX IF NOT EXISTS episodes_group ON episodes (group_name);
+CREATE INDEX IF NOT EXISTS episodes_backup ON episodes (backup_path);
+'''
+
+# A show of the library together with what the catalog knows about its episodes
+ShowSummary = namedtuple('ShowSummary', ['library', 'name', 'folder', 'group', 'episodes', 'size'])
+# A single episode, path and backup_path are full paths and backup_path is None when there is no backup of it
+CatalogEpisode = namedtuple('CatalogEpisode', ['library', 'show', 'path', 'group', 'season', 'episode', 'version',
+                                               'resolution', 'size', 'mtime_ns', 'backup_path'])
+
+
+def prefix_range(path):
+    # Everything inside a folder sorts between folder/ and folder0, since 0 comes right after / (and ] after \)
+    # Comparing against those two uses the index on the path, where LIKE 'folder/%' would read every row
+    return path + os.sep, path + chr(ord(os.sep) + 1)
+
+
+class Catalog:
+    # Every show and every episode the sort put into a library, so questions about the library can be answered
+    # without walking it. The catalog is kept up to date with every operation that runs, see record
+    # Multiple libraries share the same file, every show belongs to the library it was sorted into
+
+    def __init__(self, path, parser):
+        self.path = path
+        self.parser = parser
+        # The workers all record their own operations, sqlite connections do not like being used by two threads at once
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        # Every change is its own short transaction, a transaction that stays open during a copy would lock out the
+        # profiles and the other runs that sort at the same time. With a write ahead log those commits are cheap and
+        # nobody who only reads has to wait for them
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        # The catalog can always be rebuilt from the library, so it does not need to survive a power cut
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.executescript(SCHEMA)
+        # The backups that were made this run but of which the episode did not get moved yet, src -> backup
+        self.backups = {}
+
+    def save(self):
+        # Everything is committed right away, this is only left for the changes of whoever used the connection
+        with self.lock:
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    def show_id(self, library, name, folder=None):
+        # Returns the id of the show, it gets added when it is not in the catalog yet
+        row = self.connection.execute('SELECT id, folder FROM shows WHERE library = ? AND name = ?',
+                                      (library, name)).fetchone()
+        if row is not None:
+            if folder is not None and row[1] != folder:
+                self.connection.execute('UPDATE shows SET folder = ?, group_name = ? WHERE id = ?',
+                                        (folder, show_index.folder_group(folder), row[0]))
+            return row[0]
+        if folder is None:
+            return None
+        return self.connection.execute('INSERT INTO shows (library, name, folder, group_name) VALUES (?, ?, ?, ?)',
+                                       (library, name, folder, show_index.folder_group(folder))).lastrowid
+
+    def rename_path(self, src, dst):
+        # A file or a folder got renamed, this moves the episodes in it along whether they are in the library or
+        # the backups. OR REPLACE lets an episode that was overwritten make room for the one that took its place
+        start, end = prefix_range(src)
+        for column in ('path', 'backup_path'):
+            self.connection.execute(f'UPDATE OR REPLACE episodes SET {column} = ? || substr({column}, ?) '
+                                    f'WHERE {column} = ? OR ({column} >= ? AND {column} < ?)',
+                                    (dst, len(src) + 1, src, start, end))
+
+    def add_episode(self, library, anime_name, path, backup_path):
+        # The folder of the show is the first part of the path inside the library
+        relative = os.path.relpath(path, library)
+        folder = relative.split(os.sep, 1)[0]
+        if folder in (os.curdir, os.pardir) or folder == relative:
+            return
+        stat = os.stat(path)
+        name = os.path.basename(path)
+        release = self.parser.parse(name)
+        if anime_name is None:
+            anime_name = folder.split('] ', 1)[-1]
+        show_id = self.show_id(library, anime_name, folder)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO episodes (path, show_id, group_name, season, episode, version, resolution, size, '
+            'mtime_ns, backup_path, sorted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, show_id, release.group if release else None, release.season if release else None,
+             release.episode if release else None, release.version if release else None,
+             release.resolution if release else None, stat.st_size, stat.st_mtime_ns, backup_path, time.time()))
+
+    def record(self, operation, library):
+        # Called after an operation of a plan succeeded, see planner for what the operations look like
+        op = operation['op']
+        library = os.path.realpath(library)
+        with self.lock, self.connection:
+            if op == 'mkdir' and 'folder' in operation:
+                self.show_id(library, operation.get('anime'), operation['folder'])
+            elif op == 'rename':
+                if 'folder' in operation:
+                    self.show_id(library, operation.get('anime'), operation['folder'])
+                self.rename_path(os.path.realpath(operation['src']), os.path.realpath(operation['dst']))
+            elif op == 'copy':
+                # The episode is only added once it is moved, that is also when we know where it ended up
+                self.backups[operation['src']] = os.path.realpath(operation['dst'])
+                return
+            elif op == 'move':
+                self.add_episode(library, operation.get('anime'), os.path.realpath(operation['dst']),
+                                 self.backups.pop(operation['src'], None))
+
+    def remove(self, paths):
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM episodes WHERE path = ?',
+                                        ((os.path.realpath(path),) for path in paths))
+
+    def rebuild(self, library, backup_dir, media_detector):
+        # Replaces everything the catalog knows about the library with what is on disk right now
+        # Returns the amount of episodes that were found
+        library = os.path.realpath(library)
+        backup_dir = os.path.realpath(backup_dir) if backup_dir else None
+        folders = [folder for folder in scanner.list_folders(library) if '] ' in folder]
+        episodes = []
+        for folder in folders:
+            for relative in layout.iter_episodes(os.path.join(library, folder)):
+                if not media_detector.has_video_extension(os.path.basename(relative)):
+                    continue
+                backup_path = os.path.join(backup_dir, folder, relative) if backup_dir else None
+                episodes.append((folder, os.path.join(library, folder, relative),
+                                 backup_path if backup_path and os.path.exists(backup_path) else None))
+
+        with self.lock:
+            with self.connection:
+                # Deleting the shows removes their episodes as well
+                self.connection.execute('DELETE FROM shows WHERE library = ?', (library,))
+                for folder, path, backup_path in episodes:
+                    try:
+                        self.add_episode(library, folder.split('] ', 1)[1], path, backup_path)
+                    except OSError:
+                        # It got removed while we were looking
+                        continue
+                # Shows without any episodes are part of the library as well
+                for folder in folders:
+                    self.show_id(library, folder.split('] ', 1)[1], folder)
+        return len(episodes)
+
+    def shows(self, library=None, name=None, group=None):
+        # The shows with their amount of episodes and total size, group only counts the episodes of that group
+        conditions, values = self.filters(library, name)
+        join = 'LEFT JOIN episodes ON episodes.show_id = shows.id'
+        if group is not None:
+            join += ' AND episodes.group_name = ?'
+            values.insert(0, group)
+        query = (f'SELECT shows.library, shows.name, shows.folder, shows.group_name, COUNT(episodes.path), '
+                 f'COALESCE(SUM(episodes.size), 0) FROM shows {join}{conditions} GROUP BY shows.id '
+                 f'ORDER BY shows.name COLLATE NOCASE')
+        with self.lock:
+            rows = self.connection.execute(query, values).fetchall()
+        return [ShowSummary(*row) for row in rows if group is None or row[4]]
+
+    def episodes(self, library=None, name=None, group=None):
+        conditions, values = self.filters(library, name)
+        if group is not None:
+            conditions += ' AND episodes.group_name = ?' if conditions else ' WHERE episodes.group_name = ?'
+            values.append(group)
+        query = (f'SELECT shows.library, shows.name, episodes.path, episodes.group_name, episodes.season, '
+                 f'episodes.episode, episodes.version, episodes.resolution, episodes.size, episodes.mtime_ns, '
+                 f'episodes.backup_path FROM episodes JOIN shows ON episodes.show_id = shows.id{conditions} '
+                 f'ORDER BY shows.name COLLATE NOCASE, episodes.season, episodes.episode, episodes.path')
+        with self.lock:
+            rows = self.connection.execute(query, values).fetchall()
+        return [CatalogEpisode(*row) for row in rows]
+
+    def missing(self, library=None, name=None):
+        # The episodes that are not there between the first episode and the last one we have, per show and season
+        # Returns {(library, show): [(season, episode), ...]}, shows that are not missing anything are left out
+        numbers = {}
+        for episode in self.episodes(library, name):
+            if episode.episode is None:
+                continue
+            numbers.setdefault((episode.library, episode.show), {}).setdefault(episode.season or 1, set()).add(
+                int(episode.episode))
+        result = {}
+        for show, seasons in numbers.items():
+            gaps = [(season, number) for season, have in sorted(seasons.items())
+                    for number in range(min(min(have), 1), max(have) + 1) if number not in have]
+            if gaps:
+                result[show] = gaps
+        return result
+
+    @staticmethod
+    def filters(library, name):
+        conditions = []
+        values = []
+        if library is not None:
+            conditions.append('shows.library = ?')
+            values.append(os.path.realpath(library))
+        if name is not None:
+            conditions.append('shows.name = ? COLLATE NOCASE')
+            values.append(name)
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', values
@@ -0,0 +1,165 @@
+import os
+import shutil
+from collections import namedtuple
+
+try:
+    from . import layout, scanner, verify
+except ImportError:
+    import layout
+    import scanner
+    import verify
+
+# What decides which copy of an episode is kept, tried from left to right until one of them makes a difference
+KEEP_POLICIES = ('group', 'version', 'size')
+DEFAULT_KEEP = ('group', 'version', 'size')
+
+# Files of the same size are told apart by hashing this much of the start and the end, never the whole file
+PARTIAL_HASH_SIZE = 1024 * 1024
+
+# A single file in the library, show is the name of the anime from the folder it is in
+Episode = namedtuple('Episode', ['path', 'show', 'group', 'season', 'episode', 'version', 'size'])
+# kind is 'episode' for copies of the same episode and 'identical' for the same file under another name
+Duplicates = namedtuple('Duplicates', ['kind', 'keep', 'remove'])
+DedupeResult = namedtuple('DedupeResult', ['episodes', 'duplicates', 'removed', 'bytes_reclaimed', 'failed'])
+
+
+def parse_keep(value):
+    # Raises ValueError when the config asks for something we do not know
+    policy = tuple(part.strip().lower() for part in value.replace(',', ' ').split())
+    unknown = [part for part in policy if part not in KEEP_POLICIES]
+    if unknown:
+        raise ValueError(f"Unknown keep policy {', '.join(unknown)}, use {', '.join(KEEP_POLICIES)}")
+    return policy
+
+
+def index_library(library_dir, parser, media_detector):
+    # Every video in every show folder of the library, including the season folders a layout might have made
+    # The files that can not be parsed are left out
+    episodes = []
+    for folder in scanner.scan(library_dir):
+        if not folder.is_dir() or '] ' not in folder.name:
+            continue
+        show = folder.name.split('] ', 1)[1]
+        for relative in layout.iter_episodes(folder.path):
+            name = os.path.basename(relative)
+            if not media_detector.has_video_extension(name):
+                continue
+            release = parser.parse(name)
+            if release is None:
+                continue
+            path = os.path.join(folder.path, relative)
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                continue
+            episodes.append(Episode(path, show, release.group, release.season, release.episode, release.version,
+                                    size))
+    return episodes
+
+
+def partial_hash(path, size, chunk_size=PARTIAL_HASH_SIZE):
+    # Hashes the size together with the first and last chunk of the file, enough to tell videos apart
+    hasher = verify.new_hasher()
+    hasher.update(str(size).encode())
+    with open(path, 'rb') as read_file:
+        hasher.update(read_file.read(chunk_size))
+        if size > chunk_size:
+            read_file.seek(max(size - chunk_size, chunk_size))
+            hasher.update(read_file.read(chunk_size))
+    return hasher.hexdigest()
+
+
+def keep_key(episode, policy, preferred_groups):
+    # Higher is better for every part of the key
+    key = []
+    for part in policy:
+        if part == 'group':
+            # Groups earlier in the list are preferred, groups that are not in there come last
+            key.append(-preferred_groups.index(episode.group) if episode.group in preferred_groups
+                       else -len(preferred_groups))
+        elif part == 'version':
+            # No version tag means it is the first version
+            key.append(episode.version or 1)
+        elif part == 'size':
+            key.append(episode.size)
+    # Same score, keep the same one every run
+    key.append(os.path.basename(episode.path))
+    return tuple(key)
+
+
+def pick(kind, episodes, policy, preferred_groups):
+    ranked = sorted(episodes, key=lambda episode: keep_key(episode, policy, preferred_groups), reverse=True)
+    return Duplicates(kind, ranked[0], ranked[1:])
+
+
+def find_duplicates(episodes, policy=DEFAULT_KEEP, preferred_groups=(), identical=False, logger=None):
+    # Copies of the same episode of a show, no matter which group made them or which version they are
+    # Batches and specials without an episode number are never seen as a copy of something
+    preferred_groups = list(preferred_groups)
+    by_episode = {}
+    for episode in episodes:
+        if episode.episode is not None:
+            by_episode.setdefault((episode.show, episode.season, episode.episode), []).append(episode)
+
+    duplicates = []
+    removed = set()
+    for copies in by_episode.values():
+        if len(copies) > 1:
+            duplicates.append(pick('episode', copies, policy, preferred_groups))
+            removed.update(episode.path for episode in duplicates[-1].remove)
+
+    if identical:
+        # The same file under another name, only files with the same size can be the same so only those are read
+        by_size = {}
+        for episode in episodes:
+            if episode.path not in removed and episode.size:
+                by_size.setdefault(episode.size, []).append(episode)
+        for same_size in by_size.values():
+            if len(same_size) < 2:
+                continue
+            by_hash = {}
+            for episode in same_size:
+                try:
+                    by_hash.setdefault(partial_hash(episode.path, episode.size), []).append(episode)
+                except OSError as e:
+                    if logger:
+                        logger.warning(f"Could not read {episode.path}: {e}")
+            duplicates.extend(pick('identical', copies, policy, preferred_groups)
+                              for copies in by_hash.values() if len(copies) > 1)
+    return duplicates
+
+
+def unique_path(path):
+    # An earlier run might have trashed a copy with the same name already, that one is kept as well
+    base, extension = os.path.splitext(path)
+    number = 1
+    while os.path.lexists(path):
+        path = f'{base} ({number}){extension}'
+        number += 1
+    return path
+
+
+def remove_duplicates(duplicates, library_dir, trash_dir, logger):
+    # Moves every copy that is not kept to the trash dir, with the same show folder it had in the library
+    # Without a trash dir the copies are deleted
+    removed = 0
+    bytes_reclaimed = 0
+    failed = []
+    for group in duplicates:
+        for episode in group.remove:
+            try:
+                if trash_dir:
+                    destination = os.path.join(trash_dir, os.path.relpath(episode.path, library_dir))
+                    os.makedirs(os.path.dirname(destination), exist_ok=True)
+                    destination = unique_path(destination)
+                    shutil.move(episode.path, destination)
+                else:
+                    os.remove(episode.path)
+            except OSError as e:
+                logger.error(f"Could not remove the duplicate {episode.path}: {e}")
+                failed.append(episode.path)
+                continue
+            logger.info(f"Removed {episode.path}, keeping {group.keep.path}")
+            removed += 1
+            bytes_reclaimed += episode.size
+    return removed, bytes_reclaimed, failed
@@ -0,0 +1,149 @@
+import errno
+import os
+import shutil
+
+try:
+    import fcntl
+except ModuleNotFoundError:
+    # Windows has no fcntl, reflinks are simply not available there
+    fcntl = None
+
+BACKUP_STRATEGIES = ('copy', 'hardlink', 'reflink', 'auto')
+
+# ioctl number of FICLONE on linux, clones the whole file on btrfs and xfs without copying any data
+FICLONE = 0x40049409
+
+# The errors you get back when the kernel or file system can not do a certain kind of copy
+UNSUPPORTED_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EPERM,
+                      errno.EBADF)
+
+# Used by the fallback copy when there is nothing better available
+COPY_BUFSIZE = 1024 * 1024
+# With a bandwidth limit the kernel copies in pieces of this size, so the throttle gets a say every few megabytes
+THROTTLE_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def same_device(path_a, path_b):
+    # Hardlinks, reflinks and renames only work when both paths are on the same file system
+    try:
+        return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+    except OSError:
+        return False
+
+
+def reflink(src, dst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform", dst)
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            # Do not leave an empty file behind, the caller will fall back to a normal copy
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copymode(src, dst)
+
+
+def _kernel_copy(fd_in, fd_out, size, throttle=None):
+    # Let the kernel move the data around instead of reading it into python first
+    # Returns False if the kernel could not do it before a single byte was copied
+    chunk_size = THROTTLE_CHUNK_SIZE if throttle else size
+    for name in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, name):
+            continue
+        copy_function = getattr(os, name)
+        offset = 0
+        try:
+            while offset < size:
+                if name == 'copy_file_range':
+                    copied = copy_function(fd_in, fd_out, min(size - offset, chunk_size))
+                else:
+                    copied = copy_function(fd_out, fd_in, offset, min(size - offset, chunk_size))
+                if copied == 0:
+                    break
+                offset += copied
+                if throttle:
+                    throttle(copied)
+            return True
+        except OSError as e:
+            # Only try the next method if nothing has been written yet, otherwise the copy is broken
+            if offset == 0 and e.errno in UNSUPPORTED_ERRORS:
+                continue
+            raise
+    return False
+
+
+def kernel_copy(src, dst, throttle=None):
+    # Throttle is called with the amount of bytes after every piece that got copied, it can sleep to slow us down
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        if not _kernel_copy(fsrc.fileno(), fdst.fileno(), size, throttle):
+            while True:
+                buffer = fsrc.read(COPY_BUFSIZE)
+                if not buffer:
+                    break
+                fdst.write(buffer)
+                if throttle:
+                    throttle(len(buffer))
+    shutil.copymode(src, dst)
+
+
+class FileOps:
+
+    def __init__(self, dir_path, sort_dir, backup_dir, strategy, logger, throttle=None):
+        self.logger = logger
+        self.strategy = strategy
+        # Called with the amount of bytes every copy wrote, see scheduler.Throttle
+        self.throttle = throttle
+        self.backup_method = 'copy'
+        self.move_same_device = True
+
+        # Check on which devices everything is located only once per run instead of for every episode
+        if backup_dir:
+            backup_same_device = same_device(dir_path, backup_dir)
+            if strategy == 'auto':
+                # A reflink is a real copy as far as the user is concerned, so it is the cheapest safe method
+                # Hardlinks would share the data with the sorted episode so those are never picked automatically
+                self.backup_method = 'reflink' if backup_same_device else 'copy'
+            elif strategy in ('hardlink', 'reflink') and not backup_same_device:
+                self.logger.warning(f"Can not use {strategy} since {backup_dir} is on a different device, "
+                                    f"falling back to copying")
+            else:
+                self.backup_method = strategy
+        if sort_dir:
+            self.move_same_device = same_device(dir_path, sort_dir)
+
+        self.logger.debug(f"Using {self.backup_method} for backups, moves on the same device: "
+                          f"{self.move_same_device}")
+
+    def backup(self, src, dst):
+        if self.backup_method == 'hardlink':
+            try:
+                return os.link(src, dst)
+            except OSError as e:
+                self.logger.warning(f"Could not hardlink {src} ({e}), copying it instead")
+        elif self.backup_method == 'reflink':
+            try:
+                return reflink(src, dst)
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRORS:
+                    raise
+                # The file system does not support it, no point in trying it again for the next episodes
+                self.logger.info("The file system does not support reflinks, copying backups instead")
+                self.backup_method = 'copy'
+        kernel_copy(src, dst, self.throttle)
+
+    def move(self, src, dst):
+        if self.move_same_device:
+            try:
+                return os.rename(src, dst)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                self.move_same_device = False
+        # Different devices, copy it over and remove the original afterwards
+        kernel_copy(src, dst, self.throttle)
+        shutil.copystat(src, dst)
+        os.remove(src)
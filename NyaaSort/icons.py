@@ -0,0 +1,150 @@
+import os
+from abc import ABC, abstractmethod
+
+# auto uses desktop_ini on windows, none does not touch the folders at all so the pipeline can run anywhere
+ICON_BACKENDS = ('auto', 'powershell', 'desktop_ini', 'none')
+
+# Windows refuses command lines longer than 32767 characters, stay well below that
+MAX_COMMAND_LENGTH = 30000
+
+# The number behind IconResource is 0 for the first item
+# The viewstate is how the folder is displayed 4 is for details
+# https://hwiegman.home.xs4all.nl/desktopini.html good reading material
+DESKTOP_INI = ("[.ShellClassInfo]\r\n"
+               "IconResource={folder}\\{anime}.ico,0\r\n"
+               "[ViewState]\r\n"
+               "Vid=\r\n"
+               "FolderType=Pictures\r\n"
+               "Mode=4\r\n")
+
+# Attributes windows needs before it reads the desktop.ini of a folder
+FILE_ATTRIBUTE_READONLY = 0x1
+FILE_ATTRIBUTE_HIDDEN = 0x2
+FILE_ATTRIBUTE_SYSTEM = 0x4
+FILE_ATTRIBUTE_ARCHIVE = 0x20
+
+
+def resolve_backend(name):
+    if name == 'auto':
+        return 'desktop_ini'
+    return name
+
+
+def batch_arguments(pending, max_length=MAX_COMMAND_LENGTH):
+    # Splits the folders over as few command lines as possible, every folder takes a folder and an anime argument
+    batches = []
+    batch = []
+    length = 0
+    for folder, anime in pending:
+        # The quotes and spaces around every argument count as well
+        size = len(folder) + len(anime) + 6
+        if batch and length + size > max_length:
+            batches.append(batch)
+            batch = []
+            length = 0
+        batch.extend((folder, anime))
+        length += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class IconBackend(ABC):
+    # Collects the folders that should get an icon, apply sets all of them at once
+    # The icon of a folder is always {folder}/{anime}.ico
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.pending = []
+
+    def add(self, folder, anime):
+        self.pending.append((folder, anime))
+
+    def apply(self):
+        # Returns the amount of folders that got an icon
+        pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+        return self.apply_batch(pending)
+
+    @abstractmethod
+    def apply_batch(self, pending):
+        pass
+
+
+class PowerShellBackend(IconBackend):
+    # Starting powershell takes a lot longer than setting the icon, so it only gets started once per batch
+
+    def __init__(self, logger, script_path, max_length=MAX_COMMAND_LENGTH):
+        super().__init__(logger)
+        self.script_path = script_path
+        self.max_length = max_length
+
+    def apply_batch(self, pending):
+        # Only imported here since starting up without it is a lot faster
+        import subprocess
+        applied = 0
+        for arguments in batch_arguments(pending, self.max_length):
+            ec = subprocess.call(['powershell', "-ExecutionPolicy", "Unrestricted", "-File", self.script_path,
+                                  *arguments])
+            self.logger.info("Powershell returned: {0:d}".format(ec))
+            if ec == 0:
+                applied += len(arguments) // 2
+        return applied
+
+
+class DesktopIniBackend(IconBackend):
+    # Writes the desktop.ini files straight from python, no other process has to be started at all
+
+    @staticmethod
+    def set_attributes(path, attributes):
+        if os.name != 'nt':
+            # Only windows reads desktop.ini files, the other systems do not have these attributes
+            return
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        current = kernel32.GetFileAttributesW(path)
+        if current == -1 or current == 0xFFFFFFFF:
+            raise ctypes.WinError()
+        if not kernel32.SetFileAttributesW(path, current | attributes):
+            raise ctypes.WinError()
+
+    def apply_batch(self, pending):
+        applied = 0
+        for folder, anime in pending:
+            ini_path = os.path.join(folder, 'desktop.ini')
+            if os.path.exists(ini_path):
+                self.logger.warning(f"The desktop.ini file of {folder} already exists")
+                continue
+            try:
+                # Explorer only reads non ascii names from a desktop.ini saved as utf-16
+                with open(ini_path, 'w', encoding='utf-16', newline='') as ini_file:
+                    ini_file.write(DESKTOP_INI.format(folder=folder, anime=anime))
+                self.set_attributes(ini_path, FILE_ATTRIBUTE_HIDDEN | FILE_ATTRIBUTE_SYSTEM | FILE_ATTRIBUTE_ARCHIVE)
+                # Windows only looks for a desktop.ini in read only folders
+                self.set_attributes(folder, FILE_ATTRIBUTE_READONLY)
+                applied += 1
+            except OSError as e:
+                self.logger.error(f"{e} went wrong while setting the icon of {folder}")
+        return applied
+
+
+class NullBackend(IconBackend):
+    # Does not change anything, used to test and benchmark the icon pipeline on every operating system
+
+    def __init__(self, logger):
+        super().__init__(logger)
+        self.applied = []
+
+    def apply_batch(self, pending):
+        self.applied.extend(pending)
+        return len(pending)
+
+
+def create_backend(name, logger, script_path):
+    name = resolve_backend(name)
+    if name == 'powershell':
+        return PowerShellBackend(logger, script_path)
+    if name == 'desktop_ini':
+        return DesktopIniBackend(logger)
+    return NullBackend(logger)
@@ -0,0 +1,69 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image
+except ModuleNotFoundError:
+    Image = None
+
+# Every size windows might show a folder icon at, the ico holds all of them so nothing gets scaled at display time
+ICO_SIZES = ((16, 16), (24, 24), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256))
+ICON_SIZE = 256
+
+# Batches with less poster data than this are converted in this process, starting the processes costs more than
+# the little bit of work they would take over. A 225x318 poster is about 30 KB
+PROCESS_MIN_BYTES = 2 * 1024 ** 2
+
+# What converting a single poster can go wrong with, a poster that is too big to decode safely and a process that
+# died while converting it included. These only cost the icon of that show
+CONVERT_ERRORS = (OSError, ValueError, BrokenProcessPool) + ((Image.DecompressionBombError,) if Image else ())
+
+
+def make_ico(image_bytes, size=ICON_SIZE, sizes=ICO_SIZES):
+    # Turns a downloaded poster into a square multi resolution ico, everything happens in memory
+    image = Image.open(io.BytesIO(image_bytes))
+    # For jpegs the decoder can already scale down by 2, 4 or 8, which is a lot cheaper than decoding everything
+    image.draft('RGB', (size, size))
+    # reduce() throws away whole blocks of pixels, so only the last bit has to be done by the expensive filter
+    factor = min(image.width, image.height) // size
+    if factor > 1:
+        image = image.reduce(factor)
+    image = image.convert('RGBA')
+    image.thumbnail((size, size), Image.LANCZOS)
+
+    # Posters are higher than they are wide, center them on a transparent square so the icon is not stretched
+    icon = Image.new('RGBA', (size, size))
+    icon.paste(image, ((size - image.width) // 2, (size - image.height) // 2))
+
+    output = io.BytesIO()
+    icon.save(output, format='ICO', sizes=sizes)
+    return output.getvalue()
+
+
+def make_icos(images, logger, workers=None):
+    # Builds the icons of every anime at the same time, one process per core since this is all cpu work
+    # Returns a dict with the ico bytes of every anime whose image could be converted
+    images = {anime: image for anime, image in images.items() if image is not None}
+    icos = {}
+    if not images:
+        return icos
+    workers = min(workers or os.cpu_count() or 1, len(images))
+
+    if workers == 1 or sum(len(image) for image in images.values()) < PROCESS_MIN_BYTES:
+        for anime, image in images.items():
+            try:
+                icos[anime] = make_ico(image)
+            except CONVERT_ERRORS as e:
+                logger.error(f"{e} went wrong while converting the image of {anime}")
+        return icos
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {anime: pool.submit(make_ico, image) for anime, image in images.items()}
+        for anime, future in futures.items():
+            try:
+                icos[anime] = future.result()
+            except CONVERT_ERRORS as e:
+                logger.error(f"{e} went wrong while converting the image of {anime}")
+    return icos
@@ -0,0 +1,306 @@
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    from . import locks, planner
+except ImportError:
+    import locks
+    import planner
+
+JOURNAL_NAME = 'SortJournal.jsonl'
+
+# The run that writes a journal holds a lock on this byte until it is done, far past anything that gets written
+# A journal nobody holds the lock of belongs to a run that died, the lock is gone as soon as its process is
+OWNER_BYTE = 1 << 30
+
+# A journal without a plan is either a run that is just starting or one that died right away, only the last kind
+# gets cleaned up
+EMPTY_AGE = 60
+
+# The journals this process has open. The locks of the file system belong to the process, so it would happily hand
+# the lock of a journal one of its own threads is writing to another one of them
+OPEN_JOURNALS = set()
+OPEN_JOURNALS_LOCK = threading.Lock()
+
+
+def run_path(base):
+    # Every run gets a journal of its own, runs that overlap would otherwise read and overwrite each others plans
+    root, extension = os.path.splitext(base)
+    return f'{root}-{os.getpid()}-{os.urandom(16).hex()}{extension}'
+
+
+def find_journals(base):
+    # The journals of every run made by run_path from base, and the single one older versions wrote to base itself
+    folder, name = os.path.split(base)
+    root, extension = os.path.splitext(name)
+    pattern = re.compile(re.escape(root) + r'(?:-\d+-[0-9a-f]{32})?' + re.escape(extension))
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.join(folder, name) for name in names if pattern.fullmatch(name))
+
+
+def claim(path):
+    # Locks the journal of a run that is gone, returns the file descriptor that holds the lock
+    # None when its run is still going, another run is recovering it or it is gone already
+    with OPEN_JOURNALS_LOCK:
+        if path in OPEN_JOURNALS:
+            return None
+        OPEN_JOURNALS.add(path)
+    fd = None
+    try:
+        fd = os.open(path, os.O_RDWR)
+        if locks.lock_range(fd, OWNER_BYTE, 1, False):
+            return fd
+    except FileNotFoundError:
+        pass
+    if fd is not None:
+        os.close(fd)
+    with OPEN_JOURNALS_LOCK:
+        OPEN_JOURNALS.discard(path)
+    return None
+
+
+def release(path, fd, remove):
+    # Lets go of a claimed journal, a recovered one is emptied first so a run that opened it in the meantime finds
+    # nothing left to do
+    try:
+        if remove:
+            os.ftruncate(fd, 0)
+    finally:
+        os.close(fd)
+        with OPEN_JOURNALS_LOCK:
+            OPEN_JOURNALS.discard(path)
+    if remove:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def is_abandoned(fd):
+    # Returns if a journal without a plan was left behind by a run that died before it could write one
+    return time.time() - os.fstat(fd).st_mtime > EMPTY_AGE
+
+
+class Journal:
+    # Append only log of a running plan, if the process dies the next run can finish what was started
+    # The whole plan is written and synced before the first operation, after that every operation gets a start
+    # and a done line. The done lines are only synced in batches since replaying an operation twice is harmless
+
+    def __init__(self, path, sync_every=32, sync_interval=1.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.positions = {}
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        # The workers all write to the same journal
+        self.lock = threading.Lock()
+        self.file = None
+
+    def write(self, record, sync=False):
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            self.unsynced += 1
+            if sync or self.unsynced >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_interval:
+                os.fsync(self.file.fileno())
+                self.unsynced = 0
+                self.last_sync = time.monotonic()
+
+    def begin(self, plan):
+        self.positions = {id(operation): number for number, operation in enumerate(plan.operations)}
+        with OPEN_JOURNALS_LOCK:
+            OPEN_JOURNALS.add(self.path)
+        try:
+            self.file = open(self.path, 'w', encoding='utf-8')
+            # Other runs leave the journal alone for as long as this lock is held
+            locks.lock_range(self.file.fileno(), OWNER_BYTE, 1, True)
+            # Windows locks from the current position, so go back to the start before anything gets written
+            self.file.seek(0)
+            self.write({'type': 'plan', 'plan': plan.to_dict()}, sync=True)
+        except BaseException:
+            # Half a plan would only trip up the next run
+            self.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            raise
+
+    def started(self, operation):
+        if id(operation) in self.positions:
+            self.write({'type': 'start', 'op': self.positions[id(operation)]})
+
+    def done(self, operation):
+        if id(operation) in self.positions:
+            self.write({'type': 'done', 'op': self.positions[id(operation)]})
+
+    def finish(self):
+        # Everything got run, there is nothing left to recover so the journal can go
+        # It is emptied while the lock is still held, a run that opens it before it is removed finds nothing to do
+        self.file.truncate(0)
+        self.close()
+        os.remove(self.path)
+
+    def close(self):
+        # Stops writing and lets go of the lock, from now on the next run finishes what is left of the plan
+        try:
+            if self.file:
+                self.file.close()
+        finally:
+            with OPEN_JOURNALS_LOCK:
+                OPEN_JOURNALS.discard(self.path)
+
+
+def read_journal(path, fd=None):
+    # Returns the plan and the numbers of the operations that are done, None if there is nothing to recover
+    # A claimed journal is read through the descriptor of the claim. Closing any other descriptor of the file, even
+    # a duplicate, drops every fcntl lock this process holds on it and another run could claim it as well
+    if fd is not None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        journal_file = os.fdopen(fd, 'r', encoding='utf-8', closefd=False)
+    elif os.path.exists(path):
+        journal_file = open(path, 'r', encoding='utf-8')
+    else:
+        return None
+
+    plan = None
+    done = set()
+    empty = True
+    with journal_file:
+        for line in journal_file:
+            empty = False
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line might only be half written when the power went out
+                continue
+            if record.get('type') == 'plan':
+                plan = planner.Plan.from_dict(record['plan'])
+            elif record.get('type') == 'done':
+                done.add(record['op'])
+    if empty:
+        # A run that is just starting or one that just finished
+        return None
+    if plan is None:
+        raise ValueError(f"{path} does not start with a plan")
+    return plan, done
+
+
+def remove_partial(path, size, logger):
+    # A destination that does not have the planned size is an interrupted copy, it can not be trusted
+    try:
+        if size is not None and os.path.isfile(path) and os.path.getsize(path) != size:
+            logger.warning(f"Removing the partial copy {path}")
+            os.remove(path)
+    except OSError as e:
+        logger.error(f"Could not remove the partial copy {path}: {e}")
+
+
+def undo_structural(operations, logger):
+    # Puts the folders of a show back the way they were before the sort, last operation first
+    # Folders that were made are only removed when nothing ended up in them
+    # Returns the amount of operations that got undone
+    undone = 0
+    for operation in reversed(operations):
+        try:
+            if operation['op'] == 'rename':
+                if os.path.exists(operation['dst']) and not os.path.exists(operation['src']):
+                    os.rename(operation['dst'], operation['src'])
+                    logger.warning(f"Renamed {operation['dst']} back to {operation['src']}")
+                    undone += 1
+            elif os.path.isdir(operation['dst']) and not os.listdir(operation['dst']):
+                os.rmdir(operation['dst'])
+                undone += 1
+        except OSError as e:
+            logger.error(f"Encountered {e} while rolling back the {operation['op']} of {operation['dst']}")
+    return undone
+
+
+def replay(plan, done, file_ops, logger):
+    # Runs every operation that is not done yet again, every operation checks the disk first so it is safe to
+    # run operations which did finish but whose done line never made it to the disk
+    # When a folder of a show can not be made or renamed anymore the other folders of that show are put back the way
+    # they were, so the library and the backups never end up with a different folder for the same show. Its episodes
+    # that were not moved yet stay in the anime directory for the next run
+    # Returns the amount of operations that were replayed, rolled back and abandoned since their episode is gone
+    replayed = 0
+    rolled_back = 0
+    abandoned = 0
+
+    # A backup might have to be made from the sorted episode if the original was already moved
+    moved_to = {operation['src']: operation['dst'] for operation in plan.operations if operation['op'] == 'move'}
+    failed_shows = set()
+
+    # The folders come first, just like when the plan was run
+    for number, operation in enumerate(plan.operations):
+        op = operation['op']
+        if number in done or op not in planner.STRUCTURAL_OPERATIONS or operation.get('anime') in failed_shows:
+            continue
+        src = operation.get('src')
+        dst = operation['dst']
+        try:
+            if op == 'mkdir':
+                os.makedirs(dst, exist_ok=True)
+                replayed += 1
+            elif os.path.exists(src) and not os.path.exists(dst):
+                os.rename(src, dst)
+                replayed += 1
+            elif not os.path.exists(dst):
+                raise FileNotFoundError(f"{src} is gone")
+        except OSError as e:
+            logger.warning(f"Could not finish the {op} of {dst}: {e}")
+            abandoned += 1
+            failed_shows.add(operation.get('anime'))
+
+    for anime in failed_shows:
+        rolled_back += undo_structural([operation for operation in plan.operations
+                                        if operation['op'] in planner.STRUCTURAL_OPERATIONS
+                                        and operation.get('anime') == anime], logger)
+
+    for number, operation in enumerate(plan.operations):
+        op = operation['op']
+        if number in done or op not in planner.TRANSFER_OPERATIONS:
+            continue
+        src = operation['src']
+        dst = operation['dst']
+        size = operation.get('size')
+        if operation.get('anime') in failed_shows:
+            # The folder it was going to is not there anymore, the next run sorts it again
+            remove_partial(dst, size, logger)
+            continue
+
+        try:
+            if op == 'copy':
+                if os.path.isfile(dst) and size is not None and os.path.getsize(dst) == size:
+                    # The backup was finished, only the done line got lost
+                    continue
+                source = src if os.path.isfile(src) else moved_to.get(src)
+                remove_partial(dst, size, logger)
+                if source and os.path.isfile(source):
+                    file_ops.backup(source, dst)
+                    replayed += 1
+                else:
+                    logger.warning(f"Could not finish the backup {dst}, the episode is gone")
+                    abandoned += 1
+            elif os.path.isfile(src):
+                # The move might have been a copy between devices that got interrupted, just do it again
+                remove_partial(dst, size, logger)
+                file_ops.move(src, dst)
+                replayed += 1
+            elif not os.path.isfile(dst):
+                logger.warning(f"Could not finish moving {src}, it is gone")
+                abandoned += 1
+        except OSError as e:
+            # Without the partial copy the episode is back to where it was before the sort
+            logger.error(f"Encountered {e} while replaying {op} of {src}")
+            remove_partial(dst, size, logger)
+            rolled_back += 1
+
+    return replayed, rolled_back, abandoned
@@ -0,0 +1,87 @@
+import os
+
+try:
+    from . import release_parser, scanner
+except ImportError:
+    import release_parser
+    import scanner
+
+# Where an episode goes inside the folder of its show, {name} is the file name so by default every episode is put
+# straight into the show folder like it always was
+DEFAULT_LAYOUT = '{name}'
+
+# Used to check a layout from the config before anything gets sorted with it
+SAMPLE_NAME = '[SubsPlease] Vinland Saga S02E05v2 (1080p) [ABCD1234].mkv'
+
+
+def fields(name, release):
+    # Everything a layout can use, the fields of the release together with the name of the file
+    values = release._asdict()
+    values['name'] = name
+    # Shows without a season in the name are their first season
+    values['season'] = release.season or 1
+    if values['extension'] is None:
+        values['extension'] = os.path.splitext(name)[1][1:]
+    return values
+
+
+def episode_path(template, name, release):
+    # Returns the path of the episode relative to its show folder
+    # Anything that can not be filled in for this episode, or a path that would leave the show folder, keeps the file
+    # name so an episode is never lost
+    if template == DEFAULT_LAYOUT or release is None:
+        return name
+    try:
+        relative = os.path.normpath(template.format(**fields(name, release)))
+    except (KeyError, IndexError, ValueError, TypeError, AttributeError):
+        return name
+    if os.path.isabs(relative) or relative.split(os.sep)[0] in ('..', '.', '') or os.path.splitdrive(relative)[0]:
+        return name
+    return relative
+
+
+def validate(template):
+    # Raises ValueError when the layout can not be used
+    if not template:
+        raise ValueError("The layout is empty")
+    release = release_parser.parse(SAMPLE_NAME)
+    try:
+        relative = template.format(**fields(SAMPLE_NAME, release))
+    except (KeyError, IndexError, ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"The layout {template} can not be filled in: {e!r}")
+    if episode_path(template, SAMPLE_NAME, release) == SAMPLE_NAME and relative != SAMPLE_NAME:
+        raise ValueError(f"The layout {template} has to stay inside the show folder")
+
+
+def iter_episodes(show_folder):
+    # Every file in the show folder and the folders in it, as paths relative to the show folder
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        for entry in scanner.scan(os.path.join(show_folder, relative_dir)):
+            relative = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+            if entry.is_dir():
+                pending.append(relative)
+            elif entry.is_file():
+                yield relative
+
+
+def remove_empty_folders(folders, library_dirs):
+    # Removes the folders in the show folders that were left empty after their episodes got moved, deepest first
+    # The show folders themselves, which are the folders straight inside one of the library dirs, are always kept
+    roots = {os.path.normpath(path) for path in library_dirs}
+    candidates = set()
+    for folder in folders:
+        folder = os.path.normpath(folder)
+        while os.path.dirname(folder) not in roots and os.path.dirname(folder) != folder:
+            candidates.add(folder)
+            folder = os.path.dirname(folder)
+    removed = 0
+    for folder in sorted(candidates, key=lambda path: path.count(os.sep), reverse=True):
+        try:
+            os.rmdir(folder)
+            removed += 1
+        except OSError:
+            # Something else is still in there
+            pass
+    return removed
@@ -0,0 +1,204 @@
+import errno
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ModuleNotFoundError:
+    # Windows has no fcntl, msvcrt can lock byte ranges of a file as well
+    fcntl = None
+    import msvcrt
+
+try:
+    from . import matcher
+except ImportError:
+    import matcher
+
+# Lives in the library itself so every run that sorts into it sees the same file, also from other computers
+LOCK_NAME = '.nyaasort.lock'
+
+# The file is never written to, the locks are on byte ranges of it
+# Byte 0 is the library lock, every show has one of the bytes after it. Two shows that end up on the same byte only
+# wait for each other, that is the price of never having to create or clean up a file per show
+LIBRARY_BYTE = 0
+SHOW_SLOTS = 1 << 20
+
+# How often windows checks again if a lock became free, it has no way to wait for one
+POLL_INTERVAL = 0.1
+
+# The open lock files of this process, see LockFile
+FILES = {}
+FILES_LOCK = threading.Lock()
+# msvcrt locks from the current position of the file, which all threads share
+SEEK_LOCK = threading.Lock()
+
+
+def show_byte(name):
+    # Names that only differ in case or punctuation are the same show, see matcher
+    return LIBRARY_BYTE + 1 + zlib.crc32(matcher.normalize(name).encode('utf-8')) % SHOW_SLOTS
+
+
+def lock_range(fd, offset, length, blocking):
+    # Returns False when the range is locked by another process and blocking is off
+    # fcntl locks are the ones that work over NFS, the server hands them out and drops them once the lease of a
+    # computer that crashed runs out. flock would only lock the file on the computer that asked for it
+    if fcntl is None:
+        while True:
+            try:
+                with SEEK_LOCK:
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, length)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+            time.sleep(POLL_INTERVAL)
+    try:
+        fcntl.lockf(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB, length, offset)
+        return True
+    except OSError as e:
+        if e.errno in (errno.EACCES, errno.EAGAIN):
+            return False
+        raise
+
+
+def unlock_range(fd, offset, length):
+    if fcntl is None:
+        with SEEK_LOCK:
+            os.lseek(fd, offset, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, length)
+    else:
+        fcntl.lockf(fd, fcntl.LOCK_UN, length, offset)
+
+
+class LockFile:
+    # The lock file of a library, shared by every sorter of this process
+    # The locks of the file system belong to the process, so two threads would both get the same lock and closing the
+    # file anywhere drops all of them. That is why there is a single open file per library and the threads of this
+    # process wait for each other with the condition before they ask the file system
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        self.condition = threading.Condition()
+        # The bytes held by a thread of this process, and if one of them holds every show, see LibraryLock.everything
+        self.held = set()
+        self.all_shows = False
+
+    @classmethod
+    def open(cls, library_dir):
+        path = os.path.realpath(os.path.join(library_dir, LOCK_NAME))
+        with FILES_LOCK:
+            lock_file = FILES.get(path)
+            if lock_file is None or not lock_file.is_current():
+                # The file got removed or replaced, locks on the old one would not keep anybody out anymore
+                if lock_file is not None and not lock_file.held:
+                    os.close(lock_file.fd)
+                lock_file = FILES[path] = cls(path)
+            return lock_file
+
+    def is_current(self):
+        try:
+            current = os.stat(self.path)
+        except OSError:
+            return False
+        opened = os.fstat(self.fd)
+        return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+
+    def in_use(self, offset):
+        return offset in self.held or (self.all_shows and offset != LIBRARY_BYTE)
+
+    def acquire(self, offsets, blocking=True):
+        # Locks all the bytes in order, so two runs that want the same shows can never wait on each other forever
+        # Returns the byte that is in use when blocking is off and not everything could be locked, None otherwise
+        taken = []
+        for offset in sorted(set(offsets)):
+            with self.condition:
+                while self.in_use(offset):
+                    if not blocking:
+                        self.release(taken)
+                        return offset
+                    self.condition.wait()
+                self.held.add(offset)
+            try:
+                locked = lock_range(self.fd, offset, 1, blocking)
+            except OSError:
+                self.release(taken)
+                self.release([offset], unlock=False)
+                raise
+            if not locked:
+                self.release(taken)
+                self.release([offset], unlock=False)
+                return offset
+            taken.append(offset)
+        return None
+
+    def release(self, offsets, unlock=True):
+        with self.condition:
+            for offset in offsets:
+                if unlock:
+                    unlock_range(self.fd, offset, 1)
+                self.held.discard(offset)
+            self.condition.notify_all()
+
+
+class LibraryLock:
+    # Advisory locks on a library, every sorter of every process and computer that sorts into it uses the same ones
+    # The library lock is only held while a run plans and picks its shows, the show locks are held until the
+    # episodes of those shows are moved. So runs that sort different shows only wait on each other for the planning
+
+    def __init__(self, library_dir):
+        self.lock_file = LockFile.open(library_dir)
+
+    @contextmanager
+    def library(self):
+        self.lock_file.acquire([LIBRARY_BYTE])
+        try:
+            yield
+        finally:
+            self.lock_file.release([LIBRARY_BYTE])
+
+    def shows(self, names, blocking=True):
+        # Returns the held ShowLocks, or the name of a show another run is busy with when blocking is off
+        by_byte = {show_byte(name): name for name in names}
+        busy = self.lock_file.acquire(by_byte, blocking)
+        if busy is not None:
+            return by_byte[busy]
+        return ShowLocks(self.lock_file, list(by_byte))
+
+    @contextmanager
+    def everything(self):
+        # The library lock and every show, for the work that can touch any show in the library
+        # Locking the bytes one by one would take forever, so the whole range is locked in one go
+        lock_file = self.lock_file
+        with self.library():
+            # Other processes are kept out by the file system, the threads of this one have to let go of their shows
+            with lock_file.condition:
+                while lock_file.held - {LIBRARY_BYTE}:
+                    lock_file.condition.wait()
+                lock_file.all_shows = True
+            try:
+                lock_range(lock_file.fd, LIBRARY_BYTE + 1, SHOW_SLOTS, True)
+                try:
+                    yield
+                finally:
+                    unlock_range(lock_file.fd, LIBRARY_BYTE + 1, SHOW_SLOTS)
+            finally:
+                with lock_file.condition:
+                    lock_file.all_shows = False
+                    lock_file.condition.notify_all()
+
+
+class ShowLocks:
+    # The locks of the shows a run is working on
+
+    def __init__(self, lock_file, offsets):
+        self.lock_file = lock_file
+        self.offsets = offsets
+
+    def release(self):
+        self.lock_file.release(self.offsets)
+        self.offsets = []
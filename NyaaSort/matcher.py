@@ -0,0 +1,135 @@
+import math
+import re
+import unicodedata
+
+# How alike two show names have to be before they count as the same show, 1 only allows names that are the same
+# after the normalization below
+DEFAULT_THRESHOLD = 0.8
+
+# Everything that is not a letter or a number is only there to make the name look nice
+PUNCTUATION = re.compile(r'[\W_]+')
+NUMBERS = re.compile(r'\d+')
+
+ORDINALS = {'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'fifth': 5, 'sixth': 6, 'seventh': 7, 'eighth': 8,
+            'ninth': 9, 'tenth': 10}
+# Season 2, 2nd Season, Second Season and S02 are all written as s2
+SEASON = re.compile(r'\b(?:season (?P<number>\d+)|(?P<ordinal>\d+)(?:st|nd|rd|th) season|s0*(?P<short>\d+)|'
+                    r'(?P<word>' + '|'.join(ORDINALS) + r') season)\b')
+
+
+def season_token(match):
+    if match.group('word'):
+        return f's{ORDINALS[match.group("word")]}'
+    number = match.group('number') or match.group('ordinal') or match.group('short')
+    return f's{int(number)}'
+
+
+def normalize(title):
+    # Groups write the same show in a lot of ways, Shingeki no Kyojin (The Final Season) and
+    # Shingeki no Kyojin - The Final Season should both end up as shingeki no kyojin the final season
+    if not title.isascii():
+        # Pokémon and Pokemon are the same show
+        title = unicodedata.normalize('NFKD', title)
+        title = ''.join(character for character in title if not unicodedata.combining(character))
+    title = PUNCTUATION.sub(' ', title.casefold()).strip()
+    return SEASON.sub(season_token, title)
+
+
+def trigrams(key):
+    # The spaces around the name make sure the first and last letters count as much as the rest
+    padded = f'  {key} '
+    return frozenset(padded[index:index + 3] for index in range(len(padded) - 2))
+
+
+def similarity(first, second):
+    # Jaccard similarity of two trigram sets
+    if not first or not second:
+        return 0.0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+class ShowMatcher:
+    # Finds the show in the library a new episode belongs to when the group spelled the name a bit differently
+    # Every show is stored by its normalized name, so most lookups cost a single dictionary lookup
+    # Anything else is looked up through an inverted index of trigrams, only the shows that share one of the rarest
+    # trigrams of the name can reach the threshold so those are the only ones that get compared
+    # The index is split by the amount of trigrams of a show, shows that are a lot shorter or longer than the name
+    # can not reach the threshold either so those are never even looked at
+
+    def __init__(self, shows=(), threshold=DEFAULT_THRESHOLD, aliases=None):
+        self.threshold = threshold
+        # Normalized name -> name of the show in the library
+        self.keys = {}
+        self.names = []
+        self.grams = []
+        self.numbers = []
+        self.longest = 0
+        # Trigram -> amount of trigrams of a show -> ids of the shows that contain it
+        self.postings = {}
+        # Trigram -> amount of shows that contain it
+        self.frequency = {}
+        # Normalized alias -> the name it stands for, as written in the config
+        self.aliases = {}
+        for alias, title in (aliases or {}).items():
+            self.aliases[normalize(alias)] = title
+        for show in shows:
+            self.add(show)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, show):
+        # The first show with a normalized name wins, just like the first folder of a show does in the anime dict
+        key = normalize(show)
+        if key in self.keys:
+            return
+        self.keys[key] = show
+        show_id = len(self.names)
+        grams = trigrams(key)
+        self.names.append(show)
+        self.grams.append(grams)
+        self.longest = max(self.longest, len(grams))
+        # Season 2 and season 3 of a show look almost the same, but they should never be put in the same folder
+        self.numbers.append(NUMBERS.findall(key))
+        for gram in grams:
+            self.postings.setdefault(gram, {}).setdefault(len(grams), []).append(show_id)
+            self.frequency[gram] = self.frequency.get(gram, 0) + 1
+
+    def canonical(self, title):
+        # The name an alias in the config stands for, any other title is returned as is
+        return self.aliases.get(normalize(title), title)
+
+    def match(self, title):
+        # Returns the name of the show in the library the title belongs to, None if it is a new show
+        key = normalize(self.canonical(title))
+        if key in self.keys:
+            return self.keys[key]
+        if self.threshold >= 1:
+            return None
+
+        grams = trigrams(key)
+        numbers = NUMBERS.findall(key)
+        rarest = sorted(grams, key=lambda gram: self.frequency.get(gram, 0))
+        # Shows that are a lot shorter or longer than the name can not reach the threshold
+        shortest = math.ceil(self.threshold * len(grams) - 1e-9)
+        longest = math.floor(len(grams) / self.threshold + 1e-9) if self.threshold else self.longest
+
+        best, best_score = None, 0.0
+        seen = set()
+        for size in range(shortest, min(longest, self.longest) + 1):
+            # A show of this size needs to share this many trigrams with the name to reach the threshold, so it has
+            # to share at least one of the rarest len(grams) - needed + 1, the small number keeps rounding errors out
+            needed = math.ceil(self.threshold * (len(grams) + size) / (1 + self.threshold) - 1e-9)
+            for gram in rarest[:len(grams) - needed + 1]:
+                for show_id in self.postings.get(gram, {}).get(size, ()):
+                    if show_id in seen:
+                        continue
+                    seen.add(show_id)
+                    if self.numbers[show_id] != numbers:
+                        continue
+                    shared = len(grams & self.grams[show_id])
+                    score = shared / (len(grams) + size - shared)
+                    if score >= self.threshold and score > best_score:
+                        best, best_score = show_id, score
+        return None if best is None else self.names[best]
@@ -0,0 +1,100 @@
+import os
+import threading
+
+# Extensions of the files that get sorted, anything else is skipped without ever opening it
+DEFAULT_EXTENSIONS = ('.mkv', '.mp4', '.m4v', '.avi')
+
+# One read of this size is enough for every signature below, mpeg-ts needs to see 2 packets of 188 bytes
+HEADER_SIZE = 512
+TS_PACKET_SIZE = 188
+
+
+def is_matroska(header):
+    # Every matroska and webm file starts with an EBML header
+    return header[:4] == b'\x1a\x45\xdf\xa3'
+
+
+def is_mp4(header):
+    # The first box of an mp4, m4v or mov is ftyp, the 4 bytes before it are the size of the box
+    return header[4:8] == b'ftyp'
+
+
+def is_avi(header):
+    return header[:4] == b'RIFF' and header[8:12] == b'AVI '
+
+
+def is_mpeg_ts(header):
+    # Transport streams are made of 188 byte packets that all start with the sync byte 0x47
+    return len(header) > TS_PACKET_SIZE and header[0] == 0x47 and header[TS_PACKET_SIZE] == 0x47
+
+
+# Name of the container and the check for it, more can be added with MediaDetector.add_signature
+SIGNATURES = [('matroska', is_matroska), ('mp4', is_mp4), ('avi', is_avi), ('mpeg-ts', is_mpeg_ts)]
+
+
+class MediaDetector:
+    # Decides if a file in the anime directory is a video that should be sorted
+    # The extension is checked first, only if sniff is on the first bytes of the file get read to see if it
+    # really is a video container. Those results are kept per inode and modification time so a file that stays
+    # in the directory, like something that is still seeding, only ever gets opened once
+
+    def __init__(self, extensions=DEFAULT_EXTENSIONS, sniff=False):
+        self.extensions = frozenset(extension.lower() for extension in extensions)
+        self.sniff = sniff
+        self.signatures = list(SIGNATURES)
+        self.cache = {}
+        # Watch mode and the profiles can use the same detector from multiple threads
+        self.lock = threading.Lock()
+
+    def add_signature(self, name, check):
+        self.signatures.append((name, check))
+
+    def has_video_extension(self, name):
+        # Called for every file in the directory, rfind is a lot cheaper than os.path.splitext
+        dot = name.rfind('.')
+        if dot <= max(name.rfind('/'), name.rfind(os.sep)) + 1:
+            # No extension at all, or a hidden file like .mkv
+            return False
+        return name[dot:].lower() in self.extensions
+
+    def container(self, header):
+        for name, check in self.signatures:
+            if check(header):
+                return name
+        return None
+
+    def read_header(self, path):
+        # A single small read, no python file object or buffering needed
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            return os.read(fd, HEADER_SIZE)
+        finally:
+            os.close(fd)
+
+    def is_video(self, path, stat=None):
+        # Stat can be given when the caller already has it, like the DirEntry of a scandir
+        if not self.has_video_extension(path):
+            return False
+        if not self.sniff:
+            return True
+
+        try:
+            if stat is None:
+                stat = os.stat(path)
+            key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            with self.lock:
+                if self.cache.get(path, (None,))[0] == key:
+                    return self.cache[path][1]
+            result = self.container(self.read_header(path)) is not None
+        except OSError:
+            # Gone or not readable, it will be looked at again next time
+            return False
+
+        with self.lock:
+            self.cache[path] = (key, result)
+        return result
+
+    def forget(self, path):
+        # Called when a file got moved away, keeps the cache from growing forever in watch mode
+        with self.lock:
+            self.cache.pop(path, None)
@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+METRIC_PREFIX = 'nyaasort'
+
+
+class Metrics:
+    # Wall time of every phase of a run together with counters and errors per category
+    # The workers all report to the same object, so everything goes through a lock
+
+    def __init__(self):
+        self.started = time.time()
+        self.start_time = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add_time(self, phase, seconds, calls=1):
+        with self.lock:
+            entry = self.phases.setdefault(phase, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += seconds
+            entry['calls'] += calls
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def error(self, category):
+        with self.lock:
+            self.errors[category] = self.errors.get(category, 0) + 1
+
+    def rates(self):
+        # Throughput of the transfers, the time of the transfers phase is wall time so workers are accounted for
+        seconds = max(self.phases.get('transfers', {}).get('seconds', 0), 1e-6)
+        return {'files_per_second': self.counters.get('files_moved', 0) / seconds,
+                'bytes_per_second': self.counters.get('bytes_moved', 0) / seconds}
+
+    def to_dict(self):
+        with self.lock:
+            return {'started': self.started, 'wall_seconds': time.perf_counter() - self.start_time,
+                    'phases': {name: dict(entry) for name, entry in self.phases.items()},
+                    'counters': dict(self.counters), 'errors': dict(self.errors), 'rates': self.rates()}
+
+    def save_json(self, path):
+        write_atomic(path, json.dumps(self.to_dict(), indent=2))
+
+    def samples(self, labels=None):
+        # Every value as (name, help, labels, value), the labels given are added to every one of them
+        labels = labels or {}
+        data = self.to_dict()
+        samples = [('last_run_timestamp_seconds', 'When the last run started.', labels, data['started']),
+                   ('run_seconds', 'Wall time of the last run.', labels, data['wall_seconds'])]
+        for name, entry in sorted(data['phases'].items()):
+            samples.append(('phase_seconds', 'Time spent in every phase of the last run.',
+                            {**labels, 'phase': name}, entry['seconds']))
+        for name, entry in sorted(data['phases'].items()):
+            samples.append(('phase_calls', 'How often every phase ran during the last run.',
+                            {**labels, 'phase': name}, entry['calls']))
+        for counter, value in sorted(data['counters'].items()):
+            samples.append((metric_name(counter), f'{counter.replace("_", " ").capitalize()} during the last run.',
+                            labels, value))
+        for category, value in sorted(data['errors'].items()):
+            samples.append(('errors', 'Errors per category during the last run.', {**labels, 'category': category},
+                            value))
+        for rate, value in data['rates'].items():
+            samples.append((rate, f'{rate.replace("_", " ").capitalize()} of the transfers during the last run.',
+                            labels, value))
+        return samples
+
+    def to_prometheus(self):
+        return render_prometheus(self.samples())
+
+    def save_prometheus(self, path):
+        write_atomic(path, self.to_prometheus())
+
+
+def render_prometheus(samples):
+    # The textfile format of the node exporter, every value describes the last run so they are all gauges
+    # All samples of a metric have to be together under a single help and type line
+    grouped = {}
+    for name, help_text, labels, value in samples:
+        grouped.setdefault(name, (help_text, []))[1].append((labels, value))
+
+    lines = []
+    for name, (help_text, values) in grouped.items():
+        lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_{name} gauge')
+        for labels, value in values:
+            label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+            lines.append(f'{METRIC_PREFIX}_{name}{{{label_text}}} {value}' if label_text
+                         else f'{METRIC_PREFIX}_{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def save_profiles_json(path, metrics_by_profile):
+    write_atomic(path, json.dumps({'profiles': {name: profile_metrics.to_dict()
+                                                for name, profile_metrics in metrics_by_profile.items()}}, indent=2))
+
+
+def save_profiles_prometheus(path, metrics_by_profile):
+    samples = []
+    for name, profile_metrics in metrics_by_profile.items():
+        samples.extend(profile_metrics.samples({'profile': name}))
+    write_atomic(path, render_prometheus(samples))
+
+
+def metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_atomic(path, text):
+    # The node exporter could read the file while it is being written, so it only shows up once it is complete
+    # Every write gets its own temporary file, runs that overlap would otherwise write into each others
+    # tempfile is only needed here, so it is not imported at startup
+    import tempfile
+    fd, temp_path = tempfile.mkstemp(prefix=f'{os.path.basename(path)}.', suffix='.tmp',
+                                     dir=os.path.dirname(path) or '.')
+    try:
+        # mkstemp makes a file only we can read, the node exporter usually runs as somebody else
+        os.chmod(temp_path, 0o644)
+        with open(fd, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
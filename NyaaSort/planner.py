@@ -0,0 +1,92 @@
+import json
+import os
+
+PLAN_VERSION = 1
+
+# Operations that change the folder structure, these always run one after another in the order they were planned
+STRUCTURAL_OPERATIONS = ('mkdir', 'rename')
+# Operations that move the data of an episode around, these can be reordered and run at the same time
+TRANSFER_OPERATIONS = ('copy', 'move')
+
+
+class Plan:
+    # An ordered list of everything a sort is going to do to the disk
+    # Every operation is a dict with an op, a dst and depending on the op a src, size and the anime it belongs to
+
+    def __init__(self, dir_path, sort_dir, backup_dir, operations=None):
+        self.dir_path = dir_path
+        self.sort_dir = sort_dir
+        self.backup_dir = backup_dir
+        self.operations = operations if operations is not None else []
+        # Folders that are already planned by add_folder
+        self.folders = set()
+
+    def add(self, op, dst, src=None, size=None, anime=None, folder=None):
+        operation = {'op': op, 'dst': dst}
+        # Leave out everything that is not set so the json stays readable
+        for key, value in (('src', src), ('size', size), ('anime', anime), ('folder', folder)):
+            if value is not None:
+                operation[key] = value
+        self.operations.append(operation)
+        return operation
+
+    def add_folder(self, dst, anime=None):
+        # Folders that a lot of episodes share, like the season folders of a layout, only have to be made once
+        if dst in self.folders:
+            return None
+        self.folders.add(dst)
+        return self.add('mkdir', dst, anime=anime)
+
+    def structural(self):
+        return [operation for operation in self.operations if operation['op'] in STRUCTURAL_OPERATIONS]
+
+    def transfer_jobs(self):
+        # Groups the copy and move of the same episode together, the backup has to be made before the episode is moved
+        jobs = {}
+        for operation in self.operations:
+            if operation['op'] in TRANSFER_OPERATIONS:
+                jobs.setdefault(operation['src'], []).append(operation)
+        return list(jobs.values())
+
+    def total_bytes(self, op=None):
+        return sum(operation.get('size', 0) for operation in self.operations if op is None or operation['op'] == op)
+
+    def summary(self):
+        counts = {op: 0 for op in STRUCTURAL_OPERATIONS + TRANSFER_OPERATIONS}
+        for operation in self.operations:
+            counts[operation['op']] += 1
+        return (f"{counts['mkdir']} folders to create, {counts['rename']} to rename, {counts['move']} episodes to move "
+                f"({self.total_bytes('move') / 1024 ** 2:.1f} MB) and {counts['copy']} backups to make "
+                f"({self.total_bytes('copy') / 1024 ** 2:.1f} MB)")
+
+    def to_dict(self):
+        return {'version': PLAN_VERSION, 'dir_path': self.dir_path, 'sort_dir': self.sort_dir,
+                'backup_dir': self.backup_dir, 'total_bytes': self.total_bytes('move'),
+                'operations': self.operations}
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as plan_file:
+            json.dump(self.to_dict(), plan_file, indent=2)
+
+    @classmethod
+    def from_dict(cls, data):
+        # Plans can be edited by hand, so check everything before a single operation gets run
+        if not isinstance(data, dict) or data.get('version') != PLAN_VERSION:
+            raise ValueError(f"Not a version {PLAN_VERSION} plan")
+        operations = data.get('operations')
+        if not isinstance(operations, list):
+            raise ValueError("The plan has no list of operations")
+        for number, operation in enumerate(operations):
+            op = operation.get('op') if isinstance(operation, dict) else None
+            if op not in STRUCTURAL_OPERATIONS + TRANSFER_OPERATIONS:
+                raise ValueError(f"Operation {number} has an unknown op {op}")
+            paths = ['dst'] if op == 'mkdir' else ['src', 'dst']
+            for key in paths:
+                if not isinstance(operation.get(key), str) or not os.path.isabs(operation[key]):
+                    raise ValueError(f"Operation {number} ({op}) needs an absolute {key} path")
+        return cls(data.get('dir_path'), data.get('sort_dir'), data.get('backup_dir'), operations)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as plan_file:
+            return cls.from_dict(json.load(plan_file))
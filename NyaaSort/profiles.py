@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Every [SORT:name] section of the config is a profile with its own directories
+PROFILE_PREFIX = 'SORT:'
+
+
+def section_name(profile):
+    return 'SORT' if profile is None else f'{PROFILE_PREFIX}{profile}'
+
+
+def profile_names(config):
+    return [section[len(PROFILE_PREFIX):] for section in config.sections() if section.startswith(PROFILE_PREFIX)]
+
+
+def devices(paths):
+    # The devices the directories of a profile are on, directories that do not exist are left out
+    found = set()
+    for path in paths:
+        if not path:
+            continue
+        try:
+            found.add(os.stat(path).st_dev)
+        except OSError:
+            pass
+    return found
+
+
+def group_by_device(profiles):
+    # Profiles is a list of (name, devices), profiles that share any device end up in the same group
+    # Running the profiles of a group one after another keeps a single disk from being hammered by all of them
+    groups = []
+    for name, profile_devices in profiles:
+        merged = {'names': [name], 'devices': set(profile_devices)}
+        for group in [group for group in groups if group['devices'] & merged['devices']]:
+            groups.remove(group)
+            merged['names'] = group['names'] + merged['names']
+            merged['devices'] |= group['devices']
+        groups.append(merged)
+
+    # Keep the order of the config, both inside the groups and between them
+    order = {name: number for number, (name, _) in enumerate(profiles)}
+    ordered = [sorted(group['names'], key=order.get) for group in groups]
+    return sorted(ordered, key=lambda names: order[names[0]])
+
+
+def run_groups(groups, run, logger):
+    # Every group gets its own thread, the profiles in a group run in the order they are in the config
+    def run_group(names):
+        for name in names:
+            try:
+                run(name)
+            except Exception as e:
+                # One broken profile should not stop the others
+                logger.error(f"Encountered {e} while sorting the profile {name}")
+
+    if not groups:
+        return
+    if len(groups) == 1:
+        run_group(groups[0])
+        return
+    with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        list(pool.map(run_group, groups))
@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+import threading
+import time
+
+# Progress of the whole run is reported at most this often, the result of every episode is always reported
+REPORT_INTERVAL = 1.0
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+    if seconds >= 60:
+        return f'{seconds // 60}m{seconds % 60:02d}s'
+    return f'{seconds}s'
+
+
+class Progress:
+    # Follows the copies and moves of a run and reports the bytes per second, the time left and every episode that
+    # is done, to the console and/or a file with a json object per line that monitoring can tail
+    # The copies report every piece they write through the throttle callback, see callback, so big episodes move the
+    # progress along while they are being copied instead of only when they are done
+
+    def __init__(self, jobs, path=None, console=False, interval=REPORT_INTERVAL):
+        self.operations = sum(1 for job in jobs for operation in job if operation['op'] in ('copy', 'move'))
+        self.total_bytes = sum(operation.get('size') or 0 for job in jobs for operation in job
+                               if operation['op'] in ('copy', 'move'))
+        self.console = console
+        self.interval = interval
+        self.lock = threading.Lock()
+        # The bytes of the operation every worker is on right now that were already counted
+        self.local = threading.local()
+        self.done_bytes = 0
+        self.done_operations = 0
+        self.failed_operations = 0
+        self.start_time = time.monotonic()
+        self.last_report = self.start_time
+        self.file = open(path, 'a', encoding='utf-8') if path else None
+        self.write({'event': 'start', 'operations': self.operations, 'bytes': self.total_bytes})
+
+    def write(self, record):
+        record['time'] = round(time.time(), 3)
+        if self.file:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+
+    def rate(self, now):
+        return self.done_bytes / max(now - self.start_time, 1e-6)
+
+    def snapshot(self, now):
+        rate = self.rate(now)
+        left = max(self.total_bytes - self.done_bytes, 0)
+        return {'event': 'progress', 'done_bytes': self.done_bytes, 'total_bytes': self.total_bytes,
+                'done_operations': self.done_operations, 'operations': self.operations,
+                'bytes_per_second': round(rate), 'eta_seconds': round(left / rate, 1) if rate else None}
+
+    def report(self, now, force=False):
+        # Called with the lock held
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        snapshot = self.snapshot(now)
+        self.write(snapshot)
+        if self.console:
+            percent = 100 * self.done_bytes / self.total_bytes if self.total_bytes else 100
+            eta = format_duration(snapshot['eta_seconds']) if snapshot['eta_seconds'] is not None else '?'
+            line = (f"{percent:5.1f}% {self.done_bytes / 1024 ** 3:.2f}/{self.total_bytes / 1024 ** 3:.2f} GiB "
+                    f"{snapshot['bytes_per_second'] / 1024 ** 2:.1f} MB/s ETA {eta} "
+                    f"({self.done_operations}/{self.operations})")
+            # A terminal gets a single line that keeps changing, a log file gets every line
+            sys.stderr.write(f'\r{line}' if sys.stderr.isatty() else f'{line}\n')
+            sys.stderr.flush()
+
+    def advance(self, amount):
+        # A piece of the operation this thread is working on got written
+        self.local.counted = getattr(self.local, 'counted', 0) + amount
+        with self.lock:
+            self.done_bytes += amount
+            self.report(time.monotonic())
+
+    def callback(self, throttle=None):
+        # Goes where the throttle of the copies goes, the throttle still gets called when there is one
+        if throttle is None:
+            return self.advance
+
+        def advance_and_throttle(amount):
+            self.advance(amount)
+            throttle(amount)
+        return advance_and_throttle
+
+    def done(self, operation, succeeded, elapsed):
+        # Renames and hardlinks never report any pieces, so whatever was not counted yet is counted now
+        size = operation.get('size') or 0
+        counted = getattr(self.local, 'counted', 0)
+        self.local.counted = 0
+        now = time.monotonic()
+        with self.lock:
+            self.done_operations += 1
+            if succeeded:
+                self.done_bytes += max(size - counted, 0)
+            else:
+                # The bytes of a failed copy will never come, they should not count towards the time left either
+                self.failed_operations += 1
+                self.done_bytes -= counted
+                self.total_bytes -= size
+            self.write({'event': 'file', 'op': operation['op'], 'name': os.path.basename(operation['src']),
+                        'dst': operation['dst'], 'bytes': size, 'ok': succeeded, 'seconds': round(elapsed, 3),
+                        'bytes_per_second': round(size / max(elapsed, 1e-6)) if succeeded else 0})
+            if self.console:
+                result = f'{elapsed:.1f}s' if succeeded else 'failed'
+                # Clears the progress line of a terminal, the next report writes it again under this one
+                sys.stderr.write(f"\r\033[K{operation['op']} {os.path.basename(operation['src'])} {result}\n"
+                                 if sys.stderr.isatty() else f"{operation['op']} {operation['src']} {result}\n")
+            self.report(now)
+
+    def finish(self):
+        now = time.monotonic()
+        with self.lock:
+            self.report(now, force=True)
+            if self.console and sys.stderr.isatty():
+                sys.stderr.write('\n')
+            self.write({'event': 'finish', 'done_bytes': self.done_bytes, 'done_operations': self.done_operations,
+                        'failed_operations': self.failed_operations, 'seconds': round(now - self.start_time, 3),
+                        'bytes_per_second': round(self.rate(now))})
+            if self.file:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,143 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Everything we could find out about a release from its file name, fields that are not in the name are None
+Release = namedtuple('Release', ['group', 'title', 'season', 'episode', 'episode_end', 'version', 'resolution',
+                                 'crc', 'extension'])
+
+# The group is always everything between the first [ and ]
+GROUP = r'^\[(?P<group>[^\]]+)\]\s*'
+# Anything after the episode number has to start with a space or a bracket, otherwise it is part of the title
+REST = r'(?P<rest>(?:[\s\[(].*)?)$'
+
+# The built in release name grammar, tried from top to bottom
+# The usual nyaa format comes first since almost every file looks like that
+BUILTIN_PATTERNS = (
+    # [Group] Title - 05v2 (1080p) [ABCD1234]
+    # The title is greedy so shows with a - in the name still work, the last - NN is the episode
+    GROUP + r'(?P<title>.+)\s-\s(?P<episode>\d{1,4}(?:\.\d)?)(?:v(?P<version>\d+))?' + REST,
+    # [Group] Title S01E02v2 [1080p]
+    GROUP + r'(?P<title>.+?)[\s._-]+S(?P<season>\d{1,2})E(?P<episode>\d{1,4})(?:v(?P<version>\d+))?' + REST,
+    # Batch releases, [Group] Title (01-12) [1080p] or [Group] Title - 01~12 [1080p]
+    GROUP + r'(?P<title>.+?)\s*(?:-\s*|\()(?P<episode>\d{1,4})\s*[-~]\s*(?P<episode_end>\d{1,4})\)?' + REST,
+    # Anything else with a group and a -, this is how the script always split the names before
+    r'^\[(?P<group>[^\]]+)\] (?P<title>.+) -(?P<rest>.*)$',
+)
+
+RESOLUTION = re.compile(r'(?<![0-9a-zA-Z])(?P<resolution>\d{3,4}p|\d{3,4}x\d{3,4})(?![0-9a-zA-Z])', re.IGNORECASE)
+CRC = re.compile(r'\[(?P<crc>[0-9A-Fa-f]{8})\]')
+# What has to follow the last ' - ' of the usual names, see ReleaseParser.parse_usual
+USUAL_TAIL = re.compile(r'(\d{1,4}(?:\.\d)?)(?:v(\d+))?((?:[\s\[(][^-]*)?)$')
+
+# Named groups a pattern needs before it can be used to sort anything
+REQUIRED_GROUPS = {'group', 'title'}
+
+
+def to_number(value):
+    # Episodes are whole numbers except for the odd recap episode like 12.5
+    if value is None:
+        return None
+    try:
+        return float(value) if '.' in value else int(value)
+    except ValueError:
+        return None
+
+
+def split_extension(name):
+    # Returns the name without the extension and the extension in lower case, or the whole name and None when it
+    # does not end in a . and 2 to 4 letters or digits
+    stem, dot, extension = name.rpartition('.')
+    if dot and 2 <= len(extension) <= 4 and extension.isascii() and extension.isalnum():
+        return stem, extension.lower()
+    return name, None
+
+
+def compile_pattern(pattern):
+    # Raises re.error or ValueError if the pattern can not be used
+    compiled = re.compile(pattern)
+    missing = REQUIRED_GROUPS - set(compiled.groupindex)
+    if missing:
+        raise ValueError(f"Pattern {pattern} is missing the named groups {', '.join(sorted(missing))}")
+    return compiled
+
+
+class ReleaseParser:
+
+    def __init__(self, extra_patterns=(), cache_size=65536):
+        # Patterns of the user come first so they can override the built in ones
+        self.patterns = [compile_pattern(pattern) for pattern in extra_patterns]
+        # The fast path would skip the patterns of the user, so it is only used without them
+        self.fast_path = not self.patterns
+        self.patterns.extend(re.compile(pattern) for pattern in BUILTIN_PATTERNS)
+
+        # Every parser gets its own cache since the result depends on the patterns
+        # Watch mode and seeding directories see the same names over and over again
+        self.parse = lru_cache(maxsize=cache_size)(self.parse_uncached)
+
+    @staticmethod
+    def parse_usual(stem, extension):
+        # The usual [Group] Title - 05v2 (1080p) without going through the patterns, gives the same Release as the
+        # first built in pattern or None to let the patterns decide. Almost every name looks like this, so the few
+        # string methods here are most of what sorting a file costs
+        close = stem.find(']')
+        dash = stem.rfind(' - ')
+        if close < 2 or dash <= close or stem[0] != '[':
+            return None
+        # A - in the rest could be a later episode for the greedy title of the pattern, leave those to the patterns
+        tail = USUAL_TAIL.match(stem, dash + 3)
+        title = stem[close + 1:dash].strip()
+        if not tail or not title:
+            return None
+        episode, version, rest = tail.groups()
+        resolution = RESOLUTION.search(rest) if rest else None
+        crc = CRC.search(rest) if '[' in rest else None
+        return Release(stem[1:close].strip(), title, None, float(episode) if '.' in episode else int(episode), None,
+                       int(version) if version else None, resolution[1] if resolution else None,
+                       crc[1] if crc else None, extension)
+
+    def parse_uncached(self, name):
+        # Returns a Release or None if the name does not match any of the patterns
+        stem, extension = split_extension(name)
+        # Some groups use underscores instead of spaces
+        if ' ' not in stem and '_' in stem:
+            stem = stem.replace('_', ' ')
+
+        if self.fast_path:
+            release = self.parse_usual(stem, extension)
+            if release:
+                return release
+
+        for pattern in self.patterns:
+            match = pattern.match(stem)
+            if not match:
+                continue
+            fields = match.groupdict()
+            if fields['title'].strip():
+                return self.release(fields, extension)
+        return None
+
+    @staticmethod
+    def release(fields, extension):
+        # The resolution and crc can be anywhere in the tags after the episode
+        rest = fields.get('rest') or ''
+        resolution = fields.get('resolution')
+        if resolution is None:
+            resolution_match = RESOLUTION.search(rest)
+            resolution = resolution_match['resolution'] if resolution_match else None
+        crc = fields.get('crc')
+        if crc is None and '[' in rest:
+            crc_match = CRC.search(rest)
+            crc = crc_match['crc'] if crc_match else None
+
+        return Release(group=fields['group'].strip(), title=fields['title'].strip(),
+                       season=to_number(fields.get('season')), episode=to_number(fields.get('episode')),
+                       episode_end=to_number(fields.get('episode_end')), version=to_number(fields.get('version')),
+                       resolution=resolution, crc=crc, extension=extension)
+
+
+DEFAULT_PARSER = ReleaseParser()
+
+
+def parse(name):
+    return DEFAULT_PARSER.parse(name)
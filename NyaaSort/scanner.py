@@ -0,0 +1,41 @@
+import os
+
+# Everything here reads a directory with a single scandir, the file type comes for free with every entry on
+# both linux and windows so telling files and folders apart needs no extra system calls
+
+
+def scan(path):
+    # Yields the DirEntry of everything in the directory while it is being read, nothing is kept in memory
+    with os.scandir(path) as entries:
+        yield from entries
+
+
+def iter_files(path):
+    for entry in scan(path):
+        if entry.is_file():
+            yield entry
+
+
+def list_folders(path):
+    # Only the top level folders, we are not interested in sub-folders
+    return [entry.name for entry in scan(path) if entry.is_dir()]
+
+
+def split(path):
+    # Returns the files and the names of the folders of a directory in one pass over it
+    files = []
+    folders = []
+    for entry in scan(path):
+        if entry.is_dir():
+            folders.append(entry.name)
+        elif entry.is_file():
+            files.append(entry)
+    return files, folders
+
+
+def entry_stat(entry):
+    # DirEntry caches the stat, so asking for it again later costs nothing. None when the file is gone
+    try:
+        return entry.stat()
+    except OSError:
+        return None
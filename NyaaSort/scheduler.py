@@ -0,0 +1,152 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import profiles
+except ImportError:
+    import profiles
+
+# ioprio_set is not in the os module, these are the system call numbers for it per architecture
+IOPRIO_SET = {'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'arm64': 30, 'armv7l': 314}
+IOPRIO_WHO_PROCESS = 1
+# The best effort class at its lowest level, the idle class could starve the sort forever on a busy disk
+IOPRIO_CLASS_BE = 2
+IOPRIO_LOWEST = 7
+# Lowers the disk and memory priority of the calling thread on windows
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+
+
+class Throttle:
+    # Keeps all copies of a run together below a certain amount of bytes per second
+    # Every copy reports what it just wrote and sleeps until the limit allows that many bytes
+
+    def __init__(self, bytes_per_second):
+        self.interval = 1 / bytes_per_second
+        self.next_time = None
+        self.lock = threading.Lock()
+
+    def __call__(self, amount):
+        with self.lock:
+            now = time.monotonic()
+            start = now if self.next_time is None else max(now, self.next_time)
+            self.next_time = start + amount * self.interval
+            wait = self.next_time - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+def lower_priority(logger):
+    # Lets the media server and everything else go first when they need the disk
+    # Only changes the calling thread, so every thread that copies has to call this itself
+    try:
+        if os.name == 'nt':
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN):
+                raise OSError("SetThreadPriority failed")
+            return True
+
+        if not sys.platform.startswith('linux'):
+            # Everywhere else setpriority changes the whole process for good, not only the copies
+            logger.warning("Lowering the priority of the copies only works on linux and windows")
+            return False
+        machine = os.uname().machine.lower()
+        if machine in IOPRIO_SET:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.syscall(IOPRIO_SET[machine], IOPRIO_WHO_PROCESS, 0,
+                            IOPRIO_CLASS_BE << 13 | IOPRIO_LOWEST) != 0:
+                raise OSError(ctypes.get_errno(), "ioprio_set failed")
+        # The cpu priority as well, on linux the disk scheduler also looks at it when there is no io priority
+        # Linux gives every thread its own priority, so this only changes the calling thread
+        os.setpriority(os.PRIO_PROCESS, 0, 19)
+        return True
+    except (OSError, AttributeError) as e:
+        logger.warning(f"Could not lower the priority of the sort: {e}")
+        return False
+
+
+def folder_device(path, devices):
+    # The devices of the folders are looked up once per run, every episode of a show goes to the same folder
+    folder = os.path.dirname(path)
+    if folder not in devices:
+        try:
+            devices[folder] = os.stat(folder).st_dev
+        except OSError:
+            devices[folder] = None
+    return devices[folder]
+
+
+def io_devices(operation, file_ops, devices):
+    # The devices an operation reads and writes data on, empty when it only changes the file system
+    src_device = folder_device(operation['src'], devices)
+    dst_device = folder_device(operation['dst'], devices)
+    if src_device is not None and src_device == dst_device:
+        # Renames, hardlinks and reflinks on the same device do not move any data around
+        if operation['op'] == 'move' or file_ops.backup_method != 'copy':
+            return set()
+    return {device for device in (src_device, dst_device) if device is not None}
+
+
+def lanes(operations, file_ops):
+    # Splits the operations into lanes that can run at the same time without two of them using the same disk
+    # Operations that do not move data are cheap, those all go into a single lane of their own
+    devices = {}
+    metadata = []
+    heavy = []
+    for operation in operations:
+        operation_devices = io_devices(operation, file_ops, devices)
+        if operation_devices:
+            heavy.append((operation, operation_devices))
+        else:
+            metadata.append(operation)
+
+    # The same grouping the profiles use, operations that share a disk end up in the same lane
+    groups = profiles.group_by_device([(number, operation_devices)
+                                       for number, (_, operation_devices) in enumerate(heavy)])
+    # A lane is read and written from start to end, in the order of the source files so the disk barely has to seek
+    result = [sorted((heavy[number][0] for number in group), key=lambda operation: operation['src'])
+              for group in groups]
+    if metadata:
+        result.append(metadata)
+    return result
+
+
+def run_stage(stage_lanes, apply, initializer=None):
+    # Every lane gets a single thread, so every disk only sees one stream at a time
+    # Returns the operations that failed
+    def run_lane(lane):
+        if initializer:
+            initializer()
+        return [operation for operation in lane if not apply(operation)]
+
+    # The lanes never run on the calling thread, so a lower priority does not stick to the rest of the run
+    with ThreadPoolExecutor(max_workers=max(len(stage_lanes), 1)) as pool:
+        return [operation for failed in pool.map(run_lane, stage_lanes) for operation in failed]
+
+
+def run_jobs(jobs, file_ops, apply, logger, initializer=None):
+    # Jobs are the copy and move of every episode, instead of doing those one episode at a time all backups are
+    # made first and the episodes are moved after that, both per device
+    # This way a disk only ever reads or writes one file at a time and never has to switch between destinations
+    # Returns the amount of bytes that got moved
+    backups = [operation for job in jobs for operation in job if operation['op'] == 'copy']
+    moves = [operation for job in jobs for operation in job if operation['op'] == 'move']
+
+    failed_backups = set()
+    if backups:
+        failed_backups = {operation['src'] for operation in run_stage(lanes(backups, file_ops), apply, initializer)}
+
+    # Never move an episode of which the backup failed
+    for operation in moves:
+        if operation['src'] in failed_backups:
+            logger.warning(f"Not moving {os.path.basename(operation['src'])} since its backup failed")
+    moves = [operation for operation in moves if operation['src'] not in failed_backups]
+    if not moves:
+        return 0
+    failed_moves = run_stage(lanes(moves, file_ops), apply, initializer)
+    return sum(operation.get('size', 0) for operation in moves) - sum(operation.get('size', 0)
+                                                                        for operation in failed_moves)
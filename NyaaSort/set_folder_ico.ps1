@@ -1,5 +1,7 @@
-$TargetDirectory = $args[0]
-$anime = $args[1]
+# The arguments come in pairs of a folder and the anime in it, so one powershell process can set a lot of icons
+For ($i = 0; $i -lt $args.Count - 1; $i += 2) {
+$TargetDirectory = $args[$i]
+$anime = $args[$i + 1]
 
 $DesktopIni = @"
 [.ShellClassInfo]
@@ -29,5 +31,6 @@ Else  {
   #Finally, set the folder's attributes
   (Get-Item -LiteralPath $TargetDirectory -Force).Attributes = 'ReadOnly, Directory'
 }
+}
 
 # My powershell knowlegde is not the best so there is probs a better way to do this
\ No newline at end of file
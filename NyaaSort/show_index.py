@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+
+INDEX_NAME = 'ShowIndex.json'
+
+# Profiles running at the same time all save their library into the same file
+SAVE_LOCK = threading.Lock()
+
+
+def folder_group(folder):
+    # Every folder made by this script starts with [group], get everything between the first [ and ]
+    return folder.split(']', 1)[0].replace('[', '', 1)
+
+
+class ShowIndex:
+    # Keeps the anime -> folder dictionary of a library on disk so the library does not have to be walked every run
+    # The modification time of the library folder changes whenever a folder gets added, removed or renamed in it
+    # So as long as that time matches the one we stored, the stored folders are still correct
+
+    def __init__(self, path, library_dir):
+        self.path = path
+        self.library_dir = os.path.realpath(library_dir)
+        self.shows = {}
+        # The modification time of the library after our own last change, None means we do not know it
+        self.mtime_ns = None
+
+    def library_mtime(self):
+        try:
+            return os.stat(self.library_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def read_file(self):
+        # The file can hold the index of multiple libraries, a broken file is treated as an empty one
+        try:
+            with open(self.path, 'r', encoding='utf-8') as index_file:
+                data = json.load(index_file)
+            if isinstance(data.get('libraries'), dict):
+                return data
+        except (OSError, ValueError, AttributeError):
+            pass
+        return {'libraries': {}}
+
+    def load(self):
+        # Returns the anime dictionary if the stored index is still valid, None if it has to be rebuilt
+        mtime_ns = self.library_mtime()
+        if self.mtime_ns is not None and self.mtime_ns == mtime_ns:
+            # Nothing changed since this index was last used, no need to read the file again
+            return dict(self.shows)
+
+        entry = self.read_file()['libraries'].get(self.library_dir)
+        if not entry or mtime_ns is None or entry.get('mtime_ns') != mtime_ns:
+            return None
+
+        self.shows = {anime: show['folder'] for anime, show in entry.get('shows', {}).items()}
+        self.mtime_ns = mtime_ns
+        return dict(self.shows)
+
+    def rebuild(self, anime_dict):
+        # Called after the library has been walked, what we have now is what is on disk
+        self.shows = dict(anime_dict)
+        self.mtime_ns = self.library_mtime()
+
+    def update(self, anime, folder, mtime_before):
+        # Should be called after every folder this script creates or renames in the library
+        # If somebody else changed the library since we last looked we can no longer trust the modification time
+        self.shows[anime] = folder
+        if self.mtime_ns is not None and mtime_before == self.mtime_ns:
+            self.mtime_ns = self.library_mtime()
+        else:
+            self.mtime_ns = None
+
+    def save(self):
+        # Only our own library gets replaced, the lock makes sure we never throw away the save of another profile
+        with SAVE_LOCK:
+            data = self.read_file()
+            data['libraries'][self.library_dir] = {
+                'mtime_ns': self.mtime_ns,
+                'shows': {anime: {'folder': folder, 'group': folder_group(folder)}
+                          for anime, folder in self.shows.items()}
+            }
+
+            # Write to a temporary file first so a crash can never leave half an index behind
+            # Every save gets its own, runs that overlap would otherwise write into each others. A library another
+            # process saved in the meantime can still drop out of the index, that only means it gets walked again
+            # tempfile is only needed here, so it is not imported at startup
+            import tempfile
+            fd, temp_path = tempfile.mkstemp(prefix=f'{os.path.basename(self.path)}.', suffix='.tmp',
+                                             dir=os.path.dirname(self.path) or '.')
+            try:
+                with open(fd, 'w', encoding='utf-8') as index_file:
+                    json.dump(data, index_file)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
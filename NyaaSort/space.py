@@ -0,0 +1,66 @@
+import os
+import shutil
+
+try:
+    from . import scheduler
+except ImportError:
+    import scheduler
+
+# How much space is always left free on every disk we write to, in GB. Filling a disk to the last byte breaks the
+# download client and the media server long before it breaks us
+DEFAULT_RESERVE = 1.0
+
+
+def written_device(operation, file_ops, devices):
+    # The device an operation writes a whole episode to, None when it does not write any data
+    if operation['op'] == 'move' and file_ops.move_same_device:
+        # A rename, the episode only changes folders
+        return None
+    if operation['op'] == 'copy' and file_ops.backup_method == 'hardlink':
+        return None
+    # Reflinks are counted as copies, they turn into one when the file system can not do them after all
+    return scheduler.folder_device(existing_folder(operation['dst']), devices)
+
+
+def existing_folder(path):
+    # A file in the closest folder that is already there, the folder of a new show is only made when it gets sorted
+    folder = os.path.dirname(path)
+    while not os.path.isdir(folder) and os.path.dirname(folder) != folder:
+        folder = os.path.dirname(folder)
+    return os.path.join(folder, os.path.basename(path))
+
+
+def free_space(path, reserve):
+    # None when we can not find out, the copy will tell us soon enough if it does not fit
+    try:
+        return shutil.disk_usage(os.path.dirname(existing_folder(path))).free - reserve
+    except OSError:
+        return None
+
+
+def admit(jobs, file_ops, reserve):
+    # Jobs are the copy and move of every episode, an episode is only admitted when both fit on their disks with the
+    # reserve in bytes still free afterwards. Episodes that do not fit are skipped, so smaller ones after it can
+    # still go. Returns the admitted jobs and the rejected ones
+    devices = {}
+    left = {}
+    admitted = []
+    rejected = []
+    for job in jobs:
+        needed = {}
+        for operation in job:
+            device = written_device(operation, file_ops, devices)
+            if device is None:
+                continue
+            if device not in left:
+                left[device] = free_space(operation['dst'], reserve)
+            needed[device] = needed.get(device, 0) + (operation.get('size') or 0)
+
+        if all(left[device] is None or left[device] >= size for device, size in needed.items()):
+            for device, size in needed.items():
+                if left[device] is not None:
+                    left[device] -= size
+            admitted.append(job)
+        else:
+            rejected.append(job)
+    return admitted, rejected
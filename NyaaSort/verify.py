@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+except ModuleNotFoundError:
+    # xxhash is a lot faster but blake2 comes with python, so it is optional
+    xxhash = None
+
+HASH_CACHE_NAME = '.nyaasort-hashes.json'
+ALGORITHM = 'xxh3_128' if xxhash else 'blake2b'
+
+# Big reads keep the amount of python calls per gigabyte low
+CHUNK_SIZE = 4 * 1024 * 1024
+
+VerifyResult = namedtuple('VerifyResult', ['checked', 'skipped', 'added', 'mismatched', 'missing'])
+
+
+def new_hasher():
+    return xxhash.xxh3_128() if xxhash else hashlib.blake2b(digest_size=16)
+
+
+def hashing_copy(src, dst, throttle=None):
+    # Copies the file and hashes every chunk on the way, so the data only has to be read once
+    hasher = new_hasher()
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        while True:
+            read = fsrc.readinto(buffer)
+            if not read:
+                break
+            hasher.update(view[:read])
+            fdst.write(view[:read])
+            if throttle:
+                throttle(read)
+    shutil.copymode(src, dst)
+    return hasher.hexdigest()
+
+
+def hash_file(path):
+    hasher = new_hasher()
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, 'rb') as read_file:
+        while True:
+            read = read_file.readinto(buffer)
+            if not read:
+                break
+            hasher.update(view[:read])
+    return hasher.hexdigest()
+
+
+def verified_backup(file_ops, src, dst):
+    # Makes the backup the way the file ops would and returns the hash of it
+    # A normal copy gets hashed while copying, hardlinks and reflinks do not read the data so those get hashed after
+    if file_ops.backup_method == 'copy':
+        return hashing_copy(src, dst, file_ops.throttle)
+    file_ops.backup(src, dst)
+    return hash_file(dst)
+
+
+class HashCache:
+    # The hashes of every backup together with the size and modification time they had when they were hashed
+    # Stored in the root of the backup dir so it moves along with the backups
+
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+        self.path = os.path.join(backup_dir, HASH_CACHE_NAME)
+        self.entries = {}
+        # Workers record their hashes at the same time
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as cache_file:
+                data = json.load(cache_file)
+            if isinstance(data.get('files'), dict):
+                self.entries = data['files']
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    @staticmethod
+    def exists(backup_dir):
+        return os.path.exists(os.path.join(backup_dir, HASH_CACHE_NAME))
+
+    def key(self, path):
+        # Forward slashes so the cache works on every operating system
+        return os.path.relpath(path, self.backup_dir).replace(os.sep, '/')
+
+    def record(self, path, digest):
+        stat = os.stat(path)
+        with self.lock:
+            self.entries[self.key(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                            'algorithm': ALGORITHM, 'digest': digest}
+
+    def rename(self, src, dst):
+        # A file or folder in the backup dir got renamed, every hash in it has to move along
+        old_prefix = self.key(src) + '/'
+        new_prefix = self.key(dst) + '/'
+        with self.lock:
+            if self.key(src) in self.entries:
+                self.entries[self.key(dst)] = self.entries.pop(self.key(src))
+            for key in [key for key in self.entries if key.startswith(old_prefix)]:
+                self.entries[new_prefix + key[len(old_prefix):]] = self.entries.pop(key)
+
+    def save(self):
+        # Every save gets its own temporary file, runs that overlap or profiles with the same backup dir would
+        # otherwise write into each others. tempfile is only needed here, so it is not imported at startup
+        import tempfile
+        fd, temp_path = tempfile.mkstemp(prefix=f'{HASH_CACHE_NAME}.', suffix='.tmp', dir=self.backup_dir)
+        try:
+            with self.lock:
+                with open(fd, 'w', encoding='utf-8') as cache_file:
+                    json.dump({'files': self.entries}, cache_file)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+
+def is_cache_file(key):
+    # The hash cache itself and the temporary files it is saved through are not backups
+    return key == HASH_CACHE_NAME or (key.startswith(f'{HASH_CACHE_NAME}.') and key.endswith('.tmp'))
+
+
+def verify_tree(backup_dir, cache, workers, logger):
+    # Hashes every backup whose size or modification time changed since it was last hashed
+    # Backups that were never hashed get added, the ones that do not match their hash anymore get reported
+    to_check = []
+    skipped = 0
+    seen = set()
+    for root, _, files in os.walk(backup_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            key = cache.key(path)
+            if is_cache_file(key):
+                continue
+            seen.add(key)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entry = cache.entries.get(key)
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                skipped += 1
+            else:
+                to_check.append((path, key, entry))
+
+    def check(job):
+        path, key, entry = job
+        try:
+            return path, key, entry, hash_file(path)
+        except OSError as e:
+            logger.error(f"Could not read {path}: {e}")
+            return path, key, entry, None
+
+    added = 0
+    mismatched = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, key, entry, digest in pool.map(check, to_check):
+            if digest is None:
+                mismatched.append(path)
+            elif entry is None or entry.get('algorithm') != ALGORITHM:
+                # Nothing to compare it to, this becomes the hash we trust from now on
+                cache.record(path, digest)
+                added += 1
+            elif entry['digest'] == digest:
+                # Only the modification time changed, the data is still the same
+                cache.record(path, digest)
+            else:
+                # Keep the old hash so the backup keeps showing up until somebody fixes it
+                logger.error(f"The backup {path} does not match its hash anymore")
+                mismatched.append(path)
+
+    missing = sorted(key for key in cache.entries if key not in seen)
+    for key in missing:
+        logger.warning(f"The backup {key} is missing")
+
+    return VerifyResult(checked=len(to_check), skipped=skipped, added=added, mismatched=mismatched, missing=missing)
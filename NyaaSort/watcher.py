@@ -0,0 +1,148 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from abc import ABC, abstractmethod
+from sys import platform
+
+# Inotify flags, see man inotify
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+
+# Every inotify event starts with wd, mask, cookie and the length of the name that follows it
+EVENT_HEADER = struct.Struct('iIII')
+
+# Never keep collecting a batch for longer than this, a constant stream of downloads should still get sorted
+MAX_BATCH_TIME = 60
+
+
+class Watcher(ABC):
+    # Base class for the watchers, wait() returns the names of files which are done being written
+
+    def __init__(self, path):
+        self.path = path
+
+    @abstractmethod
+    def wait(self, timeout):
+        pass
+
+    def next_batch(self, settle_time):
+        # Block until at least one file is ready, then keep collecting files until nothing new shows up for a while
+        # This way a whole season that gets downloaded at once is sorted in one go
+        batch = set(self.wait(None))
+        started = time.monotonic()
+        while time.monotonic() - started < MAX_BATCH_TIME:
+            more = self.wait(settle_time)
+            if not more:
+                break
+            batch.update(more)
+        return sorted(batch)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(Watcher):
+    # Lets the linux kernel tell us when a file got closed after writing or moved into the folder
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"Could not watch {path}")
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        names = []
+        buffer = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, name_length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+
+            if mask & IN_Q_OVERFLOW:
+                # The kernel dropped events, the only way to be sure is to look at everything in the folder
+                return os.listdir(self.path)
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    # Works everywhere, a file is ready once its size and modification time stopped changing between 2 polls
+
+    def __init__(self, path, poll_interval):
+        super().__init__(path)
+        self.poll_interval = poll_interval
+        # Everything that is already in the folder gets handled by the first normal sort
+        self.known = set(os.listdir(path))
+        self.pending = {}
+
+    def poll(self):
+        ready = []
+        names = set()
+        current = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                names.add(entry.name)
+                if entry.name in self.known:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                current[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+        for name, signature in current.items():
+            if self.pending.get(name) == signature:
+                ready.append(name)
+                self.known.add(name)
+
+        # Forget about files that got moved away so the same name can show up again later
+        self.pending = {name: signature for name, signature in current.items() if name not in self.known}
+        self.known &= names
+        return ready
+
+    def wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if deadline is None:
+                time.sleep(self.poll_interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                time.sleep(min(self.poll_interval, remaining))
+            ready = self.poll()
+            if ready:
+                return ready
+
+
+def create_watcher(path, poll_interval, logger):
+    # Use inotify when we can, polling otherwise
+    if platform.startswith('linux'):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"Could not use inotify ({e}), falling back to polling")
+    return PollingWatcher(path, poll_interval)
@@ -0,0 +1,73 @@
+import argparse
+import io
+import logging as log
+import os
+import random
+import shutil
+import tempfile
+import time
+from PIL import Image
+from NyaaSort import imaging
+
+
+def synthetic_posters(count, width, height, seed=0):
+    # Noisy jpegs compress about as bad as real posters, a flat color would make decoding unrealistically cheap
+    rng = random.Random(seed)
+    posters = {}
+    for number in range(count):
+        noise = Image.frombytes('RGB', (width // 8, height // 8), rng.randbytes(width // 8 * (height // 8) * 3))
+        poster = noise.resize((width, height), Image.BILINEAR)
+        output = io.BytesIO()
+        poster.save(output, format='JPEG', quality=90)
+        posters[f'Show {number}'] = output.getvalue()
+    return posters
+
+
+def legacy_icons(posters, folder):
+    # What make_icons did before, write the poster, read it again and save it as ico one show at a time
+    for anime, poster in posters.items():
+        path = os.path.join(folder, f'{anime}.ico')
+        with open(path, 'wb') as image_file:
+            image_file.write(poster)
+        img = Image.open(path)
+        # The result of this resize was never used, but the work still got done
+        img.resize((256, 256), Image.LANCZOS)
+        img.save(path, format='ICO')
+
+
+def pipeline_icons(posters, folder, workers):
+    for anime, ico in imaging.make_icos(posters, log.getLogger('bench_icons'), workers).items():
+        with open(os.path.join(folder, f'{anime}.ico'), 'wb') as image_file:
+            image_file.write(ico)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the icon pipeline to the old one show at a time icons")
+    parser.add_argument("-n", "--shows", type=int, default=200, help="How many posters to convert")
+    parser.add_argument("--size", default='225x318', help="Poster size, the site serves 225x318 but others are "
+                                                          "a lot bigger")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Processes to use, defaults to every core")
+    args = parser.parse_args()
+
+    width, height = (int(number) for number in args.size.split('x'))
+    posters = synthetic_posters(args.shows, width, height)
+    workers = args.workers or os.cpu_count() or 1
+
+    results = []
+    for name, run in (('legacy', lambda folder: legacy_icons(posters, folder)),
+                      ('pipeline (1 process)', lambda folder: pipeline_icons(posters, folder, 1)),
+                      (f'pipeline ({workers} processes)', lambda folder: pipeline_icons(posters, folder, workers))):
+        folder = tempfile.mkdtemp()
+        try:
+            start_time = time.perf_counter()
+            run(folder)
+            results.append((name, time.perf_counter() - start_time))
+        finally:
+            shutil.rmtree(folder)
+
+    for name, elapsed in results:
+        print(f'{name:<24} {elapsed * 1000:9.1f} ms  {args.shows / elapsed:8.1f} icons/s')
+
+
+if __name__ == '__main__':
+    main()
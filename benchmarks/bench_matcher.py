@@ -0,0 +1,64 @@
+import argparse
+import random
+import time
+from NyaaSort import matcher
+
+SYLLABLES = ['ka', 'ki', 'ku', 'no', 'na', 'shi', 'ta', 'to', 'yo', 'mi', 'ra', 'ri', 'sa', 'se', 'ko', 'ha', 'ji',
+             'ro', 'ma', 'ze', 'tsu', 'kyo', 'sho', 'ryu']
+WORDS = ['no', 'wa', 'to', 'ga', 'The', 'Season', 'Movie', 'Academia', 'Saga', 'Stone', 'Isekai', 'Hero']
+
+
+def synthetic_title(rng):
+    words = []
+    for _ in range(rng.randint(2, 6)):
+        if rng.random() < 0.3:
+            words.append(rng.choice(WORDS))
+        else:
+            words.append(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))).capitalize())
+    if rng.random() < 0.2:
+        words.append(f'{rng.randint(2, 5)}nd Season' if rng.random() < 0.5 else str(rng.randint(2, 5)))
+    return ' '.join(words)
+
+
+def variant(title, rng):
+    # The ways another group would write the same show
+    shape = rng.randrange(3)
+    if shape == 0:
+        return title.upper()
+    if shape == 1:
+        return title.replace(' ', ' - ', 1)
+    index = rng.randrange(len(title))
+    return title[:index] + title[index] * 2 + title[index + 1:]
+
+
+def time_it(show_matcher, titles):
+    start_time = time.perf_counter()
+    found = sum(1 for title in titles if show_matcher.match(title) is not None)
+    return time.perf_counter() - start_time, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time show name lookups in a big library")
+    parser.add_argument("--shows", type=int, default=10_000, help="Shows in the library")
+    parser.add_argument("-n", "--lookups", type=int, default=10_000, help="Lookups of every kind")
+    parser.add_argument("--threshold", type=float, default=matcher.DEFAULT_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    shows = sorted({synthetic_title(rng) for _ in range(args.shows)})
+
+    start_time = time.perf_counter()
+    show_matcher = matcher.ShowMatcher(shows, args.threshold)
+    print(f'{"build index":<24} {(time.perf_counter() - start_time) * 1000:9.1f} ms  {len(show_matcher)} shows')
+
+    results = [('exact name', [rng.choice(shows) for _ in range(args.lookups)]),
+               ('spelled differently', [variant(rng.choice(shows), rng) for _ in range(args.lookups)]),
+               ('new show', [synthetic_title(rng) for _ in range(args.lookups)])]
+    for name, titles in results:
+        elapsed, found = time_it(show_matcher, titles)
+        print(f'{name:<24} {elapsed / len(titles) * 1e6:9.1f} us/lookup  {found:>7}/{len(titles)} matched')
+
+
+if __name__ == '__main__':
+    main()
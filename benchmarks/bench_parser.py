@@ -0,0 +1,70 @@
+import argparse
+import random
+import time
+from NyaaSort import release_parser
+
+GROUPS = ['SubsPlease', 'Erai-raws', 'DameDesuYo', 'HorribleSubs', 'Judas']
+TITLES = ['Shingeki no Kyojin (The Final Season)', 'Enen no Shouboutai - Ni no Shou', 'Vinland Saga', 'Dr. Stone',
+          'Re-Zero kara Hajimeru Isekai Seikatsu', 'Kimetsu no Yaiba', 'Mushoku Tensei']
+
+
+def synthetic_names(count, seed=0):
+    # Mix of all the formats the parser understands, the old logic only understands the first one
+    rng = random.Random(seed)
+    names = []
+    for number in range(count):
+        group = rng.choice(GROUPS)
+        title = f'{rng.choice(TITLES)} {number // 50}'
+        episode = rng.randint(1, 24)
+        shape = number % 4
+        if shape == 0:
+            names.append(f'[{group}] {title} - {episode:02d} (1080p).mkv')
+        elif shape == 1:
+            names.append(f'[{group}] {title} - {episode:02d}v2 [1080p][{rng.getrandbits(32):08X}].mkv')
+        elif shape == 2:
+            names.append(f'[{group}] {title} S01E{episode:02d} [720p].mkv')
+        else:
+            names.append(f'[{group}] {title} - {episode:02d} [1080p][Multiple Subtitle].mkv')
+    return names
+
+
+def legacy_parse(item):
+    # The string splitting NyaaSort.sort() used before the parser module existed
+    nya_format = [']', '[', ' -', '] ']
+    if all(x in item for x in nya_format):
+        try:
+            subtitle_group = str(item.split(']', 1)[0]).replace('[', '', 1)
+            anime_name = str(item.split('] ', 1)[1]).rsplit(" -", 1)[0]
+            return subtitle_group, anime_name
+        except IndexError:
+            return None
+    return None
+
+
+def time_it(function, names):
+    start_time = time.perf_counter()
+    parsed = sum(1 for name in names if function(name) is not None)
+    return time.perf_counter() - start_time, parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the release name parser to the old string splitting")
+    parser.add_argument("-n", "--names", type=int, default=100_000, help="How many file names to parse")
+    args = parser.parse_args()
+
+    names = synthetic_names(args.names)
+    # Big enough to hold every name, otherwise the warm run would only measure cache misses
+    release = release_parser.ReleaseParser(cache_size=len(names))
+
+    results = [('legacy split', *time_it(legacy_parse, names)),
+               ('parser (cold cache)', *time_it(release.parse, names)),
+               ('parser (warm cache)', *time_it(release.parse, names)),
+               ('parser (no cache)', *time_it(release.parse_uncached, names))]
+
+    for name, elapsed, parsed in results:
+        print(f'{name:<20} {elapsed * 1000:9.1f} ms  {len(names) / elapsed:12,.0f} names/s  '
+              f'{parsed:>7}/{len(names)} understood')
+
+
+if __name__ == '__main__':
+    main()
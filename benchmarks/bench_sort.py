@@ -0,0 +1,196 @@
+import argparse
+import configparser
+import importlib
+import importlib.machinery
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import NyaaSort
+from benchmarks.bench_parser import GROUPS, TITLES
+
+RESULTS_VERSION = 1
+# The copy of the package every run sorts with, see copy_package
+PACKAGE_NAME = 'nyaasort_bench'
+# The files of the user that live next to the script, the copy starts without them
+NOT_COPIED = ('__pycache__', '*.ini', '*.json', '*.jsonl', '*.sqlite3*', '*.broken')
+PHASES = ('parse', 'index_walk', 'index_load', 'plan', 'move')
+
+
+def show_name(number):
+    return f'{TITLES[number % len(TITLES)]} {number}'
+
+
+def make_file(path, size, fallocate):
+    # Sparse files cost nothing to create, fallocate gives them real blocks so copies have to move real data
+    with open(path, 'wb') as episode_file:
+        if fallocate and size and hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(episode_file.fileno(), 0, size)
+        else:
+            episode_file.truncate(size)
+
+
+def build_library(root, shows, episodes, size, fallocate=False, seed=0):
+    # A sorted directory with the given amount of show folders and a download directory full of new episodes
+    # Most episodes belong to shows that already have a folder, some of those are by another group so the folder
+    # has to be renamed, the rest are new shows which need a new folder
+    rng = random.Random(seed)
+    download_dir = os.path.join(root, 'downloads')
+    sort_dir = os.path.join(root, 'sorted')
+    backup_dir = os.path.join(root, 'backup')
+    for directory in (download_dir, sort_dir, backup_dir):
+        os.makedirs(directory)
+
+    groups = {}
+    for number in range(shows):
+        groups[number] = GROUPS[number % len(GROUPS)]
+        group = 'Multiple groups' if number % 10 == 0 else groups[number]
+        os.mkdir(os.path.join(sort_dir, f'[{group}] {show_name(number)}'))
+
+    new_shows = max(shows // 5, 1)
+    for number in range(episodes):
+        if rng.random() < 0.8 and shows:
+            show = rng.randrange(shows)
+            group = groups[show] if rng.random() < 0.9 else rng.choice(GROUPS)
+        else:
+            show = shows + rng.randrange(new_shows)
+            group = GROUPS[show % len(GROUPS)]
+        name = f'[{group}] {show_name(show)} - {number % 9999:04d} [1080p][{rng.getrandbits(32):08X}].mkv'
+        make_file(os.path.join(download_dir, name), size, fallocate)
+
+    return download_dir, sort_dir, backup_dir
+
+
+def copy_package(root):
+    # NyaaSort keeps its config, index, journal and catalog next to the script, so the benchmark sorts with a copy of
+    # the package in its own directory. The files of the user are never touched, not even when the benchmark gets
+    # killed halfway, and a real sort that runs at the same time still finds them
+    package_dir = os.path.join(root, 'package')
+    shutil.copytree(list(NyaaSort.__path__)[0], package_dir, ignore=shutil.ignore_patterns(*NOT_COPIED))
+    for name in [name for name in sys.modules if name == PACKAGE_NAME or name.startswith(f'{PACKAGE_NAME}.')]:
+        del sys.modules[name]
+    spec = importlib.machinery.ModuleSpec(PACKAGE_NAME, None, is_package=True)
+    spec.submodule_search_locations = [package_dir]
+    sys.modules[PACKAGE_NAME] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(f'{PACKAGE_NAME}.NyaaSort')
+
+
+def write_config(module, download_dir, sort_dir, backup_dir, workers):
+    # A config of its own so the sorter never prompts for input
+    config = configparser.ConfigParser()
+    config['SORT'] = {'LOGGING': 'False', 'ICONS': 'False', 'DIRECTORY': download_dir,
+                      'SORTED_DIRECTORY': sort_dir, 'BACKUP_PATH': str(backup_dir), 'WORKERS': str(workers)}
+    with open(module.NyaaSort.return_ini_location(), 'w') as config_file:
+        config.write(config_file)
+
+
+def timed(phases, name, function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    phases[name] = time.perf_counter() - start_time
+    return result
+
+
+def run(args):
+    root = tempfile.mkdtemp(prefix='nyaasort-bench-', dir=args.root)
+    phases = {}
+    try:
+        # Building the library is not part of a sort, so it is kept out of the phases that get compared
+        setup = {}
+        download_dir, sort_dir, backup_dir = timed(setup, 'build', build_library, root, args.shows, args.episodes,
+                                                   args.size, args.fallocate, args.seed)
+        if not args.backup:
+            backup_dir = None
+
+        module = copy_package(root)
+        write_config(module, download_dir, sort_dir, backup_dir, args.workers)
+        nyaa_sort = module.NyaaSort(download_dir, 'False', 'False', sort_dir, backup_dir, workers=args.workers)
+        # The same single scandir pass sort() uses, the entries keep the sizes for the plan
+        items = list(module.scanner.iter_files(download_dir))
+        names = [item.name for item in items]
+
+        # A new parser so nothing comes out of the cache of an earlier run
+        parser = module.release_parser.ReleaseParser()
+        timed(phases, 'parse', lambda: [parser.parse(name) for name in names])
+
+        timed(phases, 'index_walk', nyaa_sort.load_anime_dict, True)
+        nyaa_sort.save_show_index()
+        timed(phases, 'index_load', nyaa_sort.load_anime_dict)
+
+        plan = timed(phases, 'plan', nyaa_sort.plan_items, items)
+        timed(phases, 'move', nyaa_sort.execute_plan, plan)
+
+        counts = {'shows': args.shows, 'episodes': args.episodes, 'operations': len(plan.operations),
+                  'bytes_moved': plan.total_bytes('move'), 'sorted': len(items) - len(os.listdir(download_dir))}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {'version': RESULTS_VERSION, 'python': sys.version.split()[0], 'platform': platform.platform(),
+            'params': {'shows': args.shows, 'episodes': args.episodes, 'size': args.size,
+                       'fallocate': args.fallocate, 'backup': args.backup, 'workers': args.workers,
+                       'seed': args.seed},
+            'counts': counts, 'setup': setup, 'phases': {phase: phases[phase] for phase in PHASES}}
+
+
+def compare(results, baseline, threshold, noise_floor):
+    # Returns the phases that got slower than the threshold allows, tiny phases are ignored since those are noise
+    if baseline.get('params') != results['params']:
+        print("Warning: the baseline was made with different parameters")
+    regressions = []
+    for phase, elapsed in results['phases'].items():
+        before = baseline.get('phases', {}).get(phase)
+        if before is None:
+            continue
+        change = (elapsed - before) / before if before else 0
+        slower = elapsed > before * (1 + threshold) and elapsed - before > noise_floor
+        print(f'{phase:<12} {before * 1000:10.1f} ms -> {elapsed * 1000:10.1f} ms  {change:+7.1%}'
+              f'{"  REGRESSION" if slower else ""}')
+        if slower:
+            regressions.append(phase)
+    return regressions
+
+
+def main_parser():
+    parser = argparse.ArgumentParser(description="Time every phase of a sort on a synthetic anime library")
+    parser.add_argument("--shows", type=int, default=10_000, help="Show folders already in the sorted directory")
+    parser.add_argument("--episodes", type=int, default=50_000, help="Episodes waiting to be sorted")
+    parser.add_argument("--size", type=int, default=1024 * 1024, help="Size of every episode in bytes")
+    parser.add_argument("--fallocate", action="store_true", help="Allocate real blocks instead of sparse files")
+    parser.add_argument("--backup", action="store_true", help="Also make backups of every episode")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Workers used to move the episodes")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic library")
+    parser.add_argument("--root", default=None, help="Where to build the library, the disk matters for moves")
+    parser.add_argument("-o", "--output", default=None, help="Save the results as json")
+    parser.add_argument("--compare", default=None, help="Results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="How much slower a phase may get, 0.2 is 20%%")
+    parser.add_argument("--noise-floor", type=float, default=0.05, help="Seconds a phase has to slow down by "
+                                                                       "before it counts")
+    return parser
+
+
+def main():
+    args = main_parser().parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as results_file:
+            json.dump(results, results_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.threshold, args.noise_floor)
+        if regressions:
+            print(f"{len(regressions)} phases got slower: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that are only needed for folder icons or watching, a normal sort should never import them
+LAZY_MODULES = ('bs4', 'PIL', 'distutils', 'http.client', 'urllib.request', 'subprocess', 'ctypes', 'setuptools')
+MODULE = 'NyaaSort.NyaaSort'
+
+
+def parse_importtime(output):
+    # Returns {module: (self us, cumulative us)} from the -X importtime output
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_time), int(cumulative))
+    return modules
+
+
+def measure(module):
+    # A fresh interpreter every time, otherwise everything would already be imported
+    root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    # Bytecode caches have to be written, otherwise every run measures compiling the source as well
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+    start_time = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=root, env=env,
+                            capture_output=True, text=True, check=True)
+    return time.perf_counter() - start_time, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long importing NyaaSort takes with -X importtime")
+    parser.add_argument("-n", "--runs", type=int, default=10, help="How many interpreters to start")
+    parser.add_argument("--budget-ms", type=float, default=75.0, help="Fail when importing NyaaSort takes longer")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest modules to show")
+    args = parser.parse_args()
+
+    # The first run also writes the bytecode caches, so it does not count
+    measure(MODULE)
+    runs = [measure(MODULE) for _ in range(args.runs)]
+    import_ms = statistics.median(modules[MODULE][1] for _, modules in runs) / 1000
+    process_ms = statistics.median(elapsed for elapsed, _ in runs) * 1000
+
+    print(f'import {MODULE:<20} {import_ms:8.1f} ms (median of {args.runs}, budget {args.budget_ms:.0f} ms)')
+    print(f'whole interpreter             {process_ms:8.1f} ms')
+    print('slowest modules (self time):')
+    modules = runs[-1][1]
+    for name, (self_time, _) in sorted(modules.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f'  {name:<40} {self_time / 1000:8.1f} ms')
+
+    failed = False
+    eager = [name for name in modules if name.split('.')[0] in LAZY_MODULES or name in LAZY_MODULES]
+    if eager:
+        print(f"These modules should only be imported when they are used: {', '.join(sorted(eager))}")
+        failed = True
+    if import_ms > args.budget_ms:
+        print(f"Importing {MODULE} takes {import_ms - args.budget_ms:.1f} ms longer than the budget")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,13 @@ class TestFull(unittest.TestCase):
         shutil.rmtree(self.dir)
         # Remove the SortConfig.ini
         os.remove(self.app.return_ini_location())
+        # Remove the show index if the sort created one
+        if os.path.exists(self.app.return_index_location()):
+            os.remove(self.app.return_index_location())
+        # And the catalog with its write ahead log
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.app.return_catalog_location() + suffix):
+                os.remove(self.app.return_catalog_location() + suffix)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import logging as log
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from NyaaSort import artwork
+
+SEARCH_PAGE = '<a class="hoverinfo_trigger" href="{base}/anime/1">Vinland Saga</a>'
+ANIME_PAGE = '<img class="ac" data-src="{base}/images/1.jpg">'
+EMPTY_PAGE = '<html></html>'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Pretends to be the anime site, every request gets counted so the tests can see what got cached
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        base = f'http://{server.server_address[0]}:{server.server_address[1]}'
+        if server.fail_next:
+            server.fail_next -= 1
+            status, body = 503, b''
+        elif self.path.startswith('/search') and 'Vinland' in self.path:
+            status, body = 200, SEARCH_PAGE.format(base=base).encode()
+        elif self.path.startswith('/search'):
+            status, body = 200, EMPTY_PAGE.encode()
+        elif self.path == '/anime/1':
+            status, body = 200, ANIME_PAGE.format(base=base).encode()
+        elif self.path == '/images/1.jpg':
+            status, body = 200, b'image data'
+        else:
+            status, body = 404, b''
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(artwork.BeautifulSoup is None, "bs4 is not installed")
+class TestArtwork(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.requests = []
+        self.server.fail_next = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.temp_dir, artwork.ARTWORK_CACHE_NAME)
+        self.logger = log.getLogger('test_artwork')
+
+    def fetcher(self):
+        return artwork.ArtworkFetcher(self.cache_path, self.logger, base_url=self.base_url, requests_per_second=0,
+                                      backoff=0)
+
+    def test_fetch(self):
+        images = self.fetcher().fetch_all(['Vinland Saga'])
+        self.assertEqual(images, {'Vinland Saga': b'image data'})
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_cache(self):
+        self.fetcher().fetch_all(['Vinland Saga'])
+        self.server.requests.clear()
+        # The pages are cached on disk, only the image itself has to be downloaded again
+        self.assertEqual(self.fetcher().fetch('Vinland Saga'), b'image data')
+        self.assertEqual(self.server.requests, ['/images/1.jpg'])
+
+    def test_negative_cache(self):
+        self.assertEqual(self.fetcher().fetch_all(['Unknown Show']), {'Unknown Show': None})
+        self.server.requests.clear()
+        self.assertEqual(self.fetcher().fetch('Unknown Show'), None)
+        self.assertEqual(self.server.requests, [])
+
+    def test_retry(self):
+        self.server.fail_next = 2
+        self.assertEqual(self.fetcher().fetch('Vinland Saga'), b'image data')
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_connection_failure_not_cached(self):
+        fetcher = artwork.ArtworkFetcher(self.cache_path, self.logger, base_url='http://127.0.0.1:1', retries=0,
+                                         requests_per_second=0, timeout=1)
+        self.assertEqual(fetcher.fetch('Vinland Saga'), None)
+        self.assertEqual(fetcher.cache.get('search', 'Vinland Saga'), (False, None))
+
+    def test_save_at_the_same_time(self):
+        # Profiles that run at the same time each save their own cache object to the same file
+        caches = [artwork.ArtworkCache(self.cache_path) for _ in range(4)]
+        for number, cache in enumerate(caches):
+            cache.set('search', f'Show {number}', None)
+        threads = [threading.Thread(target=lambda cache=cache: [cache.save() for _ in range(20)]) for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(os.listdir(self.temp_dir), [artwork.ARTWORK_CACHE_NAME])
+        # The file is always a whole cache, the one that got saved last
+        saved = artwork.ArtworkCache(self.cache_path)
+        self.assertEqual(sum(saved.get('search', f'Show {number}')[0] for number in range(4)), 1)
+
+    def test_rate_limiter(self):
+        limiter = artwork.RateLimiter(20)
+        start = time.monotonic()
+        for _ in range(5):
+            limiter.wait('example.org')
+        # The first request goes right away, the other four have to wait 50 ms each
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+from benchmarks import bench_sort
+from NyaaSort.NyaaSort import NyaaSort
+
+
+class TestBenchSort(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def test_build_library(self):
+        download_dir, sort_dir, backup_dir = bench_sort.build_library(self.temp_dir, 20, 100, 4096)
+        self.assertEqual(len(os.listdir(sort_dir)), 20)
+        self.assertEqual(len(os.listdir(download_dir)), 100)
+        self.assertEqual(os.listdir(backup_dir), [])
+        episode = os.path.join(download_dir, os.listdir(download_dir)[0])
+        self.assertEqual(os.path.getsize(episode), 4096)
+
+    def test_run(self):
+        # The benchmark sorts with a copy of the package, nothing next to the real script gets touched
+        script_dir = os.path.dirname(os.path.realpath(NyaaSort.return_ini_location()))
+        before = {name: os.stat(os.path.join(script_dir, name)).st_mtime_ns for name in os.listdir(script_dir)}
+        args = bench_sort.main_parser().parse_args(['--shows', '20', '--episodes', '50', '--size', '0',
+                                                    '--root', self.temp_dir])
+        results = bench_sort.run(args)
+        self.assertEqual(results['counts']['sorted'], 50)
+        after = {name: os.stat(os.path.join(script_dir, name)).st_mtime_ns for name in os.listdir(script_dir)}
+        self.assertEqual({name: mtime for name, mtime in after.items() if name != '__pycache__'},
+                         {name: mtime for name, mtime in before.items() if name != '__pycache__'})
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_compare(self):
+        baseline = {'params': {}, 'phases': {'parse': 1.0, 'plan': 0.01, 'move': 2.0}}
+        results = {'params': {}, 'phases': {'parse': 1.5, 'plan': 0.03, 'move': 2.1}}
+        # plan tripled but only by 20 ms, that is noise
+        self.assertEqual(bench_sort.compare(results, baseline, 0.2, 0.05), ['parse'])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
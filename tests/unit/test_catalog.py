@@ -0,0 +1,97 @@
+import unittest
+import os
+import shutil
+import tempfile
+from NyaaSort import catalog, media, release_parser
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.realpath(tempfile.mkdtemp())
+        self.library = os.path.join(self.dir, 'library')
+        self.backup = os.path.join(self.dir, 'backup')
+        self.catalog = catalog.Catalog(os.path.join(self.dir, catalog.CATALOG_NAME), release_parser.DEFAULT_PARSER)
+        # Two shows of which the folder name of one starts with the folder name of the other
+        self.folders = {'Vinland Saga': '[SubsPlease] Vinland Saga', 'Vinland Saga S2': '[SubsPlease] Vinland Saga S2'}
+        for anime, folder in self.folders.items():
+            self.catalog.record({'op': 'mkdir', 'dst': os.path.join(self.library, folder), 'anime': anime,
+                                 'folder': folder}, self.library)
+            for directory in (self.library, self.backup):
+                os.makedirs(os.path.join(directory, folder))
+        for anime, folder, number in (('Vinland Saga', '[SubsPlease] Vinland Saga', 1),
+                                      ('Vinland Saga', '[SubsPlease] Vinland Saga', 4),
+                                      ('Vinland Saga S2', '[SubsPlease] Vinland Saga S2', 1)):
+            name = f'[SubsPlease] {anime} - {number:02d} (1080p).mkv'
+            for directory in (self.library, self.backup):
+                with open(os.path.join(directory, folder, name), 'wb') as episode_file:
+                    episode_file.write(b'\x00' * 100)
+            src = os.path.join(self.dir, name)
+            self.catalog.record({'op': 'copy', 'src': src, 'dst': os.path.join(self.backup, folder, name),
+                                 'anime': anime}, self.library)
+            self.catalog.record({'op': 'move', 'src': src, 'dst': os.path.join(self.library, folder, name),
+                                 'anime': anime}, self.library)
+
+    def test_record(self):
+        self.assertEqual([(show.name, show.episodes, show.size) for show in self.catalog.shows(self.library)],
+                         [('Vinland Saga', 2, 200), ('Vinland Saga S2', 1, 100)])
+        episode = self.catalog.episodes(self.library, 'VINLAND SAGA S2')[0]
+        self.assertEqual((episode.group, episode.episode, episode.resolution), ('SubsPlease', 1, '1080p'))
+        self.assertEqual(episode.backup_path, os.path.join(self.backup, '[SubsPlease] Vinland Saga S2',
+                                                           os.path.basename(episode.path)))
+        self.assertEqual(self.catalog.shows(os.path.join(self.dir, 'other')), [])
+
+    def test_rename(self):
+        # Only the folder that got renamed changes, not the other show that starts with the same name
+        for directory, folder in ((self.library, 'folder'), (self.backup, None)):
+            operation = {'op': 'rename', 'src': os.path.join(directory, '[SubsPlease] Vinland Saga'),
+                         'dst': os.path.join(directory, '[Multiple groups] Vinland Saga'), 'anime': 'Vinland Saga'}
+            if folder:
+                operation['folder'] = '[Multiple groups] Vinland Saga'
+            self.catalog.record(operation, self.library)
+
+        show = self.catalog.shows(self.library, 'Vinland Saga')[0]
+        self.assertEqual((show.folder, show.group, show.episodes), ('[Multiple groups] Vinland Saga',
+                                                                    'Multiple groups', 2))
+        for episode in self.catalog.episodes(self.library):
+            expected = '[Multiple groups] Vinland Saga' if episode.show == 'Vinland Saga' else \
+                '[SubsPlease] Vinland Saga S2'
+            self.assertEqual(os.path.basename(os.path.dirname(episode.path)), expected)
+            self.assertEqual(os.path.basename(os.path.dirname(episode.backup_path)), expected)
+
+    def test_missing_and_remove(self):
+        self.assertEqual(self.catalog.missing(self.library), {(self.library, 'Vinland Saga'): [(1, 2), (1, 3)]})
+        path = self.catalog.episodes(self.library, 'Vinland Saga')[1].path
+        self.catalog.remove([path])
+        self.assertEqual(self.catalog.missing(self.library), {})
+
+    def test_rebuild(self):
+        episodes = self.catalog.episodes()
+        # A folder that was made by hand is picked up, the episodes that are gone are dropped
+        os.makedirs(os.path.join(self.library, '[Judas] Dr. Stone'))
+        self.catalog.save()
+        self.assertEqual(self.catalog.rebuild(self.library, self.backup, media.MediaDetector(media.DEFAULT_EXTENSIONS)),
+                         3)
+        self.assertEqual(self.catalog.episodes(), episodes)
+        self.assertEqual([show.name for show in self.catalog.shows()], ['Dr. Stone', 'Vinland Saga', 'Vinland Saga S2'])
+
+    def test_other_connection_can_write(self):
+        # Another run sorting into the same catalog never has to wait for this one to save
+        other = catalog.Catalog(self.catalog.path, release_parser.DEFAULT_PARSER)
+        try:
+            other.connection.execute('PRAGMA busy_timeout = 100')
+            self.catalog.record({'op': 'mkdir', 'dst': os.path.join(self.library, '[Judas] Dr. Stone'),
+                                 'anime': 'Dr. Stone', 'folder': '[Judas] Dr. Stone'}, self.library)
+            other.record({'op': 'mkdir', 'dst': os.path.join(self.library, '[Judas] Mushoku Tensei'),
+                          'anime': 'Mushoku Tensei', 'folder': '[Judas] Mushoku Tensei'}, self.library)
+            self.assertEqual(len(self.catalog.shows(self.library)), 4)
+        finally:
+            other.close()
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+from NyaaSort import dedupe, media, release_parser
+
+
+class TestDedupe(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.library = os.path.join(self.dir, 'library')
+        self.trash = os.path.join(self.dir, 'trash')
+        self.logger = logging.getLogger('NyaaSort Logger')
+        self.files = {
+            '[Multiple groups] Vinland Saga': {'[SubsPlease] Vinland Saga - 01 (1080p).mkv': 300,
+                                               '[Erai-raws] Vinland Saga - 01 [1080p].mkv': 400,
+                                               '[Erai-raws] Vinland Saga - 02v2 [1080p].mkv': 200,
+                                               '[Erai-raws] Vinland Saga - 02 [1080p].mkv': 250,
+                                               '[SubsPlease] Vinland Saga - 03 (1080p).mkv': 300},
+            '[Judas] Dr. Stone': {'[Judas] Dr. Stone - 03 [1080p].mkv': 300},
+        }
+        for folder, files in self.files.items():
+            os.makedirs(os.path.join(self.library, folder))
+            for name, size in files.items():
+                with open(os.path.join(self.library, folder, name), 'wb') as episode_file:
+                    episode_file.write(os.urandom(size))
+        self.episodes = dedupe.index_library(self.library, release_parser.DEFAULT_PARSER,
+                                             media.MediaDetector(media.DEFAULT_EXTENSIONS))
+
+    def removed(self, duplicates):
+        return sorted(os.path.basename(episode.path) for group in duplicates for episode in group.remove)
+
+    def test_index(self):
+        self.assertEqual(len(self.episodes), 6)
+        episode = [episode for episode in self.episodes if episode.version == 2][0]
+        self.assertEqual((episode.show, episode.group, episode.episode, episode.size), ('Vinland Saga', 'Erai-raws',
+                                                                                         2, 200))
+
+    def test_keep_policy(self):
+        # Episode 3 of Dr. Stone is a different show, so it is not a duplicate of episode 3 of Vinland Saga
+        duplicates = dedupe.find_duplicates(self.episodes, ('version', 'size'))
+        self.assertEqual(self.removed(duplicates), ['[Erai-raws] Vinland Saga - 02 [1080p].mkv',
+                                                    '[SubsPlease] Vinland Saga - 01 (1080p).mkv'])
+
+        duplicates = dedupe.find_duplicates(self.episodes, ('group', 'size'), ['SubsPlease'])
+        self.assertEqual(self.removed(duplicates), ['[Erai-raws] Vinland Saga - 01 [1080p].mkv',
+                                                    '[Erai-raws] Vinland Saga - 02v2 [1080p].mkv'])
+
+        with self.assertRaises(ValueError):
+            dedupe.parse_keep('version, newest')
+        self.assertEqual(dedupe.parse_keep('Size version'), ('size', 'version'))
+
+    def test_identical(self):
+        # The same file under another name is only found when asked for
+        folder = os.path.join(self.library, '[Judas] Dr. Stone')
+        shutil.copy(os.path.join(folder, '[Judas] Dr. Stone - 03 [1080p].mkv'),
+                    os.path.join(folder, '[Judas] Dr. Stone - Special [1080p].mkv'))
+        episodes = dedupe.index_library(self.library, release_parser.DEFAULT_PARSER,
+                                        media.MediaDetector(media.DEFAULT_EXTENSIONS))
+        self.assertEqual(len(dedupe.find_duplicates(episodes)), 2)
+        duplicates = dedupe.find_duplicates(episodes, identical=True)
+        self.assertEqual([group.kind for group in duplicates], ['episode', 'episode', 'identical'])
+
+        # Files of the same size with different data are not the same file
+        self.assertNotEqual(dedupe.partial_hash(os.path.join(folder, '[Judas] Dr. Stone - 03 [1080p].mkv'), 300),
+                            dedupe.partial_hash(os.path.join(self.library, '[Multiple groups] Vinland Saga',
+                                                             '[SubsPlease] Vinland Saga - 03 (1080p).mkv'), 300))
+
+    def test_remove(self):
+        duplicates = dedupe.find_duplicates(self.episodes)
+        removed, bytes_reclaimed, failed = dedupe.remove_duplicates(duplicates, self.library, self.trash, self.logger)
+        self.assertEqual((removed, bytes_reclaimed, failed), (2, 550, []))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.trash, '[Multiple groups] Vinland Saga'))),
+                         self.removed(duplicates))
+        self.assertEqual(len(os.listdir(os.path.join(self.library, '[Multiple groups] Vinland Saga'))), 3)
+
+    def test_remove_keeps_earlier_trash(self):
+        # An earlier run trashed copies with the same names, those stay next to the new ones
+        duplicates = dedupe.find_duplicates(self.episodes)
+        trash_folder = os.path.join(self.trash, '[Multiple groups] Vinland Saga')
+        os.makedirs(trash_folder)
+        for name in self.removed(duplicates):
+            with open(os.path.join(trash_folder, name), 'wb') as trashed_file:
+                trashed_file.write(b'earlier run')
+        self.assertEqual(dedupe.remove_duplicates(duplicates, self.library, self.trash, self.logger)[0], 2)
+        expected = self.removed(duplicates) + [f'{os.path.splitext(name)[0]} (1){os.path.splitext(name)[1]}'
+                                               for name in self.removed(duplicates)]
+        self.assertEqual(sorted(os.listdir(trash_folder)), sorted(expected))
+        for name in self.removed(duplicates):
+            with open(os.path.join(trash_folder, name), 'rb') as trashed_file:
+                self.assertEqual(trashed_file.read(), b'earlier run')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
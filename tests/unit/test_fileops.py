@@ -0,0 +1,60 @@
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+from NyaaSort import fileops
+
+
+class TestFileOps(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.backup_dir = os.path.join(self.dir, 'backup')
+        os.makedirs(self.backup_dir)
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        self.src = os.path.join(self.dir, '[SubsPlease] Vinland Saga - 01 (1080p).mkv')
+        with open(self.src, 'wb') as src_file:
+            src_file.write(self.data)
+        self.logger = logging.getLogger('NyaaSort Logger')
+
+    def read(self, path):
+        with open(path, 'rb') as read_file:
+            return read_file.read()
+
+    def test_kernel_copy(self):
+        dst = os.path.join(self.backup_dir, 'copy.mkv')
+        fileops.kernel_copy(self.src, dst)
+        self.assertEqual(self.read(dst), self.data)
+
+    def test_strategies(self):
+        for strategy in fileops.BACKUP_STRATEGIES:
+            dst = os.path.join(self.backup_dir, f'{strategy}.mkv')
+            fileops.FileOps(self.dir, None, self.backup_dir, strategy, self.logger).backup(self.src, dst)
+            self.assertEqual(self.read(dst), self.data)
+
+    def test_hardlink(self):
+        dst = os.path.join(self.backup_dir, 'hardlink.mkv')
+        file_ops = fileops.FileOps(self.dir, None, self.backup_dir, 'hardlink', self.logger)
+        self.assertEqual(file_ops.backup_method, 'hardlink')
+        file_ops.backup(self.src, dst)
+        self.assertEqual(os.stat(dst).st_ino, os.stat(self.src).st_ino)
+
+    def test_auto_never_hardlinks(self):
+        file_ops = fileops.FileOps(self.dir, None, self.backup_dir, 'auto', self.logger)
+        self.assertIn(file_ops.backup_method, ('reflink', 'copy'))
+
+    def test_move(self):
+        dst = os.path.join(self.backup_dir, 'moved.mkv')
+        file_ops = fileops.FileOps(self.dir, self.backup_dir, None, 'auto', self.logger)
+        self.assertEqual(file_ops.move_same_device, True)
+        file_ops.move(self.src, dst)
+        self.assertFalse(os.path.exists(self.src))
+        self.assertEqual(self.read(dst), self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
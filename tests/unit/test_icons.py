@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+import logging as log
+from NyaaSort import icons
+
+
+class TestIcons(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.folder = os.path.join(self.temp_dir, '[Judas] Vinland Saga')
+        os.makedirs(self.folder, exist_ok=True)
+        self.logger = log.getLogger('test_icons')
+
+    def test_batch_arguments(self):
+        pending = [(f'C:\\Anime\\Show {number}', f'Show {number}') for number in range(100)]
+        batches = icons.batch_arguments(pending, max_length=200)
+        self.assertGreater(len(batches), 1)
+        # Nothing gets lost and every folder stays next to its anime
+        self.assertEqual([argument for batch in batches for argument in batch],
+                         [argument for pair in pending for argument in pair])
+        self.assertTrue(all(len(batch) % 2 == 0 for batch in batches))
+        self.assertEqual(len(icons.batch_arguments(pending)), 1)
+
+    def test_null_backend(self):
+        backend = icons.create_backend('none', self.logger, 'set_folder_ico.ps1')
+        backend.add(self.folder, 'Vinland Saga')
+        self.assertEqual(backend.apply(), 1)
+        self.assertEqual(backend.applied, [(self.folder, 'Vinland Saga')])
+        self.assertEqual(backend.apply(), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'desktop.ini')))
+
+    def test_desktop_ini_backend(self):
+        backend = icons.create_backend('auto', self.logger, 'set_folder_ico.ps1')
+        self.assertIsInstance(backend, icons.DesktopIniBackend)
+        backend.add(self.folder, 'Vinland Saga')
+        self.assertEqual(backend.apply(), 1)
+        with open(os.path.join(self.folder, 'desktop.ini'), 'r', encoding='utf-16') as ini_file:
+            self.assertIn(f'IconResource={self.folder}\\Vinland Saga.ico,0', ini_file.read())
+
+        # An existing desktop.ini is never overwritten
+        backend.add(self.folder, 'Vinland Saga')
+        self.assertEqual(backend.apply(), 0)
+
+    def tearDown(self):
+        if os.name == 'nt':
+            # The backend made the folder read only
+            os.chmod(self.folder, 0o777)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import io
+import unittest
+import logging as log
+from NyaaSort import imaging
+
+
+@unittest.skipIf(imaging.Image is None, "Pillow is not installed")
+class TestImaging(unittest.TestCase):
+
+    @staticmethod
+    def poster(width=450, height=636):
+        output = io.BytesIO()
+        imaging.Image.new('RGB', (width, height), (200, 30, 30)).save(output, format='JPEG')
+        return output.getvalue()
+
+    def test_make_ico(self):
+        icon = imaging.Image.open(io.BytesIO(imaging.make_ico(self.poster())))
+        self.assertEqual(icon.format, 'ICO')
+        self.assertEqual(icon.info['sizes'], set(imaging.ICO_SIZES))
+        # The poster is centered, so the sides of the icon stay transparent
+        icon.size = (256, 256)
+        icon = icon.convert('RGBA')
+        self.assertEqual(icon.getpixel((0, 128))[3], 0)
+        self.assertEqual(icon.getpixel((128, 128))[3], 255)
+
+    def test_make_icos(self):
+        logger = log.getLogger('test_imaging')
+        icos = imaging.make_icos({'Vinland Saga': self.poster(), 'Dr. Stone': None, 'Broken': b'not an image'},
+                                 logger, workers=2)
+        self.assertEqual(list(icos), ['Vinland Saga'])
+        self.assertTrue(icos['Vinland Saga'].startswith(b'\x00\x00\x01\x00'))
+
+    def test_process_pool(self):
+        logger = log.getLogger('test_imaging')
+        min_bytes = imaging.PROCESS_MIN_BYTES
+        imaging.PROCESS_MIN_BYTES = 0
+        try:
+            icos = imaging.make_icos({'Vinland Saga': self.poster(), 'Broken': b'not an image'}, logger, workers=2)
+        finally:
+            imaging.PROCESS_MIN_BYTES = min_bytes
+        self.assertEqual(list(icos), ['Vinland Saga'])
+
+    def test_decompression_bomb(self):
+        # A poster that is too big to decode safely only costs the icon of that show
+        logger = log.getLogger('test_imaging')
+        max_pixels = imaging.Image.MAX_IMAGE_PIXELS
+        imaging.Image.MAX_IMAGE_PIXELS = 1000
+        try:
+            icos = imaging.make_icos({'Vinland Saga': self.poster(20, 30), 'Bomb': self.poster()}, logger, workers=2)
+        finally:
+            imaging.Image.MAX_IMAGE_PIXELS = max_pixels
+        self.assertEqual(list(icos), ['Vinland Saga'])
+
+
+if __name__ == '__main__':
+    unittest.main()
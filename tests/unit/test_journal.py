@@ -0,0 +1,146 @@
+import unittest
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from NyaaSort import fileops, journal, planner
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.anime_dir = os.path.join(self.dir, 'anime')
+        self.sort_dir = os.path.join(self.dir, 'sorted')
+        self.backup_dir = os.path.join(self.dir, 'backup')
+        for folder in (self.anime_dir, self.sort_dir, self.backup_dir):
+            os.makedirs(folder)
+        self.logger = logging.getLogger('NyaaSort Logger')
+        self.path = os.path.join(self.dir, journal.JOURNAL_NAME)
+
+        folder = '[Judas] Vinland Saga'
+        self.plan = planner.Plan(self.anime_dir, self.sort_dir, self.backup_dir)
+        self.plan.add('mkdir', os.path.join(self.sort_dir, folder), anime='Vinland Saga', folder=folder)
+        self.plan.add('mkdir', os.path.join(self.backup_dir, folder), anime='Vinland Saga')
+        self.items = ['[Judas] Vinland Saga - 01.mkv', '[Judas] Vinland Saga - 02.mkv']
+        for item in self.items:
+            src = os.path.join(self.anime_dir, item)
+            with open(src, 'wb') as episode_file:
+                episode_file.write(os.urandom(4096))
+            self.plan.add('copy', os.path.join(self.backup_dir, folder, item), src=src, size=4096)
+            self.plan.add('move', os.path.join(self.sort_dir, folder, item), src=src, size=4096)
+        self.file_ops = fileops.FileOps(self.anime_dir, self.sort_dir, self.backup_dir, 'copy', self.logger)
+
+    def check_finished(self):
+        for item in self.items:
+            self.assertEqual(os.path.getsize(os.path.join(self.sort_dir, '[Judas] Vinland Saga', item)), 4096)
+            self.assertEqual(os.path.getsize(os.path.join(self.backup_dir, '[Judas] Vinland Saga', item)), 4096)
+        self.assertEqual(os.listdir(self.anime_dir), [])
+
+    def test_no_journal(self):
+        self.assertEqual(journal.read_journal(self.path), None)
+
+    def test_resume(self):
+        # Run the folders and the first episode, then "crash" in the middle of the second backup
+        run = journal.Journal(self.path)
+        run.begin(self.plan)
+        for operation in self.plan.operations[:4]:
+            run.started(operation)
+            if operation['op'] == 'mkdir':
+                os.makedirs(operation['dst'])
+            elif operation['op'] == 'copy':
+                self.file_ops.backup(operation['src'], operation['dst'])
+            else:
+                self.file_ops.move(operation['src'], operation['dst'])
+            run.done(operation)
+        with open(self.plan.operations[4]['dst'], 'wb') as partial_file:
+            partial_file.write(b'half')
+        run.file.close()
+
+        plan, done = journal.read_journal(self.path)
+        self.assertEqual(done, {0, 1, 2, 3})
+        self.assertEqual(journal.replay(plan, done, self.file_ops, self.logger), (2, 0, 0))
+        self.check_finished()
+
+    def test_replay_is_idempotent(self):
+        # Everything finished but none of the done lines made it to the disk
+        run = journal.Journal(self.path)
+        run.begin(self.plan)
+        run.file.close()
+        plan, done = journal.read_journal(self.path)
+        journal.replay(plan, done, self.file_ops, self.logger)
+        self.check_finished()
+        self.assertEqual(journal.replay(plan, done, self.file_ops, self.logger)[1:], (0, 0))
+        self.check_finished()
+
+    def test_rollback(self):
+        # A second group for a show that is already sorted, the run died after renaming only the library folder
+        folder = '[Judas] Vinland Saga'
+        new_folder = '[Multiple groups] Vinland Saga'
+        for target in (self.sort_dir, self.backup_dir):
+            os.makedirs(os.path.join(target, folder))
+        plan = planner.Plan(self.anime_dir, self.sort_dir, self.backup_dir)
+        plan.add('rename', os.path.join(self.sort_dir, new_folder), src=os.path.join(self.sort_dir, folder),
+                 anime='Vinland Saga', folder=new_folder)
+        plan.add('rename', os.path.join(self.backup_dir, new_folder), src=os.path.join(self.backup_dir, folder),
+                 anime='Vinland Saga')
+        for item in self.items:
+            src = os.path.join(self.anime_dir, item)
+            plan.add('copy', os.path.join(self.backup_dir, new_folder, item), src=src, size=4096, anime='Vinland Saga')
+            plan.add('move', os.path.join(self.sort_dir, new_folder, item), src=src, size=4096, anime='Vinland Saga')
+        os.rename(os.path.join(self.sort_dir, folder), os.path.join(self.sort_dir, new_folder))
+        # And somebody removed the backup folder before the next run
+        os.rmdir(os.path.join(self.backup_dir, folder))
+
+        # The library folder gets its old name back and the episodes wait for the next run
+        self.assertEqual(journal.replay(plan, {0}, self.file_ops, self.logger), (0, 1, 1))
+        self.assertEqual(os.listdir(self.sort_dir), [folder])
+        self.assertEqual(os.listdir(self.backup_dir), [])
+        self.assertEqual(sorted(os.listdir(self.anime_dir)), sorted(self.items))
+
+    def test_finish(self):
+        run = journal.Journal(self.path)
+        run.begin(self.plan)
+        run.finish()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_claim(self):
+        run = journal.Journal(journal.run_path(self.path))
+        run.begin(self.plan)
+        self.assertEqual(journal.find_journals(self.path), [run.path])
+        # The run is still going
+        self.assertEqual(journal.claim(run.path), None)
+        run.close()
+        fd = journal.claim(run.path)
+        self.assertNotEqual(fd, None)
+        # Somebody is already recovering it
+        self.assertEqual(journal.claim(run.path), None)
+        journal.release(run.path, fd, True)
+        self.assertEqual(journal.find_journals(self.path), [])
+        self.assertEqual(journal.claim(run.path), None)
+
+    def test_claim_other_process(self):
+        # Reading the plan must not let go of the claim, the locks of the file system are per process so check it
+        # from a process of its own
+        run = journal.Journal(journal.run_path(self.path))
+        run.begin(self.plan)
+        run.close()
+        fd = journal.claim(run.path)
+        plan, done = journal.read_journal(run.path, fd)
+        self.assertEqual((len(plan.operations), done), (len(self.plan.operations), set()))
+
+        code = "import sys; from NyaaSort import journal; print(journal.claim(sys.argv[1]) is None)"
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+        result = subprocess.run([sys.executable, '-c', code, run.path], cwd=root, capture_output=True, text=True,
+                                check=True)
+        self.assertEqual(result.stdout.strip(), 'True')
+        journal.release(run.path, fd, True)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os
+import shutil
+import tempfile
+from NyaaSort import layout, release_parser
+
+
+class TestLayout(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.name = '[SubsPlease] Vinland Saga S02E05v2 (1080p) [ABCD1234].mkv'
+        self.release = release_parser.parse(self.name)
+
+    def test_episode_path(self):
+        self.assertEqual(layout.episode_path(layout.DEFAULT_LAYOUT, self.name, self.release), self.name)
+        self.assertEqual(layout.episode_path('Season {season:02d}/{name}', self.name, self.release),
+                         os.path.join('Season 02', self.name))
+        self.assertEqual(layout.episode_path('Season {season}/{title} - {episode:02d}v{version}.{extension}',
+                                             self.name, self.release),
+                         os.path.join('Season 2', 'Vinland Saga - 05v2.mkv'))
+
+        # Shows without a season are the first season, episodes that do not fit the layout keep their name
+        name = '[Judas] Dr. Stone - 12.5 [1080p].mkv'
+        self.assertEqual(layout.episode_path('Season {season}/{name}', name, release_parser.parse(name)),
+                         os.path.join('Season 1', name))
+        self.assertEqual(layout.episode_path('{episode:02d}.mkv', name, release_parser.parse(name)), name)
+        self.assertEqual(layout.episode_path('../{name}', name, release_parser.parse(name)), name)
+
+    def test_validate(self):
+        layout.validate('Season {season:02d}/{name}')
+        for template in ('', '{missing}/{name}', '/{name}', '../{name}'):
+            with self.assertRaises(ValueError):
+                layout.validate(template)
+
+    def test_folders(self):
+        show_folder = os.path.join(self.dir, '[SubsPlease] Vinland Saga')
+        os.makedirs(os.path.join(show_folder, 'Season 01', 'Extras'))
+        os.makedirs(os.path.join(show_folder, 'Season 02'))
+        for relative in ('01.mkv', os.path.join('Season 01', '02.mkv'), os.path.join('Season 02', '03.mkv')):
+            with open(os.path.join(show_folder, relative), 'wb'):
+                pass
+        self.assertEqual(sorted(layout.iter_episodes(show_folder)),
+                         sorted(['01.mkv', os.path.join('Season 01', '02.mkv'), os.path.join('Season 02', '03.mkv')]))
+
+        # Only the empty folders go, the show folder always stays
+        os.remove(os.path.join(show_folder, 'Season 01', '02.mkv'))
+        removed = layout.remove_empty_folders([os.path.join(show_folder, 'Season 01', 'Extras'),
+                                               os.path.join(show_folder, 'Season 02')], [self.dir])
+        self.assertEqual(removed, 2)
+        self.assertEqual(sorted(os.listdir(show_folder)), ['01.mkv', 'Season 02'])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
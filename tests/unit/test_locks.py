@@ -0,0 +1,71 @@
+import unittest
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from NyaaSort import locks
+
+
+class TestLocks(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.lock = locks.LibraryLock(self.dir)
+        self.other = locks.LibraryLock(self.dir)
+
+    def test_shows(self):
+        held = self.lock.shows(['Vinland Saga'])
+        # The same show written a bit differently is the same lock, other shows are free
+        self.assertEqual(self.other.shows(['Dr. Stone', 'VINLAND SAGA!'], blocking=False), 'VINLAND SAGA!')
+        other_held = self.other.shows(['Dr. Stone'], blocking=False)
+        self.assertIsInstance(other_held, locks.ShowLocks)
+        held.release()
+        self.assertIsInstance(self.other.shows(['Vinland Saga'], blocking=False), locks.ShowLocks)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, locks.LOCK_NAME)))
+
+    def test_other_process(self):
+        # Locks of the file system are per process, so check them from a process of its own
+        code = ("import sys; from NyaaSort import locks; "
+                "held = locks.LibraryLock(sys.argv[1]).shows(['Vinland Saga']); "
+                "print('locked', flush=True); sys.stdin.readline(); held.release()")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+        process = subprocess.Popen([sys.executable, '-c', code, self.dir], cwd=root, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, text=True)
+        try:
+            self.assertEqual(process.stdout.readline().strip(), 'locked')
+            self.assertEqual(self.lock.shows(['Vinland Saga'], blocking=False), 'Vinland Saga')
+            self.assertIsInstance(self.lock.shows(['Dr. Stone'], blocking=False), locks.ShowLocks)
+            process.stdin.write('\n')
+            process.stdin.flush()
+            process.wait(10)
+            self.lock.shows(['Vinland Saga']).release()
+        finally:
+            process.kill()
+            process.wait()
+
+    def test_everything(self):
+        held = self.lock.shows(['Vinland Saga'])
+        events = []
+
+        def maintenance():
+            with self.other.everything():
+                events.append('everything')
+        thread = threading.Thread(target=maintenance)
+        thread.start()
+        time.sleep(0.2)
+        # It has to wait for the show that is being sorted
+        events.append('released')
+        held.release()
+        thread.join(10)
+        self.assertEqual(events, ['released', 'everything'])
+        self.lock.shows(['Dr. Stone']).release()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from NyaaSort import matcher
+
+
+class TestMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.shows = ['Shingeki no Kyojin (The Final Season)', 'Kimetsu no Yaiba', 'Boku no Hero Academia 5',
+                      'Re:Zero kara Hajimeru Isekai Seikatsu 2nd Season', 'Vinland Saga']
+        self.matcher = matcher.ShowMatcher(self.shows, aliases={'Demon Slayer': 'Kimetsu no Yaiba',
+                                                                'Attack on Titan': 'Shingeki no Kyojin'})
+
+    def test_normalize(self):
+        self.assertEqual(matcher.normalize('Shingeki no Kyojin (The Final Season)'),
+                         matcher.normalize('Shingeki no Kyojin - The Final Season'))
+        for title in ('Re Zero Season 2', 'Re-Zero 2nd Season', 'RE:ZERO S02', 'Re Zero Second Season'):
+            self.assertEqual(matcher.normalize(title), 're zero s2')
+        self.assertEqual(matcher.normalize('Pokémon'), 'pokemon')
+
+    def test_match(self):
+        self.assertEqual(self.matcher.match('Shingeki no Kyojin - The Final Season'), self.shows[0])
+        self.assertEqual(self.matcher.match('KIMETSU NO YAIBA'), self.shows[1])
+        self.assertEqual(self.matcher.match('Re Zero kara Hajimeru Isekai Seikatsu Season 2'), self.shows[3])
+        # A typo is close enough, a different season or a different show is not
+        self.assertEqual(self.matcher.match('Kimetsu no Yaibaa'), self.shows[1])
+        self.assertIsNone(self.matcher.match('Boku no Hero Academia 6'))
+        self.assertIsNone(self.matcher.match('Shingeki no Kyojin'))
+        self.assertIsNone(self.matcher.match('Vinland'))
+
+    def test_threshold(self):
+        strict = matcher.ShowMatcher(self.shows, threshold=1)
+        self.assertEqual(strict.match('kimetsu no yaiba!'), self.shows[1])
+        self.assertIsNone(strict.match('Kimetsu no Yaibaa'))
+
+    def test_aliases(self):
+        self.assertEqual(self.matcher.match('Demon Slayer'), self.shows[1])
+        # The alias points to a show that is not in the library yet, the new folder should get that name
+        self.assertIsNone(self.matcher.match('attack on titan'))
+        self.assertEqual(self.matcher.canonical('attack on titan'), 'Shingeki no Kyojin')
+        self.assertEqual(self.matcher.canonical('Vinland Saga'), 'Vinland Saga')
+
+    def test_add(self):
+        self.assertIsNone(self.matcher.match('Dr Stone'))
+        self.matcher.add('Dr. Stone')
+        self.matcher.add('DR STONE')
+        self.assertEqual(len(self.matcher), len(self.shows) + 1)
+        self.assertEqual(self.matcher.match('Dr Stone'), 'Dr. Stone')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from NyaaSort import media
+
+
+class CountingDetector(media.MediaDetector):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = 0
+
+    def read_header(self, path):
+        self.reads += 1
+        return super().read_header(path)
+
+
+class TestMedia(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def make(self, name, header):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'wb') as media_file:
+            media_file.write(header + bytes(1024))
+        return path
+
+    def test_extensions(self):
+        detector = media.MediaDetector()
+        self.assertTrue(detector.is_video('[Judas] Vinland Saga - 01.mkv'))
+        self.assertTrue(detector.is_video('[Judas] Vinland Saga - 01.MP4'))
+        self.assertFalse(detector.is_video('[Judas] Vinland Saga - 01.mkv.part'))
+        # guess_type returned None for these, which used to crash the sort
+        self.assertFalse(detector.is_video('README'))
+        self.assertFalse(detector.is_video('.mkv'))
+
+    def test_signatures(self):
+        detector = media.MediaDetector()
+        self.assertEqual(detector.container(b'\x1a\x45\xdf\xa3\x01\x00'), 'matroska')
+        self.assertEqual(detector.container(b'\x00\x00\x00\x20ftypisom'), 'mp4')
+        self.assertEqual(detector.container(b'RIFF\x00\x00\x00\x00AVI LIST'), 'avi')
+        self.assertEqual(detector.container(b'\x47' + bytes(187) + b'\x47'), 'mpeg-ts')
+        self.assertEqual(detector.container(b'<html>'), None)
+
+    def test_sniff(self):
+        detector = CountingDetector(sniff=True)
+        video = self.make('episode.mkv', b'\x1a\x45\xdf\xa3')
+        fake = self.make('fake.mkv', b'<html>not found</html>')
+        self.assertTrue(detector.is_video(video))
+        self.assertFalse(detector.is_video(fake))
+        self.assertFalse(detector.is_video(os.path.join(self.temp_dir, 'gone.mkv')))
+
+        # Looking at the same files again never opens them
+        reads = detector.reads
+        self.assertTrue(detector.is_video(video))
+        self.assertFalse(detector.is_video(fake))
+        self.assertEqual(detector.reads, reads)
+
+        # Once the download is done the file changes, so it has to be read again
+        self.make('fake.mkv', b'\x00\x00\x00\x18ftypmp42')
+        os.utime(fake, ns=(0, 10 ** 9))
+        self.assertTrue(detector.is_video(fake))
+        self.assertEqual(detector.reads, reads + 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
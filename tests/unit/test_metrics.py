@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from NyaaSort import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.metrics = metrics.Metrics()
+        with self.metrics.phase('transfers'):
+            pass
+        self.metrics.add_time('transfers', 2.0)
+        self.metrics.count('files_moved', 10)
+        self.metrics.count('bytes_moved', 1024)
+        self.metrics.error('parse')
+        self.metrics.error('parse')
+
+    def test_to_dict(self):
+        data = self.metrics.to_dict()
+        self.assertEqual(data['phases']['transfers']['calls'], 2)
+        self.assertGreaterEqual(data['phases']['transfers']['seconds'], 2.0)
+        self.assertEqual(data['errors'], {'parse': 2})
+        self.assertAlmostEqual(data['rates']['files_per_second'], 5.0, places=2)
+
+    def test_save_json(self):
+        path = os.path.join(self.temp_dir, 'metrics.json')
+        self.metrics.save_json(path)
+        with open(path, 'r', encoding='utf-8') as metrics_file:
+            self.assertEqual(json.load(metrics_file)['counters'], {'files_moved': 10, 'bytes_moved': 1024})
+
+    def test_prometheus(self):
+        path = os.path.join(self.temp_dir, 'nyaasort.prom')
+        self.metrics.save_prometheus(path)
+        with open(path, 'r', encoding='utf-8') as metrics_file:
+            lines = metrics_file.read().splitlines()
+        self.assertIn('# TYPE nyaasort_phase_seconds gauge', lines)
+        self.assertIn('nyaasort_files_moved 10', lines)
+        self.assertIn('nyaasort_errors{category="parse"} 2', lines)
+        # Only the file itself is left, readable by the node exporter
+        self.assertEqual(os.listdir(self.temp_dir), ['nyaasort.prom'])
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+
+    def test_escape_label(self):
+        self.assertEqual(metrics.escape_label('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
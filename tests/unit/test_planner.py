@@ -0,0 +1,49 @@
+import unittest
+import os
+import shutil
+import tempfile
+from NyaaSort import planner
+
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.plan = planner.Plan('/anime', '/sorted', '/backup')
+        self.plan.add('mkdir', '/sorted/[Judas] Vinland Saga', anime='Vinland Saga', folder='[Judas] Vinland Saga')
+        self.plan.add('mkdir', '/backup/[Judas] Vinland Saga', anime='Vinland Saga')
+        for episode in ('01', '02'):
+            item = f'[Judas] Vinland Saga - {episode}.mkv'
+            self.plan.add('copy', f'/backup/[Judas] Vinland Saga/{item}', src=f'/anime/{item}', size=100)
+            self.plan.add('move', f'/sorted/[Judas] Vinland Saga/{item}', src=f'/anime/{item}', size=100)
+
+    def test_jobs(self):
+        self.assertEqual([operation['op'] for operation in self.plan.structural()], ['mkdir', 'mkdir'])
+        jobs = self.plan.transfer_jobs()
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual([operation['op'] for operation in jobs[0]], ['copy', 'move'])
+        self.assertEqual(self.plan.total_bytes('move'), 200)
+        self.assertEqual(self.plan.total_bytes(), 400)
+
+    def test_save_and_load(self):
+        path = os.path.join(self.dir, 'plan.json')
+        self.plan.save(path)
+        loaded = planner.Plan.load(path)
+        self.assertEqual(loaded.operations, self.plan.operations)
+        self.assertEqual((loaded.dir_path, loaded.sort_dir, loaded.backup_dir), ('/anime', '/sorted', '/backup'))
+
+    def test_invalid_plans(self):
+        with self.assertRaises(ValueError):
+            planner.Plan.from_dict({'version': 0, 'operations': []})
+        with self.assertRaises(ValueError):
+            planner.Plan.from_dict({'version': planner.PLAN_VERSION, 'operations': [{'op': 'delete', 'dst': '/x'}]})
+        with self.assertRaises(ValueError):
+            planner.Plan.from_dict({'version': planner.PLAN_VERSION,
+                                    'operations': [{'op': 'move', 'src': 'relative.mkv', 'dst': '/x'}]})
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import configparser
+import unittest
+from NyaaSort import profiles
+
+
+class TestProfiles(unittest.TestCase):
+
+    def test_profile_names(self):
+        config = configparser.ConfigParser()
+        config.read_string('[SORT]\nLOGGING = False\n[SORT:tv]\nDIRECTORY = a\n[PARSER]\n[SORT:movies]\n')
+        self.assertEqual(profiles.profile_names(config), ['tv', 'movies'])
+        self.assertEqual(profiles.section_name(None), 'SORT')
+        self.assertEqual(profiles.section_name('tv'), 'SORT:tv')
+
+    def test_group_by_device(self):
+        groups = profiles.group_by_device([('a', {1}), ('b', {2}), ('c', {3, 1}), ('d', {2, 4}), ('e', {5}),
+                                           ('f', {3, 4})])
+        # f links the group of a and c to the one of b and d
+        self.assertEqual(groups, [['a', 'b', 'c', 'd', 'f'], ['e']])
+
+    def test_run_groups(self):
+        ran = []
+
+        def run(name):
+            if name == 'broken':
+                raise OSError("disk is gone")
+            ran.append(name)
+
+        class Logger:
+            errors = []
+
+            def error(self, message):
+                self.errors.append(message)
+
+        logger = Logger()
+        profiles.run_groups([['a', 'broken', 'b'], ['c']], run, logger)
+        self.assertEqual(sorted(ran), ['a', 'b', 'c'])
+        self.assertEqual(len(logger.errors), 1)
+        # The profiles of one group keep their order
+        self.assertLess(ran.index('a'), ran.index('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
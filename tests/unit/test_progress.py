@@ -0,0 +1,57 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from NyaaSort import progress
+
+
+class TestProgress(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'progress.jsonl')
+        self.jobs = [[{'op': 'copy', 'src': '/a/one.mkv', 'dst': '/b/one.mkv', 'size': 300},
+                      {'op': 'move', 'src': '/a/one.mkv', 'dst': '/c/one.mkv', 'size': 300}],
+                     [{'op': 'mkdir', 'dst': '/c/show'}]]
+
+    def read(self):
+        with open(self.path, encoding='utf-8') as progress_file:
+            return [json.loads(line) for line in progress_file]
+
+    def test_events(self):
+        calls = []
+        run = progress.Progress(self.jobs, self.path, interval=0)
+        callback = run.callback(calls.append)
+        callback(100)
+        callback(200)
+        run.done(self.jobs[0][0], True, 0.5)
+        # A move on the same disk never reports any pieces, all of it is counted when it is done
+        run.done(self.jobs[0][1], False, 0.1)
+        run.finish()
+
+        # The throttle still gets every piece
+        self.assertEqual(calls, [100, 200])
+        records = self.read()
+        self.assertEqual(records[0]['event'], 'start')
+        self.assertEqual((records[0]['operations'], records[0]['bytes']), (2, 600))
+        snapshot = records[1]
+        self.assertEqual((snapshot['event'], snapshot['done_bytes'], snapshot['total_bytes']), ('progress', 100, 600))
+        self.assertIsNotNone(snapshot['eta_seconds'])
+        files = [record for record in records if record['event'] == 'file']
+        self.assertEqual([(record['name'], record['ok']) for record in files], [('one.mkv', True), ('one.mkv', False)])
+        self.assertEqual(files[0]['bytes_per_second'], 600)
+        # The failed move does not count towards the total anymore
+        self.assertEqual(records[-2]['total_bytes'], 300)
+        self.assertEqual((records[-1]['event'], records[-1]['done_bytes'], records[-1]['failed_operations']),
+                         ('finish', 300, 1))
+
+    def test_format_duration(self):
+        self.assertEqual([progress.format_duration(seconds) for seconds in (5, 125, 7300)], ['5s', '2m05s', '2h01m'])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
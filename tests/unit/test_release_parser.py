@@ -0,0 +1,72 @@
+import unittest
+from NyaaSort import release_parser
+
+
+class TestReleaseParser(unittest.TestCase):
+
+    def test_nyaa_format(self):
+        release = release_parser.parse('[SubsPlease] Shingeki no Kyojin (The Final Season) - 05 (1080p) [ABCD1234].mkv')
+        self.assertEqual(release.group, 'SubsPlease')
+        self.assertEqual(release.title, 'Shingeki no Kyojin (The Final Season)')
+        self.assertEqual(release.episode, 5)
+        self.assertEqual(release.resolution, '1080p')
+        self.assertEqual(release.crc, 'ABCD1234')
+        self.assertEqual(release.extension, 'mkv')
+
+    def test_dash_in_title(self):
+        release = release_parser.parse('[Erai-raws] Enen no Shouboutai - Ni no Shou - 05 '
+                                       '[1080p][Multiple Subtitle].mkv')
+        self.assertEqual(release.title, 'Enen no Shouboutai - Ni no Shou')
+        self.assertEqual(release.episode, 5)
+
+    def test_version(self):
+        release = release_parser.parse('[Judas] Vinland Saga - 12v2 [720p].mkv')
+        self.assertEqual((release.title, release.episode, release.version), ('Vinland Saga', 12, 2))
+
+    def test_season_episode(self):
+        release = release_parser.parse('[Judas] Dr. Stone S02E07 [1080p].mkv')
+        self.assertEqual((release.title, release.season, release.episode), ('Dr. Stone', 2, 7))
+
+    def test_batch(self):
+        release = release_parser.parse('[Judas] Vinland Saga (01-24) [1080p].mkv')
+        self.assertEqual((release.title, release.episode, release.episode_end), ('Vinland Saga', 1, 24))
+
+    def test_underscores(self):
+        release = release_parser.parse('[Group]_Some_Title_-_03_[720p]_[DEADBEEF].mkv')
+        self.assertEqual((release.title, release.episode, release.crc), ('Some Title', 3, 'DEADBEEF'))
+
+    def test_old_split_fallback(self):
+        # The old string splitting accepted anything with a group and a -, that still has to work
+        release = release_parser.parse('[Group] Some Movie - The Movie [1080p].mkv')
+        self.assertEqual((release.group, release.title, release.episode), ('Group', 'Some Movie', None))
+
+    def test_no_match(self):
+        self.assertEqual(release_parser.parse('Some Show - 05.mkv'), None)
+        self.assertEqual(release_parser.parse('[Group] no episode.mkv'), None)
+
+    def test_extra_patterns(self):
+        parser = release_parser.ReleaseParser([r'^(?P<title>.+)\.E(?P<episode>\d+)\.(?P<group>\w+)$'])
+        release = parser.parse('Vinland.Saga.E05.Judas.mkv')
+        self.assertEqual((release.group, release.title, release.episode), ('Judas', 'Vinland.Saga', 5))
+        with self.assertRaises(ValueError):
+            release_parser.ReleaseParser([r'(?P<title>.+)'])
+
+    def test_usual_same_as_patterns(self):
+        # The usual names skip the patterns, they have to end up the same as when they go through them
+        patterns_only = release_parser.ReleaseParser()
+        patterns_only.fast_path = False
+        names = ['[SubsPlease] Vinland Saga - 05 (1080p) [ABCD1234].mkv', '[A] B - 12.5v3 [720p].mp4',
+                 '[A] Title - 01 - 02 [1080p].mkv', '[A] Title - 12345 [1080p].mkv', '[A] Title - 05x [1080p].mkv',
+                 '[A] Title - 05 [Multi-Sub].mkv', '[A]  - 05.mkv', '[] Title - 05.mkv', '[A] Title -\t05 -05.mkv',
+                 '[A][B] Title - 05 (1920x1080).mkv', '[A] Title - 05', '[A] Title - 05v (1080p).mkv']
+        for name in names:
+            self.assertEqual(release_parser.parse(name), patterns_only.parse(name), name)
+
+    def test_cache(self):
+        parser = release_parser.ReleaseParser()
+        name = '[Judas] Vinland Saga - 12 [720p].mkv'
+        self.assertIs(parser.parse(name), parser.parse(name))
+
+
+if __name__ == '__main__':
+    unittest.main()
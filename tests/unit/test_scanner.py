@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import unittest
+from NyaaSort import scanner
+
+
+class TestScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.temp_dir, '[Judas] Vinland Saga', 'Extras'))
+        os.makedirs(os.path.join(self.temp_dir, '[Erai-raws] Dr. Stone'))
+        for name, size in (('[Judas] Vinland Saga - 01.mkv', 10), ('notes.txt', 3)):
+            with open(os.path.join(self.temp_dir, name), 'wb') as scan_file:
+                scan_file.write(bytes(size))
+
+    def test_split(self):
+        files, folders = scanner.split(self.temp_dir)
+        self.assertEqual(sorted(folders), ['[Erai-raws] Dr. Stone', '[Judas] Vinland Saga'])
+        self.assertEqual(sorted((entry.name, scanner.entry_stat(entry).st_size) for entry in files),
+                         [('[Judas] Vinland Saga - 01.mkv', 10), ('notes.txt', 3)])
+
+    def test_streaming(self):
+        files = scanner.iter_files(self.temp_dir)
+        # Nothing is read until the first file is asked for
+        self.assertFalse(isinstance(files, list))
+        self.assertEqual(sorted(entry.name for entry in files), ['[Judas] Vinland Saga - 01.mkv', 'notes.txt'])
+        self.assertEqual(sorted(scanner.list_folders(self.temp_dir)), ['[Erai-raws] Dr. Stone', '[Judas] Vinland Saga'])
+
+    def test_entry_stat_gone(self):
+        files, _ = scanner.split(self.temp_dir)
+        entry = next(entry for entry in files if entry.name == 'notes.txt')
+        os.remove(entry.path)
+        self.assertEqual(scanner.entry_stat(entry), None)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
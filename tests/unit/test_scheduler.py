@@ -0,0 +1,87 @@
+import unittest
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from NyaaSort import scheduler
+
+
+class FakeFileOps:
+    backup_method = 'copy'
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.logger = logging.getLogger('NyaaSort Logger')
+        os.makedirs(os.path.join(self.dir, 'backup'))
+        os.makedirs(os.path.join(self.dir, 'sorted'))
+        self.jobs = []
+        for number in range(3):
+            src = os.path.join(self.dir, f'[Judas] Vinland Saga - {number:02d}.mkv')
+            self.jobs.append([{'op': 'copy', 'src': src, 'dst': os.path.join(self.dir, 'backup', f'{number}.mkv'),
+                               'size': 10},
+                              {'op': 'move', 'src': src, 'dst': os.path.join(self.dir, 'sorted', f'{number}.mkv'),
+                               'size': 10}])
+
+    def test_throttle(self):
+        throttle = scheduler.Throttle(1024 * 1024)
+        start_time = time.monotonic()
+        for _ in range(4):
+            throttle(64 * 1024)
+        # 256 KB at 1 MB/s
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.2)
+
+    def test_lanes(self):
+        backups = [job[0] for job in self.jobs]
+        # Everything is on the same disk, copies still have to read and write data
+        self.assertEqual(scheduler.lanes(backups, FakeFileOps()), [sorted(backups, key=lambda op: op['src'])])
+
+        # Moves on the same disk are renames, those go into the lane that does not touch any data
+        moves = [job[1] for job in self.jobs]
+        file_ops = FakeFileOps()
+        file_ops.backup_method = 'reflink'
+        self.assertEqual(scheduler.lanes(moves + backups, file_ops), [moves + backups])
+
+    def test_run_jobs(self):
+        applied = []
+        threads = set()
+
+        def apply(operation):
+            applied.append(operation)
+            threads.add(threading.current_thread())
+            # The backup of the second episode fails, so it should never be moved
+            return operation is not self.jobs[1][0]
+
+        moved = scheduler.run_jobs(self.jobs, FakeFileOps(), apply, self.logger)
+        self.assertEqual(moved, 20)
+        # All backups come before all moves
+        self.assertEqual([operation['op'] for operation in applied], ['copy'] * 3 + ['move'] * 2)
+        self.assertNotIn(self.jobs[1][1], applied)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), "Only linux lowers the priority of a single thread")
+    def test_lower_priority(self):
+        # Only the calling thread gets a lower priority, so do it in a thread of its own
+        result = []
+
+        def lower():
+            result.append(scheduler.lower_priority(self.logger))
+            result.append(os.getpriority(os.PRIO_PROCESS, 0))
+        before = os.getpriority(os.PRIO_PROCESS, 0)
+        thread = threading.Thread(target=lower)
+        thread.start()
+        thread.join()
+        self.assertEqual(result, [True, 19])
+        self.assertEqual(os.getpriority(os.PRIO_PROCESS, 0), before)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import os
+import shutil
+import tempfile
+from NyaaSort import show_index
+
+
+class TestShowIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.library = os.path.join(self.dir, 'library')
+        os.makedirs(os.path.join(self.library, '[SubsPlease] Vinland Saga'))
+        self.path = os.path.join(self.dir, show_index.INDEX_NAME)
+        self.anime_dict = {'Vinland Saga': '[SubsPlease] Vinland Saga'}
+
+    def saved_index(self):
+        index = show_index.ShowIndex(self.path, self.library)
+        index.rebuild(self.anime_dict)
+        index.save()
+        return index
+
+    def test_load(self):
+        self.assertEqual(show_index.ShowIndex(self.path, self.library).load(), None)
+        self.saved_index()
+        self.assertEqual(show_index.ShowIndex(self.path, self.library).load(), self.anime_dict)
+        # The temporary file the index was saved through is gone
+        self.assertEqual(sorted(os.listdir(self.dir)), [show_index.INDEX_NAME, 'library'])
+
+    def test_own_changes(self):
+        index = self.saved_index()
+        mtime_before = index.library_mtime()
+        os.makedirs(os.path.join(self.library, '[Erai-raws] Dr. Stone'))
+        index.update('Dr. Stone', '[Erai-raws] Dr. Stone', mtime_before)
+        index.save()
+        self.assertEqual(show_index.ShowIndex(self.path, self.library).load(),
+                         dict(self.anime_dict, **{'Dr. Stone': '[Erai-raws] Dr. Stone'}))
+
+    def test_outside_changes(self):
+        index = self.saved_index()
+        # Somebody else adds a folder, the index should no longer be trusted
+        os.makedirs(os.path.join(self.library, '[Erai-raws] Dr. Stone'))
+        os.utime(self.library, ns=(0, index.mtime_ns + 1))
+        self.assertEqual(show_index.ShowIndex(self.path, self.library).load(), None)
+
+    def test_broken_file(self):
+        with open(self.path, 'w') as index_file:
+            index_file.write('{not json')
+        self.assertEqual(show_index.ShowIndex(self.path, self.library).load(), None)
+        self.saved_index()
+        self.assertEqual(show_index.ShowIndex(self.path, self.library).load(), self.anime_dict)
+        # The temporary file the index was saved through is gone
+        self.assertEqual(sorted(os.listdir(self.dir)), [show_index.INDEX_NAME, 'library'])
+
+    def test_folder_group(self):
+        self.assertEqual(show_index.folder_group('[Multiple groups] Vinland Saga'), 'Multiple groups')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -43,6 +43,13 @@ class TestSimple(unittest.TestCase):
         self.assertEqual(self.app(self.dir).get_anime_dict(folders), folders_dict)
         self.assertEqual(self.app(self.dir, 0).get_anime_dict(folders), folders_dict)
 
+    def test_logger_handlers(self):
+        # Every sorter shares the logger, making more of them should not print every line more than once
+        handlers = len(self.app(self.dir, 'False').logger.handlers)
+        for _ in range(3):
+            logger = self.app(self.dir, 'False').logger
+        self.assertEqual(len(logger.handlers), handlers)
+
     def test_ini_location(self):
         self.assertEqual(self.app(self.dir, 'True', 'False', 'Output Dir', 'Backup Dir').return_ini_location(),
                          self.app.return_ini_location())
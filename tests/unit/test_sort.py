@@ -0,0 +1,455 @@
+import unittest
+import asyncio
+import json
+import threading
+import time
+from NyaaSort.NyaaSort import NyaaSort
+from NyaaSort import journal, locks
+import tests.utils
+import os
+import shutil
+import subprocess
+import sys
+
+
+class TestSort(unittest.TestCase):
+
+    def setUp(self):
+        base_dir = os.path.dirname(os.path.realpath(__file__))
+        self.dir = tests.utils.copy_tree(base_dir)
+        self.sort_dir = os.path.join(self.dir, 'sorted')
+        self.backup_dir = os.path.join(self.dir, 'backup')
+        os.makedirs(self.sort_dir)
+        os.makedirs(self.backup_dir)
+        self.app = NyaaSort
+
+        # Make a couple of fake episodes, 2 groups for the same show so the folder has to be renamed
+        self.episodes = ['[SubsPlease] Vinland Saga - 01 (1080p).mkv',
+                         '[SubsPlease] Vinland Saga - 02 (1080p).mkv',
+                         '[Erai-raws] Vinland Saga - 03 [1080p].mkv',
+                         '[Erai-raws] Enen no Shouboutai - Ni no Shou - 05 [1080p].mkv']
+        for episode in self.episodes:
+            with open(os.path.join(self.dir, episode), 'wb') as episode_file:
+                episode_file.write(os.urandom(1024))
+
+    def check_sorted(self):
+        expected = {'[Multiple groups] Vinland Saga': self.episodes[:3],
+                    '[Erai-raws] Enen no Shouboutai - Ni no Shou': self.episodes[3:]}
+        for folder, episodes in expected.items():
+            self.assertEqual(sorted(os.listdir(os.path.join(self.sort_dir, folder))), sorted(episodes))
+            self.assertEqual(sorted(os.listdir(os.path.join(self.backup_dir, folder))), sorted(episodes))
+        # The lock file that other runs use is the only thing next to the show folders
+        self.assertEqual(sorted(os.listdir(self.sort_dir)), sorted([locks.LOCK_NAME] + list(expected)))
+        for episode in self.episodes:
+            self.assertFalse(os.path.exists(os.path.join(self.dir, episode)))
+
+    def test_sort_one_worker(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, workers=1)
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        self.check_sorted()
+
+    def test_sort_metrics(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir,
+                       metrics_json=os.path.join(self.dir, 'metrics.json'))
+        app.sort()
+        data = app.metrics.to_dict()
+        self.assertEqual(data['counters']['files_moved'], 4)
+        self.assertEqual(data['counters']['bytes_moved'], 4 * 1024)
+        self.assertEqual(data['counters']['backups_made'], 4)
+        self.assertEqual(data['counters']['folders_renamed'], 1)
+        self.assertEqual(data['phases']['parse']['calls'], 4)
+        for phase in ('plan', 'transfers', 'mkdir', 'rename', 'move', 'copy'):
+            self.assertIn(phase, data['phases'])
+        self.assertEqual(data['errors'], {})
+
+        app.export_metrics()
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'metrics.json')))
+
+    def test_sort_media_types(self):
+        # mp4 files get sorted as well, files without an extension or a video container are left alone
+        extra = ['[SubsPlease] Dr. Stone - 01 (1080p).mp4', 'README', '[SubsPlease] Dr. Stone - 02 (1080p).mkv']
+        for item in extra:
+            with open(os.path.join(self.dir, item), 'wb') as extra_file:
+                extra_file.write(b'\x00\x00\x00\x18ftypmp42' if item.endswith('.mp4') else b'no video')
+
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, sniff_media=True)
+        app.load_anime_dict()
+        plan = app.plan_items(os.listdir(self.dir))
+        moved = sorted(os.path.basename(operation['src']) for operation in plan.operations if operation['op'] == 'move')
+        # The fake episodes of setUp are random bytes, so with sniffing only the real mp4 is left
+        self.assertEqual(moved, [extra[0]])
+
+    def test_sort_matches_shows(self):
+        # The same show written differently by another group ends up in the existing folder
+        with open(os.path.join(self.dir, '[Judas] VINLAND SAGA - 05 [1080p].mkv'), 'wb') as episode_file:
+            episode_file.write(os.urandom(1024))
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        self.assertEqual(app.metrics.to_dict()['counters']['shows_matched'], 1)
+        self.assertIn('[Judas] VINLAND SAGA - 05 [1080p].mkv',
+                      os.listdir(os.path.join(self.sort_dir, '[Multiple groups] Vinland Saga')))
+
+    def test_dedupe(self):
+        # The same episode by a second group, only the biggest copy is kept
+        with open(os.path.join(self.dir, '[Judas] Vinland Saga - 01 [1080p].mkv'), 'wb') as episode_file:
+            episode_file.write(os.urandom(2048))
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app.sort()
+        folder = os.path.join(self.sort_dir, '[Multiple groups] Vinland Saga')
+
+        result = app.dedupe_library(dry_run=True)
+        self.assertEqual((len(result.duplicates), result.removed), (1, 0))
+        self.assertEqual(len(os.listdir(folder)), 4)
+
+        trash_dir = os.path.join(self.dir, 'trash')
+        result = app.dedupe_library(trash_dir=trash_dir)
+        self.assertEqual((result.removed, result.bytes_reclaimed), (1, 1024))
+        self.assertEqual(os.listdir(os.path.join(trash_dir, '[Multiple groups] Vinland Saga')), [self.episodes[0]])
+        self.assertEqual(app.metrics.to_dict()['counters']['bytes_reclaimed'], 1024)
+
+    def test_sort_multiple_workers(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, workers=4)
+        self.assertEqual(app.workers, 4)
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        self.check_sorted()
+
+    def test_sort_io_scheduler(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, io_scheduler=True,
+                       bandwidth_limit=100, low_priority=True)
+        self.assertIsNotNone(app.throttle)
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        self.check_sorted()
+
+    def test_sort_layout(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir,
+                       layout_template='Season {season:02d}/{name}')
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        for directory in (self.sort_dir, self.backup_dir):
+            self.assertEqual(sorted(os.listdir(os.path.join(directory, '[Multiple groups] Vinland Saga', 'Season 01'))),
+                             sorted(self.episodes[:3]))
+
+        # Back to every episode straight in the show folder, the season folders are gone afterwards
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, layout_template='{name}')
+        plan = app.relayout(dry_run=True)
+        self.assertEqual(sum(1 for operation in plan.operations if operation['op'] == 'rename'), 8)
+        app.relayout()
+        self.assertEqual(app.weak_error, False)
+        self.check_sorted()
+
+    def test_sort_catalog(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir,
+                       layout_template='Season {season:02d}/{name}')
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        shows = app.query_catalog()
+        self.assertEqual([(show['folder'], show['episodes'], show['size']) for show in shows],
+                         [('[Erai-raws] Enen no Shouboutai - Ni no Shou', 1, 1024),
+                          ('[Multiple groups] Vinland Saga', 3, 3 * 1024)])
+        self.assertEqual([show['name'] for show in app.query_catalog(group='Erai-raws')],
+                         ['Enen no Shouboutai - Ni no Shou', 'Vinland Saga'])
+
+        # The renames of the relayout are followed, in the library as well as in the backups
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, layout_template='{name}')
+        app.relayout()
+        episodes = app.query_catalog('vinland saga')
+        self.assertEqual([os.path.basename(episode['path']) for episode in episodes], self.episodes[:3])
+        for episode in episodes:
+            self.assertEqual(os.path.dirname(episode['path']),
+                             os.path.realpath(os.path.join(self.sort_dir, '[Multiple groups] Vinland Saga')))
+            self.assertTrue(os.path.exists(episode['backup_path']))
+        self.assertEqual(app.query_catalog(missing=True)[0]['missing'],
+                         [{'season': 1, 'episode': number} for number in range(1, 5)])
+
+        # Rebuilding from the library gives the same catalog
+        self.assertEqual(app.query_catalog('Vinland Saga', rebuild=True), episodes)
+
+    def test_sort_files(self):
+        with self.assertRaises(FileNotFoundError):
+            self.app.from_config()
+        self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app = self.app.from_config(log_info='False')
+        self.assertEqual(app.interactive, False)
+
+        # Only the files that were given get sorted, full paths and names in the anime directory both work
+        readme = os.path.join(self.dir, 'README.txt')
+        with open(readme, 'w') as readme_file:
+            readme_file.write('not an episode')
+        outside = os.path.join(self.sort_dir, self.episodes[3])
+        result = app.sort_files([os.path.join(self.dir, self.episodes[0]), self.episodes[2], readme, outside])
+        self.assertEqual(sorted(os.path.basename(src) for src, _ in result.moved),
+                         sorted([self.episodes[0], self.episodes[2]]))
+        self.assertEqual((result.skipped, result.failed, result.shows, result.bytes_moved),
+                         ([outside, readme], [], ['Vinland Saga'], 2 * 1024))
+        self.assertTrue(os.path.exists(os.path.join(self.dir, self.episodes[1])))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.sort_dir, '[Multiple groups] Vinland Saga'))),
+                         sorted([self.episodes[0], self.episodes[2]]))
+
+        # The async version hands the work to an executor, a program with an event loop can wait for it
+        result = asyncio.run(app.sort_files_async(self.episodes[1:2] + self.episodes[3:]))
+        self.assertEqual((len(result.moved), result.shows), (2, ['Enen no Shouboutai - Ni no Shou', 'Vinland Saga']))
+        self.assertEqual(app.weak_error, False)
+        self.check_sorted()
+
+    def test_sort_without_sort_dir(self):
+        # The show folders are next to the episodes, with the locks on the directory still has to be read only once
+        app = self.app(self.dir, 'False', 'False', None, self.backup_dir)
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        self.assertEqual(app.metrics.to_dict()['phases']['folder_walk']['calls'], 1)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir, '[Multiple groups] Vinland Saga'))),
+                         sorted(self.episodes[:3]))
+
+    def test_rename_folder(self):
+        # An episode of another group renames the folder of the show and ends up in it
+        folder = '[SubsPlease] Vinland Saga'
+        for directory in (self.sort_dir, self.backup_dir):
+            os.makedirs(os.path.join(directory, folder))
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app.load_anime_dict()
+        self.assertTrue(app.rename_folder(self.episodes[2], 'Vinland Saga', folder))
+        for directory in (self.sort_dir, self.backup_dir):
+            self.assertEqual(os.listdir(os.path.join(directory, '[Multiple groups] Vinland Saga')), [self.episodes[2]])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, self.episodes[2])))
+
+    def test_move_anime_verify(self):
+        # A single episode that is moved right away gets its backup hashed as well
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, verify_backups=True)
+        app.create_folder('[SubsPlease] Vinland Saga')
+        app.move_anime(self.episodes[0], '[SubsPlease] Vinland Saga')
+        result = app.verify_backup_dir()
+        self.assertEqual((result.checked, result.skipped, result.mismatched), (0, 1, []))
+
+    def test_sort_space_and_progress(self):
+        # Nothing fits with a reserve this big, the episodes wait in the anime directory for the next run
+        folder = '[SubsPlease] Vinland Saga'
+        for directory in (self.sort_dir, self.backup_dir):
+            os.makedirs(os.path.join(directory, folder))
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, space_reserve=1024 ** 3)
+        app.sort()
+        self.assertEqual(app.weak_error, True)
+        self.assertEqual(app.metrics.to_dict()['counters']['episodes_deferred'], 4)
+        for episode in self.episodes:
+            self.assertTrue(os.path.exists(os.path.join(self.dir, episode)))
+        # The folders of the shows are only made or renamed once their episodes get sorted
+        self.assertEqual((sorted(os.listdir(self.sort_dir)), os.listdir(self.backup_dir)),
+                         (sorted([locks.LOCK_NAME, folder]), [folder]))
+        self.assertEqual(app.anime_dict, {'Vinland Saga': folder})
+
+        progress_file = os.path.join(self.sort_dir, 'progress.jsonl')
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, space_reserve=0,
+                       progress_file=progress_file)
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        with open(progress_file, encoding='utf-8') as records:
+            events = [json.loads(line)['event'] for line in records]
+        os.remove(progress_file)
+        self.assertEqual((events[0], events[-1], events.count('file')), ('start', 'finish', 8))
+        self.check_sorted()
+
+    def test_sort_waits_for_other_run(self):
+        # Another run is busy with Vinland Saga and makes a folder for it that this run did not see yet
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        other_run = locks.LibraryLock(self.sort_dir).shows(['Vinland Saga'])
+
+        def finish_other_run():
+            time.sleep(0.3)
+            for directory in (self.sort_dir, self.backup_dir):
+                os.makedirs(os.path.join(directory, '[Erai-raws] Vinland Saga'))
+            other_run.release()
+        thread = threading.Thread(target=finish_other_run)
+        thread.start()
+        app.sort()
+        thread.join()
+
+        # The sort planned again after the other run was done, so the episodes went into the same folder
+        self.assertEqual(app.weak_error, False)
+        self.assertEqual(app.metrics.to_dict()['counters']['lock_waits'], 1)
+        self.check_sorted()
+
+    def test_sort_uses_index(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app.sort()
+        self.assertTrue(os.path.exists(self.app.return_index_location()))
+
+        # The second run should use the stored index and still know about the renamed folder
+        with open(os.path.join(self.dir, '[SubsPlease] Vinland Saga - 04 (1080p).mkv'), 'wb') as episode_file:
+            episode_file.write(os.urandom(1024))
+        app.sort()
+        self.assertEqual(app.show_index.load(), app.anime_dict)
+        self.assertEqual(len(os.listdir(os.path.join(self.sort_dir, '[Multiple groups] Vinland Saga'))), 4)
+
+    def test_dry_run_and_apply(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        plan_path = os.path.join(self.dir, 'plan.json')
+        plan = app.dry_run(plan_out=plan_path)
+
+        # Nothing should have been touched yet
+        self.assertEqual(os.listdir(self.sort_dir), [])
+        self.assertEqual(os.listdir(self.backup_dir), [])
+        self.assertEqual(plan.total_bytes('move'), 4 * 1024)
+
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app.apply_plan(plan_path)
+        self.assertEqual(app.weak_error, False)
+        self.check_sorted()
+
+    def test_dry_run_relative_directories(self):
+        # The directories can be given relative to the working directory, like -d anime -o sorted
+        working_dir = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            app = self.app(os.curdir, 'False', 'False', 'sorted', 'backup')
+            app.dry_run(plan_out='plan.json')
+            app = self.app(os.curdir, 'False', 'False', 'sorted', 'backup')
+            app.apply_plan('plan.json')
+        finally:
+            os.chdir(working_dir)
+        self.assertEqual(app.weak_error, False)
+        self.check_sorted()
+
+    def test_resume_interrupted_sort(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app.load_anime_dict()
+        plan = app.plan_items(os.listdir(self.dir))
+        # Pretend the run died right after writing the journal
+        run = journal.Journal(journal.run_path(self.app.return_journal_location()))
+        run.begin(plan)
+        run.close()
+
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        self.assertEqual(journal.find_journals(self.app.return_journal_location()), [])
+        self.check_sorted()
+
+    def test_resume_relative_directories(self):
+        # The run that died was given its directories relative to the working directory
+        working_dir = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            app = self.app(os.curdir, 'False', 'False', 'sorted', 'backup')
+            app.load_anime_dict()
+            plan = app.plan_items(os.listdir(os.curdir))
+            run = journal.Journal(journal.run_path(self.app.return_journal_location()))
+            run.begin(plan)
+            run.close()
+        finally:
+            os.chdir(working_dir)
+
+        # The next run is started from somewhere else, with a config of its own
+        os.remove(self.app.return_ini_location())
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        self.assertEqual(journal.find_journals(self.app.return_journal_location()), [])
+        self.check_sorted()
+
+    def test_journal_of_other_process(self):
+        # Another process is in the middle of sorting Vinland Saga, its journal is left alone while it runs
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        code = ("import sys; from NyaaSort.NyaaSort import NyaaSort; from NyaaSort import journal; "
+                "app = NyaaSort(sys.argv[1], 'False', 'False', sys.argv[2], sys.argv[3]); app.load_anime_dict(); "
+                "run = journal.Journal(journal.run_path(app.journal_location())); "
+                "run.begin(app.plan_items(sys.argv[4:])); print('started', flush=True); sys.stdin.readline()")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+        process = subprocess.Popen([sys.executable, '-c', code, self.dir, self.sort_dir, self.backup_dir]
+                                   + self.episodes[:3], cwd=root, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   text=True)
+        try:
+            for line in process.stdout:
+                if line.strip() == 'started':
+                    break
+            result = app.sort_files(self.episodes[3:])
+            self.assertEqual((result.shows, app.weak_error), (['Enen no Shouboutai - Ni no Shou'], False))
+            self.assertTrue(all(os.path.exists(os.path.join(self.dir, episode)) for episode in self.episodes[:3]))
+            self.assertEqual(len(journal.find_journals(app.journal_location())), 1)
+        finally:
+            process.kill()
+            process.wait()
+
+        # Once the process is gone the next run finishes its plan
+        app.sort()
+        self.assertEqual(app.weak_error, False)
+        self.assertEqual(journal.find_journals(app.journal_location()), [])
+        self.check_sorted()
+
+    def test_journal_write_fails(self):
+        # A journal that can not be written anymore is dropped, the sort goes on without it
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        app.load_anime_dict()
+        plan = app.plan_items(os.listdir(self.dir))
+        app.journal = journal.Journal(journal.run_path(self.app.return_journal_location()))
+        app.journal.begin(plan)
+        app.journal.file.close()
+        self.assertTrue(app.run_operation(plan.operations[0]))
+        self.assertEqual((app.journal, app.metrics.to_dict()['errors']), (None, {'journal': 1}))
+        app.finish_journal()
+
+    def test_sort_verify(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir, verify_backups=True)
+        app.sort()
+        self.check_sorted()
+        result = app.verify_backup_dir()
+        self.assertEqual((result.checked, result.skipped, result.mismatched), (0, 4, []))
+
+    def test_sort_profiles(self):
+        app = self.app(self.dir, 'False', 'False', self.sort_dir, self.backup_dir)
+        # A second download folder with its own library and no backups
+        other_dir = os.path.join(self.dir, 'other')
+        other_sort_dir = os.path.join(self.dir, 'other_sorted')
+        os.makedirs(other_dir)
+        os.makedirs(other_sort_dir)
+        shutil.move(os.path.join(self.dir, self.episodes[3]), other_dir)
+
+        app.config['SORT:main'] = {'DIRECTORY': self.dir, 'SORTED_DIRECTORY': self.sort_dir,
+                                   'BACKUP_PATH': self.backup_dir}
+        app.config['SORT:other'] = {'DIRECTORY': other_dir, 'SORTED_DIRECTORY': other_sort_dir,
+                                    'BACKUP_PATH': 'None', 'WORKERS': '2'}
+        # A profile that is missing its directories is skipped, the others still get sorted
+        app.config['SORT:broken'] = {'DIRECTORY': self.dir}
+        with open(self.app.return_ini_location(), 'w') as config_file:
+            app.config.write(config_file)
+
+        sorters = self.app.sort_profiles(log_info='False')
+        self.assertEqual(list(sorters), ['main', 'other'])
+        self.assertEqual((sorters['main'].workers, sorters['other'].workers), (1, 2))
+        self.assertEqual(os.listdir(os.path.join(other_sort_dir, '[Erai-raws] Enen no Shouboutai - Ni no Shou')),
+                         [self.episodes[3]])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.sort_dir, '[Multiple groups] Vinland Saga'))),
+                         sorted(self.episodes[:3]))
+        for sorter in sorters.values():
+            self.assertEqual(sorter.weak_error, False)
+            self.assertEqual(journal.find_journals(sorter.journal_location()), [])
+
+        # Both libraries end up in the same index file
+        index = sorters['main'].show_index.read_file()
+        self.assertEqual(sorted(index['libraries']), sorted(os.path.realpath(path)
+                                                            for path in (self.sort_dir, other_sort_dir)))
+
+        with self.assertRaises(ValueError):
+            self.app.sort_profiles(['missing'], log_info='False')
+
+    def tearDown(self):
+        # Remove the test dir
+        shutil.rmtree(self.dir)
+        # Remove the SortConfig.ini
+        os.remove(self.app.return_ini_location())
+        # Remove the show index if the sort created one
+        if os.path.exists(self.app.return_index_location()):
+            os.remove(self.app.return_index_location())
+        # Journals a test left behind
+        for journal_path in journal.find_journals(self.app.return_journal_location()):
+            os.remove(journal_path)
+        # And the catalog with its write ahead log
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.app.return_catalog_location() + suffix):
+                os.remove(self.app.return_catalog_location() + suffix)
+
+
+if __name__ == '__main__':
+    unittest.main()
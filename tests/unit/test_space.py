@@ -0,0 +1,47 @@
+import unittest
+import os
+import shutil
+import tempfile
+from NyaaSort import space
+
+
+class FakeFileOps:
+
+    def __init__(self, backup_method='copy', move_same_device=False):
+        self.backup_method = backup_method
+        self.move_same_device = move_same_device
+
+
+class TestSpace(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.free = shutil.disk_usage(self.dir).free
+
+    def job(self, name, size):
+        src = os.path.join(self.dir, name)
+        # The show folder does not exist yet, the free space of the library is used
+        return [{'op': 'copy', 'src': src, 'dst': os.path.join(self.dir, 'backup', 'Show', name), 'size': size},
+                {'op': 'move', 'src': src, 'dst': os.path.join(self.dir, 'sorted', 'Show', name), 'size': size}]
+
+    def test_admit(self):
+        big = self.job('big.mkv', self.free)
+        small = self.job('small.mkv', 1024)
+        admitted, rejected = space.admit([big, small], FakeFileOps(), 0)
+        # The copy and the move both write to the same disk, so the big one does not fit but the small one still goes
+        self.assertEqual((admitted, rejected), ([small], [big]))
+
+        # Everything is rejected once the reserve is more than the disk has free
+        self.assertEqual(space.admit([small], FakeFileOps(), self.free), ([], [small]))
+
+    def test_nothing_written(self):
+        # Hardlinks and moves on the same disk do not need any space
+        jobs = [self.job('big.mkv', 10 * self.free)]
+        self.assertEqual(space.admit(jobs, FakeFileOps('hardlink', True), self.free), (jobs, []))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from NyaaSort.NyaaSort import NyaaSort, strtobool
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        # The icon and network modules should only be imported when the icons are made
+        code = ("import sys, NyaaSort.NyaaSort; "
+                "print(sorted(name for name in sys.modules if name.split('.')[0] in "
+                "('bs4', 'PIL', 'distutils', 'http', 'subprocess', 'ctypes', 'sqlite3')))")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_strtobool(self):
+        self.assertTrue(strtobool('Yes'))
+        self.assertFalse(strtobool('off'))
+        with self.assertRaises(ValueError):
+            strtobool('maybe')
+
+    def test_bootstrap_from_environment(self):
+        # The config gets written next to the script, so a copy of the script in its own directory is used
+        base_dir = tempfile.mkdtemp()
+        try:
+            package_dir = os.path.dirname(os.path.realpath(NyaaSort.return_ini_location()))
+            shutil.copytree(package_dir, os.path.join(base_dir, 'package'),
+                            ignore=shutil.ignore_patterns('__pycache__', '*.ini', '*.json', '*.jsonl', '*.sqlite3*'))
+            os.makedirs(os.path.join(base_dir, 'sorted'))
+            env = dict(os.environ, NYAASORT_DIRECTORY=base_dir,
+                       NYAASORT_SORTED_DIRECTORY=os.path.join(base_dir, 'sorted'), NYAASORT_BACKUP_PATH='',
+                       NYAASORT_WORKERS='3', NYAASORT_LOGGING='False',
+                       NYAASORT_MATCH_THRESHOLD='not a number', NYAASORT_LOCKING='False')
+            # Nothing is given and nobody can be asked, so everything has to come from the environment
+            code = ("import json, NyaaSort; app = NyaaSort.NyaaSort(None, interactive=False); "
+                    "print(json.dumps([app.dir_path, app.sort_dir, app.backup_dir, app.workers, app.match_threshold, "
+                    "app.locking, app.config.get('SORT', 'WORKERS')]))")
+            result = subprocess.run([sys.executable, '-c', code], cwd=os.path.join(base_dir, 'package'), env=env,
+                                    capture_output=True, text=True, check=True)
+            # A value that can not be read is ignored, the others are still used
+            self.assertEqual(json.loads(result.stdout.splitlines()[-1]),
+                             [base_dir, os.path.join(base_dir, 'sorted'), None, 3, 0.8, False, '3'])
+            self.assertTrue(os.path.exists(os.path.join(base_dir, 'package', 'SortConfig.ini')))
+        finally:
+            shutil.rmtree(base_dir)
+
+if __name__ == '__main__':
+    unittest.main()
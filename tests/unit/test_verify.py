@@ -0,0 +1,66 @@
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+from NyaaSort import verify
+
+
+class TestVerify(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.backup_dir = os.path.join(self.dir, 'backup')
+        os.makedirs(os.path.join(self.backup_dir, '[Judas] Vinland Saga'))
+        self.src = os.path.join(self.dir, '[Judas] Vinland Saga - 01.mkv')
+        self.data = os.urandom(verify.CHUNK_SIZE + 123)
+        with open(self.src, 'wb') as src_file:
+            src_file.write(self.data)
+        self.dst = os.path.join(self.backup_dir, '[Judas] Vinland Saga', '[Judas] Vinland Saga - 01.mkv')
+        self.logger = logging.getLogger('NyaaSort Logger')
+
+    def test_hashing_copy(self):
+        digest = verify.hashing_copy(self.src, self.dst)
+        with open(self.dst, 'rb') as dst_file:
+            self.assertEqual(dst_file.read(), self.data)
+        self.assertEqual(digest, verify.hash_file(self.src))
+
+    def test_verify_tree(self):
+        cache = verify.HashCache(self.backup_dir)
+        cache.record(self.dst, verify.hashing_copy(self.src, self.dst))
+        cache.save()
+        # The temporary file the cache was saved through is gone
+        self.assertEqual(sorted(os.listdir(self.backup_dir)), [verify.HASH_CACHE_NAME, '[Judas] Vinland Saga'])
+
+        # Nothing changed, so nothing has to be read again
+        cache = verify.HashCache(self.backup_dir)
+        result = verify.verify_tree(self.backup_dir, cache, 2, self.logger)
+        self.assertEqual((result.checked, result.skipped, result.mismatched), (0, 1, []))
+
+        # Flip a byte, the size stays the same but the modification time changes
+        with open(self.dst, 'r+b') as dst_file:
+            dst_file.seek(10)
+            dst_file.write(bytes([self.data[10] ^ 0xFF]))
+        os.utime(self.dst, ns=(0, os.stat(self.dst).st_mtime_ns + 1000))
+        result = verify.verify_tree(self.backup_dir, cache, 2, self.logger)
+        self.assertEqual((result.checked, result.mismatched), (1, [self.dst]))
+
+    def test_rename_and_missing(self):
+        cache = verify.HashCache(self.backup_dir)
+        cache.record(self.dst, verify.hashing_copy(self.src, self.dst))
+        new_folder = os.path.join(self.backup_dir, '[Multiple groups] Vinland Saga')
+        os.rename(os.path.dirname(self.dst), new_folder)
+        cache.rename(os.path.dirname(self.dst), new_folder)
+        result = verify.verify_tree(self.backup_dir, cache, 2, self.logger)
+        self.assertEqual((result.checked, result.missing), (0, []))
+
+        os.remove(os.path.join(new_folder, os.path.basename(self.dst)))
+        result = verify.verify_tree(self.backup_dir, cache, 2, self.logger)
+        self.assertEqual(result.missing, ['[Multiple groups] Vinland Saga/[Judas] Vinland Saga - 01.mkv'])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+from sys import platform
+from NyaaSort import watcher
+
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, 'already there.mkv'), 'wb') as old_file:
+            old_file.write(b'old')
+
+    def write_episode(self, name):
+        with open(os.path.join(self.dir, name), 'wb') as episode_file:
+            episode_file.write(os.urandom(1024))
+
+    def test_polling(self):
+        polling = watcher.PollingWatcher(self.dir, 0.01)
+        self.write_episode('[SubsPlease] Vinland Saga - 01 (1080p).mkv')
+        self.write_episode('[SubsPlease] Vinland Saga - 02 (1080p).mkv')
+        self.assertEqual(polling.next_batch(0.05), ['[SubsPlease] Vinland Saga - 01 (1080p).mkv',
+                                                    '[SubsPlease] Vinland Saga - 02 (1080p).mkv'])
+        # Nothing new, so waiting should not return anything
+        self.assertEqual(polling.wait(0.05), [])
+
+    def test_polling_waits_for_stable_size(self):
+        polling = watcher.PollingWatcher(self.dir, 0.01)
+        self.write_episode('growing.mkv')
+        self.assertEqual(polling.poll(), [])
+        with open(os.path.join(self.dir, 'growing.mkv'), 'ab') as episode_file:
+            episode_file.write(b'more data')
+        self.assertEqual(polling.poll(), [])
+        self.assertEqual(polling.poll(), ['growing.mkv'])
+
+    @unittest.skipUnless(platform.startswith('linux'), "inotify only exists on linux")
+    def test_inotify(self):
+        inotify = watcher.InotifyWatcher(self.dir)
+        try:
+            self.write_episode('[SubsPlease] Vinland Saga - 01 (1080p).mkv')
+            self.assertEqual(inotify.next_batch(0.05), ['[SubsPlease] Vinland Saga - 01 (1080p).mkv'])
+            self.assertEqual(inotify.wait(0.05), [])
+        finally:
+            inotify.close()
+
+    def test_create_watcher(self):
+        created = watcher.create_watcher(self.dir, 1, logging.getLogger('NyaaSort Logger'))
+        self.assertIsInstance(created, watcher.Watcher)
+        created.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()